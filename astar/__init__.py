@@ -2,7 +2,7 @@
 """ generic A-Star path searching algorithm """
 
 from abc import ABCMeta, abstractmethod
-from heapq import heappush, heappop, heapify
+from heapq import heappush, heappop
 
 __author__ = "Julien Rialland"
 __copyright__ = "Copyright 2012-2017, J.Rialland"
@@ -23,14 +23,13 @@ class AStar:
 
     class SearchNode:
         __slots__ = ('data', 'gscore', 'fscore',
-                     'closed', 'came_from', 'out_openset')
+                     'closed', 'came_from')
 
         def __init__(self, data, gscore=Infinite, fscore=Infinite):
             self.data = data
             self.gscore = gscore
             self.fscore = fscore
             self.closed = False
-            self.out_openset = True
             self.came_from = None
 
         def __lt__(self, b):
@@ -75,19 +74,26 @@ class AStar:
         else:
             return reversed(list(_gen()))
 
-    def astar(self, start, goal, reversePath=False):
+    def astar(self, start, goal, reversePath=False, weight=1.0):
+        """Searches a path from start to goal, returns it (an iterable of nodes) or None if there is no path.
+           The open set is a heap with lazy deletion: when a node's gscore improves it is pushed again, and its stale
+           entries are skipped when popped. Ties of fscore are broken in favor of the larger gscore.
+           weight > 1 gives a weighted A* (fscore = gscore + weight * heuristic), which usually expands far fewer
+           nodes and finds a path at most `weight` times longer than the shortest one (for an admissible heuristic)."""
         if self.is_goal_reached(start, goal):
             return [start]
         searchNodes = AStar.SearchNodeDict()
         startNode = searchNodes[start] = AStar.SearchNode(
-            start, gscore=.0, fscore=self.heuristic_cost_estimate(start, goal))
-        openSet = []
-        heappush(openSet, startNode)
+            start, gscore=.0, fscore=weight * self.heuristic_cost_estimate(start, goal))
+        # entries are (fscore, -gscore, insertion order, node), the insertion order keeps the nodes from being compared
+        counter = 0
+        openSet = [(startNode.fscore, -startNode.gscore, counter, startNode)]
         while openSet:
-            current = heappop(openSet)
+            _, gscore, _, current = heappop(openSet)
+            if current.closed or -gscore > current.gscore:
+                continue  # a stale entry of an already expanded or improved node
             if self.is_goal_reached(current.data, goal):
                 return self.reconstruct_path(current, reversePath)
-            current.out_openset = True
             current.closed = True
             for neighbor in map(lambda n: searchNodes[n], self.neighbors(current.data)):
                 if neighbor.closed:
@@ -99,18 +105,14 @@ class AStar:
                 neighbor.came_from = current
                 neighbor.gscore = tentative_gscore
                 neighbor.fscore = tentative_gscore + \
-                                  self.heuristic_cost_estimate(neighbor.data, goal)
-                if neighbor.out_openset:
-                    neighbor.out_openset = False
-                    heappush(openSet, neighbor)
-                else:
-                    # re-add the node in order to re-sort the heap
-                    openSet.remove(neighbor)
-                    heappush(openSet, neighbor)
+                                  weight * self.heuristic_cost_estimate(neighbor.data, goal)
+                counter += 1
+                heappush(openSet, (neighbor.fscore, -tentative_gscore, counter, neighbor))
         return None
 
 
-def find_path(start, goal, neighbors_fnct, reversePath=False, heuristic_cost_estimate_fnct=lambda a, b: Infinite, distance_between_fnct=lambda a, b: 1.0, is_goal_reached_fnct=lambda a, b: a == b):
+def find_path(start, goal, neighbors_fnct, reversePath=False, heuristic_cost_estimate_fnct=lambda a, b: Infinite,
+              distance_between_fnct=lambda a, b: 1.0, is_goal_reached_fnct=lambda a, b: a == b, weight=1.0):
     """A non-class version of the path finding algorithm"""
     class FindPath(AStar):
 
@@ -125,7 +127,7 @@ def find_path(start, goal, neighbors_fnct, reversePath=False, heuristic_cost_est
 
         def is_goal_reached(self, current, goal):
             return is_goal_reached_fnct(current, goal)
-    return FindPath().astar(start, goal, reversePath)
+    return FindPath().astar(start, goal, reversePath, weight)
 
 
 __all__ = ['AStar', 'find_path']
\ No newline at end of file
@@ -1,27 +1,145 @@
 import socket
-from time import sleep
+import struct
+import time
 import json
 
 msgFromClient = "Hello UDP Server"
 
-bytesToSend = str.encode(msgFromClient)
-
 serverAddressPort = ("132.68.36.158", 20001)
 
 bufferSize = 32768
 
-# Create a UDP socket at client side
+# the server pushes data to subscribed clients, a client stays subscribed while it sends heartbeats
+# (any message, see src/udp_server.py) - more often than the server's subscriber timeout (5 seconds by default)
+heartbeatInterval = 1.0
+unsubscribeMessage = "bye"
+
+# a client that detects a lost message requests a keyframe (which holds all the robots) with this message,
+# at most once every keyframeRequestInterval seconds
+keyframeRequestMessage = "keyframe"
+keyframeRequestInterval = 0.1
+
+# Binary telemetry format of the server (see src/telemetry.py), all little-endian
+# header: magic, format version, flags, sequence number, frame number, frame timestamp (seconds), number of records
+HEADER = struct.Struct('<4sBBIIdH')
+MAGIC = b'CRLT'
+KEYFRAME = 0x01
+# record per robot: body id, position (x, y, z) and rotation quaternion (x, y, z, w)
+RECORD = struct.Struct('<I3f4f')
+# sequence numbers of the messages start from 1 and skip 0 when wrapping around
+SEQUENCE_MODULO = 0xFFFFFFFF
+
+
+def decode_binary(data):
+    """
+    Decodes a message in the binary telemetry format.
+    Returns {"sequence", "frame_number", "timestamp", "keyframe", "bodies"}, bodies in the same format as the json
+    messages: a list of {"body_id", "position": {"x", "y", "z"}, "rotation": {"w", "x", "y", "z"}} sorted by id
+    """
+    magic, version, flags, sequence, frame_number, timestamp, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary telemetry message")
+    bodies = []
+    for body_id, x, y, z, qx, qy, qz, qw in RECORD.iter_unpack(data[HEADER.size:HEADER.size + count * RECORD.size]):
+        bodies.append({"body_id": body_id,
+                       "position": {"x": x, "y": y, "z": z},
+                       "rotation": {"w": qw, "x": qx, "y": qy, "z": qz}})
+    return {"sequence": sequence or None, "frame_number": frame_number, "timestamp": timestamp,
+            "keyframe": bool(flags & KEYFRAME), "bodies": bodies}
+
+
+def decode_message(data):
+    """
+    Decodes a message from the server in either format.
+    Returns {"sequence", "keyframe", "bodies", ...}, the sequence is None for messages that are not numbered
+    (which always hold all the robots)
+    """
+    if data[:len(MAGIC)] == MAGIC:
+        return decode_binary(data)
+    message = json.loads(bytes.decode(data))
+    if isinstance(message, list):
+        return {"sequence": None, "keyframe": True, "bodies": message}
+    return message
+
+
+class RobotsState:
+    """
+    The robots' state, assembled from the keyframes and deltas that the server sends.
+    A gap in the sequence numbers means messages were lost: the state may be stale until the next keyframe,
+    which the client should request (see 'needs_keyframe')
+    """
+
+    def __init__(self):
+        self.bodies = {}  # maps a body id to its latest body
+        self.sequence = None  # of the last message applied
+        self.needs_keyframe = True
+        self.lost = 0  # number of messages lost so far
+
+    def apply(self, message):
+        """
+        Applies a decoded message (see 'decode_message') to the state.
+        Returns False if it was ignored since it is older than the last message
+        """
+        sequence = message.get("sequence")
+        if sequence is not None and self.sequence is not None:
+            gap = (sequence - (self.sequence % SEQUENCE_MODULO + 1)) % SEQUENCE_MODULO
+            if gap >= SEQUENCE_MODULO // 2:
+                return False  # reordered or duplicated
+            if gap > 0:
+                self.lost += gap
+                self.needs_keyframe = True
+        self.sequence = sequence
+
+        if message["keyframe"]:
+            self.bodies = {}
+            self.needs_keyframe = False
+        for body in message["bodies"]:
+            self.bodies[body["body_id"]] = body
+        return True
+
+    def get_bodies(self):
+        """
+        Returns the list of bodies sorted by id, like the messages that hold all the robots
+        """
+        return [self.bodies[body_id] for body_id in sorted(self.bodies)]
 
-UDPClientSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
 
-# Send to server using created UDP socket
-while True:
-    UDPClientSocket.sendto(bytesToSend, serverAddressPort)
+def receive_messages(client_socket, server_address, heartbeat_interval=heartbeatInterval, state=None):
+    """
+    Subscribes to the server and yields the robots' state (list of bodies) after every message it pushes,
+    sending heartbeats to stay subscribed, and keyframe requests when messages were lost.
+    Unsubscribes when the generator is closed.
+    state: the RobotsState to assemble the messages into (for its loss statistics)
+    """
+    state = state if state is not None else RobotsState()
+    client_socket.settimeout(heartbeat_interval)
+    last_heartbeat = None
+    last_keyframe_request = None
+    try:
+        while True:
+            now = time.monotonic()
+            if state.needs_keyframe and state.sequence is not None and \
+                    (last_keyframe_request is None or now - last_keyframe_request >= keyframeRequestInterval):
+                # a keyframe request is a heartbeat as well
+                client_socket.sendto(str.encode(keyframeRequestMessage), server_address)
+                last_heartbeat = last_keyframe_request = now
+            elif last_heartbeat is None or now - last_heartbeat >= heartbeat_interval:
+                client_socket.sendto(str.encode(msgFromClient), server_address)
+                last_heartbeat = now
+            try:
+                data = client_socket.recv(bufferSize)
+            except socket.timeout:
+                continue
+            if state.apply(decode_message(data)):
+                yield state.get_bodies()
+    finally:
+        client_socket.sendto(str.encode(unsubscribeMessage), server_address)
 
-    msgFromServer = UDPClientSocket.recv(bufferSize)
 
-    msg = "Message from Server {}".format(msgFromServer[0])
-    marker_sets = json.loads(bytes.decode(msgFromServer))
+if __name__ == '__main__':
+    # Create a UDP socket at client side
+    UDPClientSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
 
-    print(marker_sets)
-    sleep(1)
\ No newline at end of file
+    # Subscribe to the server, which pushes every new message
+    for marker_sets in receive_messages(UDPClientSocket, serverAddressPort):
+        print(marker_sets)
@@ -1,5 +1,4 @@
 import sys
-import time
 import json
 import argparse
 import pygame
@@ -13,6 +12,8 @@ from src.globals import SCREENSIZE, LEFT_SCREEN_ALIGNMENT, BUTTON_BASE_FONT_SIZE
     BASE_HEIGHT, HEIGHT
 
 from src.udp_server import UDPServer
+from src.pipeline import StateThread, Broadcaster
+from src.telemetry import encode_binary, DeltaEncoder
 from src.Listener import Listener, ListenerType
 from src.planner_controller import PlannerController
 
@@ -46,28 +47,52 @@ def get_robots_state_to_send(robots_bodies):
     return sorted_tosend
 
 
-def check_events(buttons, grid):
+def get_message_to_send(snapshot):
     """
-    Checks for events on the screen
+    Args:
+        snapshot: a FrameSnapshot of the listener
+
+    Returns: the message to broadcast for the given frame, encoded as json
+    """
+    # the filter here is based on a convention -
+    # all rigid bodies which represent robots have sequential ids starting from 101
+    robots_bodies = [body for body in snapshot.bodies if int(body.body_id) // 100 == 1]
+
+    # the transmitted message includes (in this order):
+    #   - robots positions
+    #   - solutions path (if exists, i.e., the planner was executed)
+    # we need the additional data (beside the robots) for the arena visualization tool.
+    return json.dumps(get_robots_state_to_send(robots_bodies))
+
+
+def check_events(buttons, planner_controller):
     """
+    Checks for events on the screen.
+    Actions of buttons are submitted to the planner controller, to run on the thread that maintains the grid.
+    """
+    grid = planner_controller.grid
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             pygame.quit()
             sys.exit()
 
+        # the running planner is cancelled with the Escape key
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            planner_controller.submit(planner_controller.cancel_planner)
+
         # checks if a mouse is clicked
         if event.type == pygame.MOUSEBUTTONDOWN:
             # if the mouse is clicked on a - capture which one and activate relevant function
             if buttons["random_scene"].is_hover():
-                grid.init_random_scene()
+                planner_controller.submit(grid.init_random_scene)
             elif buttons["goals_from_scene"].is_hover():
-                grid.init_goals_from_scene()
+                planner_controller.submit(grid.init_goals_from_scene)
             elif buttons["goals_from_file"].is_hover():
-                grid.init_goals_from_file()
+                planner_controller.submit(grid.init_goals_from_file)
             elif buttons["run_planner"].is_hover():
-                grid.run_planner()
+                planner_controller.submit(grid.run_planner)
             elif buttons["broadcast"].is_hover():
-                grid.broadcast_solution()
+                planner_controller.submit(grid.broadcast_solution)
 
 
 def set_buttons(surface, grid_bottom_left):
@@ -134,7 +159,10 @@ def main():
     # Create a udp server for transmitting the data
     # It'll only be activated later if user pressed the relevant button on screen
     # Remove for tests of path planning side outside of the lab
-    server = UDPServer()
+    # with --delta, only the robots that moved are sent, and subscribing clients get a keyframe of all of them
+    delta_encoder = DeltaEncoder(binary=ap.format == "binary") if ap.delta else None
+    server = UDPServer(multicast_group=ap.multicast, quiet=ap.quiet,
+                       on_keyframe_request=delta_encoder.request_keyframe if delta_encoder is not None else None)
 
     ########################################
     # Mockup listener for offline tests
@@ -153,29 +181,35 @@ def main():
     pygame.display.set_icon(crl_icon)
     surface = pygame.display.set_mode(SCREENSIZE)
 
-    # flag for transmitting solution data. being set to True if 'broadcast solution data' button is pressed.
-    broadcast_solution_active = False
-
     # initialize a planner: sets up grid object, updates it and allows to run solution planning
     planner_controller = PlannerController(arguments_parser=ap, listener=listener, surface=surface)
     # set buttons to draw on the screen (to add buttons - modify this method)
     buttons = set_buttons(surface, grid_bottom_left=planner_controller.grid.bottomleft)
 
-    # Main pyGame loop
+    # the grid is maintained from the listener's frames on its own thread,
+    # so neither drawing the screen nor running the planner delays it
+    state_thread = StateThread(planner_controller, listener.snapshots)
+    state_thread.start()
+    # transmits the solution data, started when the user presses the 'broadcast solution data' button
+    broadcaster = None
+    clock = pygame.time.Clock()
+
+    # Main pyGame loop - draws the latest view of the grid at its own rate
     while True:
-        check_events(buttons, planner_controller.grid)
+        check_events(buttons, planner_controller)
 
-        # this call takes care of setting every grid-related thing that is being drawn to screen and draw it
-        planner_controller.set_grid()
+        generation, view = planner_controller.views.get()
+        dirty_rects = planner_controller.grid.render(view) if view is not None else []
 
-        # draw buttons
+        # draw buttons (again if the whole screen was redrawn)
         for button_name, button in buttons.items():
-            button.show()
+            dirty_rects += button.show(force=planner_controller.grid.full_redraw)
 
-        pygame.display.update()
+        # only the parts of the screen that changed are updated
+        pygame.display.update(dirty_rects)
 
         # if the user presses "Broadcast solution data" button it'll initate the UDP server and start transmitting
-        if planner_controller.grid.broadcast_solution_init:
+        if planner_controller.grid.broadcast_solution_init and broadcaster is None:
             # set to False so it won't start new server each cycle
             planner_controller.grid.broadcast_solution_init = False
 
@@ -183,24 +217,16 @@ def main():
             # we use this data to guide the robot (from the Ubuntu computer) and for visualization tools.
             server.start()
             print("UDP server initiated, waiting 2 seconds for the system to stabilized...")
-            time.sleep(2)
-
-            broadcast_solution_active = True
-
-        # if broadcast has been activated, it'll send the data in each cycle
-        if broadcast_solution_active:
-            # the filter here is based on a convention -
-            # all rigid bodies which represent robots have sequential ids starting from 101
-            robots_bodies = [body for body in listener.bodies if int(body.body_id) // 100 == 1]
-
-            # the transmitted message includes (in this order):
-            #   - robots positions
-            #   - solutions path (if exists, i.e., the planner was executed)
-            # we need the additional data (beside the robots) for the arena visualization tool.
-            message = get_robots_state_to_send(robots_bodies)
-            server.update_data(json.dumps(message))
-            server.send_data()
-            time.sleep(0.1)
+
+            # sends the latest frame at a fixed rate, independently of drawing and planning
+            if delta_encoder is not None:
+                encode = delta_encoder.encode
+            else:
+                encode = encode_binary if ap.format == "binary" else get_message_to_send
+            broadcaster = Broadcaster(server, listener.snapshots, encode=encode, rate=ap.rate, delay=2.0)
+            broadcaster.start()
+
+        clock.tick(ap.fps)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
-__all__ = ['MotionClient', 'MotionListener', 'Version', 'Position', 'Rotation', 'RigidBody', 'LabeledMarker',
-           'Skeleton', 'MarkerSet', 'TimeInfo']
+__all__ = ['MotionClient', 'AsyncMotionClient', 'MotionListener', 'FrameSection', 'Version', 'Position', 'Rotation',
+           'RigidBody', 'LabeledMarker', 'Skeleton', 'MarkerSet', 'TimeInfo']
 
 
 from .protocol import Version, Position, Rotation, RigidBody, LabeledMarker, Skeleton, MarkerSet, TimeInfo
 from .motion_client import MotionClient
-from .adapter import MotionListener
+from .async_client import AsyncMotionClient
+from .adapter import MotionListener, FrameSection
@@ -1,7 +1,9 @@
 ﻿import struct
 import traceback
 
-from natnet.protocol import Protocol, UIntValue, ShortValue, UShortValue
+from enum import IntEnum
+
+from natnet.protocol import Protocol, OffsetProtocol, UIntValue, ShortValue, UShortValue
 
 # Client/server message ids
 NAT_PING = 0
@@ -22,7 +24,34 @@ TYPE_RIGID_BODY = 1
 TYPE_SKELETON = 2
 
 
+class FrameSection(IntEnum):
+    """
+    Sections of a frame of data that are delivered to listeners
+    """
+    MarkerSets = 0
+    UnlabeledMarkers = 1
+    RigidBodies = 2
+    Skeletons = 3
+    LabeledMarkers = 4
+
+
+ALL_SECTIONS = frozenset(FrameSection)
+
+# Per-frame listener callbacks, in the order they are invoked
+SECTION_CALLBACKS = [
+    (FrameSection.RigidBodies, 'on_rigid_body'),
+    (FrameSection.Skeletons, 'on_skeletons'),
+    (FrameSection.LabeledMarkers, 'on_labeled_markers'),
+    (FrameSection.UnlabeledMarkers, 'on_unlabeled_markers'),
+    (FrameSection.MarkerSets, 'on_marker_sets'),
+]
+
+
 class MotionListener(object):
+    # Frame sections this listener consumes. Callbacks of other sections are not invoked for this listener,
+    # and sections that no listener of the adapter consumes are skipped over without being decoded.
+    sections = ALL_SECTIONS
+
     def on_version(self, version):
         """
         Callback for NatNet version query.
@@ -80,19 +109,67 @@ class MotionListener(object):
         """
         pass
 
+    def on_array_frame(self, frame):
+        """
+        Callback for a whole NatNet frame decoded into NumPy arrays. It is called once per frame,
+        instead of the per-section callbacks, when the adapter is created with `array_frames=True`.
+
+        Args:
+            frame (:class:`natnet.arrays.ArrayFrame`): markers, marker sets index and rigid bodies as arrays
+        """
+        pass
+
+    def on_frame_end(self, frame_number, time_info):
+        """
+        Callback invoked after all the section callbacks of a frame were invoked. It is called once per frame
+        (not for array frames, which are delivered whole). Use it to handle the sections of a frame together.
+
+        Args:
+            frame_number (int): the NatNet frame number
+            time_info (:class:`TimeInfo`): time as a TimeInfo element
+        """
+        pass
+
 
 
 
 class Adapter(object):
-    def __init__(self, listener):
+    def __init__(self, listener, offset_decoding=True, array_frames=False):
         """
         Converts NatNet payload into python elements.
 
+        Args:
+             listener (:class:`MotionListener`): a listener invoked by new data frames
+             offset_decoding (bool): decode frames with the offset-based :class:`OffsetProtocol`,
+                                     set to False to fall back to the slicing :class:`Protocol` decoder
+             array_frames (bool): decode frames into a NumPy-backed :class:`natnet.arrays.ArrayFrame`
+                                  delivered through `MotionListener.on_array_frame` (requires numpy)
+        """
+        self._listeners = [listener or MotionListener()]
+        self._offset_decoding = offset_decoding or array_frames
+        self._array_frames = array_frames
+        if array_frames:
+            # numpy is only required for array frames
+            from natnet.arrays import ArrayProtocol
+            self._protocol = ArrayProtocol()
+        else:
+            self._protocol = OffsetProtocol() if offset_decoding else Protocol()
+
+    def add_listener(self, listener):
+        """
+        Registers an additional listener for decoded frames.
+
         Args:
              listener (:class:`MotionListener`): a listener invoked by new data frames
         """
-        self._listener = listener or MotionListener()
-        self._protocol = Protocol()
+        self._listeners.append(listener)
+
+    def _subscribed_sections(self):
+        """ Returns the frame sections consumed by at least one listener. """
+        sections = set()
+        for listener in self._listeners:
+            sections.update(listener.sections)
+        return sections
 
     # Unpack data from a motion capture frame message
     def _unpack_motion_capture(self, data):
@@ -150,21 +227,79 @@ class Adapter(object):
         is_recording = (param & 0x01) != 0
         tracked_models_changed = (param & 0x02) != 0
 
-        # Send rigid body to listener
-        self._listener.on_rigid_body(rigid_bodies, time_info)
+        self._notify_frame({
+            FrameSection.MarkerSets: marker_sets,
+            FrameSection.UnlabeledMarkers: unlabeled_markers,
+            FrameSection.RigidBodies: rigid_bodies,
+            FrameSection.Skeletons: skeletons,
+            FrameSection.LabeledMarkers: labeled_markers,
+        }, time_info, frame_number)
+
+    # Unpack data from a motion capture frame message, walking the whole packet with absolute offsets
+    def _unpack_motion_capture_from(self, data, offset):
+        # sections no listener consumes are skipped over without decoding
+        sections = self._subscribed_sections()
+        decoded = {}
+
+        # Frame number
+        frame_number, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+
+        if FrameSection.MarkerSets in sections:
+            offset, decoded[FrameSection.MarkerSets] = self._protocol.unpack_marker_sets_from(data, offset)
+        else:
+            offset = self._protocol.skip_marker_sets_from(data, offset)
+
+        if FrameSection.UnlabeledMarkers in sections:
+            offset, decoded[FrameSection.UnlabeledMarkers] = self._protocol.unpack_positions_from(data, offset)
+        else:
+            offset = self._protocol.skip_positions_from(data, offset)
+
+        if FrameSection.RigidBodies in sections:
+            offset, decoded[FrameSection.RigidBodies] = self._protocol.unpack_rigid_bodies_from(data, offset)
+        else:
+            offset = self._protocol.skip_rigid_bodies_from(data, offset)
+
+        # Skeletons (Version 2.1 and later)
+        if FrameSection.Skeletons in sections:
+            offset, decoded[FrameSection.Skeletons] = self._protocol.unpack_skeletons_from(data, offset)
+        else:
+            offset = self._protocol.skip_skeletons_from(data, offset)
+
+        # Labeled markers (Version 2.3 and later)
+        if FrameSection.LabeledMarkers in sections:
+            offset, decoded[FrameSection.LabeledMarkers] = self._protocol.unpack_labeled_markers_from(data, offset)
+        else:
+            offset = self._protocol.skip_labeled_markers_from(data, offset)
 
-        # Send skeletons to listener
-        self._listener.on_skeletons(skeletons, time_info)
+        # Force Plate data (version 2.9 and later) and Device data (version 2.11 and later) - same structure.
+        # None of them is delivered to listeners.
+        offset = self._protocol.skip_force_plates_from(data, offset)
+        offset = self._protocol.skip_force_plates_from(data, offset)
 
-        # Send labeled markers to listener
-        self._listener.on_labeled_markers(labeled_markers, time_info)
+        offset, time_info = self._protocol.unpack_time_info_from(data, offset)
 
-        # Send unlabeled markers to listener
-        self._listener.on_unlabeled_markers(unlabeled_markers, time_info)
+        # Frame parameters
+        param, = ShortValue.unpack_from(data, offset)
+        is_recording = (param & 0x01) != 0
+        tracked_models_changed = (param & 0x02) != 0
 
-        # Send marker sets
-        self._listener.on_marker_sets(marker_sets, time_info)
+        self._notify_frame(decoded, time_info, frame_number)
 
+    def _notify_frame(self, decoded, time_info, frame_number):
+        """
+        Sends the decoded frame sections to the listeners that consume them, then notifies them the frame ended.
+
+        Args:
+            decoded (dict[:class:`FrameSection`, list]): the decoded elements of each section
+            time_info (:class:`TimeInfo`): time as a TimeInfo element
+            frame_number (int): the NatNet frame number
+        """
+        for listener in self._listeners:
+            for section, callback in SECTION_CALLBACKS:
+                if section in listener.sections and section in decoded:
+                    getattr(listener, callback)(decoded[section], time_info)
+            listener.on_frame_end(frame_number, time_info)
 
     # Unpack a data description packet
     def _unpack_description(self, data):
@@ -201,12 +336,24 @@ class Adapter(object):
         offset += shift
 
         if message_id == NAT_FRAME_OF_DATA:
-            self._unpack_motion_capture(data[offset:])
+            if self._offset_decoding and isinstance(data, memoryview):
+                # offset decoders search for strings in the packet itself
+                data = data.tobytes()
+
+            if self._array_frames:
+                _, frame = self._protocol.unpack_array_frame_from(data, offset)
+                for listener in self._listeners:
+                    listener.on_array_frame(frame)
+            elif self._offset_decoding:
+                self._unpack_motion_capture_from(data, offset)
+            else:
+                self._unpack_motion_capture(data[offset:])
         elif message_id == NAT_MODEL_DEF:
             self._unpack_description(data[offset:])
         elif message_id == NAT_PING_RESPONSE or message_id == NAT_PING:
             version = self._protocol.unpack_version(data[offset:])
-            self._listener.on_version(version)
+            for listener in self._listeners:
+                listener.on_version(version)
         elif message_id == NAT_RESPONSE:
             if packet_size == 4:
                 shift, command_response = self._protocol.read_value(data, offset, UIntValue)
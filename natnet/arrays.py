@@ -0,0 +1,152 @@
+import numpy as np
+
+from natnet.protocol import OffsetProtocol, MarkerSet, RigidBody, Position, Rotation, UIntValue, ShortValue, Vector3
+
+# Rigid body record as laid out on the wire (38 bytes, packed)
+RIGID_BODY_WIRE_DTYPE = np.dtype([('id', '<u4'), ('pos', '<f4', (3,)), ('quat', '<f4', (4,)),
+                                  ('error', '<f4'), ('params', '<i2')])
+
+# Rigid body record as exposed by :class:`ArrayFrame`, quaternion is ordered (w, x, y, z) as in :class:`Rotation`
+BODY_DTYPE = np.dtype([('id', np.uint32), ('pos', np.float32, (3,)), ('quat', np.float32, (4,)),
+                       ('error', np.float32), ('tracking_valid', np.bool_)])
+
+
+class ArrayFrame(object):
+    """
+    A motion capture frame backed by NumPy arrays instead of per-marker python objects.
+
+    Attributes:
+        frame_number (int): the NatNet frame number
+        markers (numpy.ndarray): (N, 3) float32 positions of all marker sets' markers, concatenated in packet order
+        marker_set_index (dict[str, slice]): maps a marker set name to its rows in `markers`
+        marker_set_types (dict[str, :class:`MarkerSetType`]): maps a marker set name to its type
+        unlabeled_markers (numpy.ndarray): (M, 3) float32 positions of unlabeled markers
+        bodies (numpy.ndarray): structured array of `BODY_DTYPE` records
+        time_info (:class:`TimeInfo`): time as a TimeInfo element
+    """
+    def __init__(self, frame_number, markers, marker_set_index, marker_set_types, unlabeled_markers, bodies,
+                 time_info):
+        self.frame_number = frame_number
+        self.markers = markers
+        self.marker_set_index = marker_set_index
+        self.marker_set_types = marker_set_types
+        self.unlabeled_markers = unlabeled_markers
+        self.bodies = bodies
+        self.time_info = time_info
+
+    def __repr__(self):
+        return 'ArrayFrame(frame_number={}, marker_sets={}, bodies={})'.format(
+            self.frame_number, list(self.marker_set_index), len(self.bodies))
+
+    def marker_set_positions(self, name):
+        """
+        Returns the (K, 3) positions of a single marker set (a view into `markers`)
+        """
+        return self.markers[self.marker_set_index[name]]
+
+    def marker_sets(self):
+        """
+        Returns the marker sets as :class:`MarkerSet` elements whose positions are (K, 3) array views.
+        """
+        return [MarkerSet(name, self.markers[index], self.marker_set_types[name])
+                for name, index in self.marker_set_index.items()]
+
+    def rigid_bodies(self):
+        """
+        Returns the rigid bodies as :class:`RigidBody` elements.
+        """
+        return [RigidBody(int(body['id']), Position(*body['pos'].tolist()), Rotation(*body['quat'].tolist()))
+                for body in self.bodies]
+
+
+class ArrayProtocol(OffsetProtocol):
+    """
+    Decodes NatNet frames straight from the packet buffer into an :class:`ArrayFrame`.
+    """
+    def unpack_vector_block_from(self, data, offset):
+        """
+        Unpack a counted block of Vector3 values as a (N, 3) float32 array.
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            vectors (numpy.ndarray):
+        """
+        count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+        vectors = np.frombuffer(data, dtype='<f4', count=3 * count, offset=offset).reshape(count, 3)
+        return offset + count * Vector3.size, vectors
+
+    def unpack_body_block_from(self, data, offset):
+        """
+        Unpack a counted block of rigid bodies as a `BODY_DTYPE` structured array.
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            bodies (numpy.ndarray):
+        """
+        count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+        wire = np.frombuffer(data, dtype=RIGID_BODY_WIRE_DTYPE, count=count, offset=offset)
+
+        bodies = np.empty(count, dtype=BODY_DTYPE)
+        bodies['id'] = wire['id']
+        bodies['pos'] = wire['pos']
+        bodies['quat'] = wire['quat']
+        bodies['error'] = wire['error']
+        bodies['tracking_valid'] = (wire['params'] & 0x01) != 0
+        return offset + count * RIGID_BODY_WIRE_DTYPE.itemsize, bodies
+
+    def unpack_array_frame_from(self, data, offset):
+        """
+        Unpack a whole frame of data.
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            frame (:class:`ArrayFrame`):
+        """
+        frame_number, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+
+        # Marker sets
+        marker_set_count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+        blocks = []
+        marker_set_index = {}
+        marker_set_types = {}
+        start = 0
+        for i in range(0, marker_set_count):
+            offset, model_name = self.read_string_from(data, offset)
+            offset, positions = self.unpack_vector_block_from(data, offset)
+            blocks.append(positions)
+            marker_set_index[model_name] = slice(start, start + len(positions))
+            marker_set_types[model_name] = self.get_markerset_type_from_name(model_name)
+            start += len(positions)
+        markers = np.concatenate(blocks) if blocks else np.empty((0, 3), dtype=np.float32)
+
+        offset, unlabeled_markers = self.unpack_vector_block_from(data, offset)
+        # the block is a view of the packet, which may be a receive buffer that is reused for the next packets
+        # (the marker sets blocks are already copied by the concatenation)
+        unlabeled_markers = unlabeled_markers.copy()
+        offset, bodies = self.unpack_body_block_from(data, offset)
+
+        # Sections that are not part of the array frame are skipped over to reach the time information
+        offset = self.skip_skeletons_from(data, offset)
+        offset = self.skip_labeled_markers_from(data, offset)
+        offset = self.skip_force_plates_from(data, offset)
+        offset = self.skip_force_plates_from(data, offset)  # devices
+
+        offset, time_info = self.unpack_time_info_from(data, offset)
+        offset += ShortValue.size  # frame parameters
+
+        frame = ArrayFrame(frame_number, markers, marker_set_index, marker_set_types, unlabeled_markers, bodies,
+                           time_info)
+        return offset, frame
@@ -0,0 +1,160 @@
+import asyncio
+
+from natnet.adapter import Adapter
+from natnet.motion_client import IP_MULTICAST, PORT_DATA, IP_SERVER, PORT_COMMAND, \
+    create_data_socket, create_command_socket, drop_membership, close_socket
+
+
+class _PacketProtocol(asyncio.DatagramProtocol):
+    """
+    Hands every packet received on a socket to the adapter, on the event loop's thread
+    """
+
+    def __init__(self, adapter):
+        self._adapter = adapter
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, address):
+        self._adapter.process_message(data)
+
+    def error_received(self, exc):
+        # e.g. a command sent to a server that is not up yet was refused
+        pass
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+class AsyncMotionClient(object):
+    """
+    Client for NatNet protocol, on an asyncio event loop.
+    Like `MotionClient`, but data and command packets are received by datagram endpoints of the running event loop
+    instead of a polling thread per socket, so frames are handed to the listeners as soon as they arrive and the
+    client can run alongside other asyncio tasks (e.g. a broadcaster).
+    Listener callbacks are invoked on the event loop's thread, and must not block it.
+
+    Usage:
+        async with AsyncMotionClient(listener, ip_local) as client:
+            await client.get_data()
+            ...
+
+    or run it as a task until it is cancelled:
+        task = asyncio.create_task(client.run())
+        ...
+        task.cancel()
+
+    Attributes: same as `MotionClient`
+    """
+    def __init__(self, listener, ip_local, ip_multicast=IP_MULTICAST, port_data=PORT_DATA,
+                 ip_server=IP_SERVER, port_command=PORT_COMMAND, array_frames=False):
+
+        self._local_ip = ip_local
+        self._multicast_ip = ip_multicast
+        self._data_port = port_data
+        self._data_socket = None
+        self._data_transport = None
+        self._data_protocol = None
+
+        self._server_ip = ip_server
+        self._command_port = port_command
+        self._command_transport = None
+        self._command_protocol = None
+
+        self._adapter = Adapter(listener, array_frames=array_frames)
+
+    @property
+    def is_connected(self):
+        return self._data_transport is not None
+
+    def get_data_address(self):
+        """
+        Returns the (ip, port) the data socket is bound to
+        """
+        return self._data_socket.getsockname()
+
+    def get_command_address(self):
+        """
+        Returns the (ip, port) the command socket is bound to, to which the server replies
+        """
+        return self._command_transport.get_extra_info('sockname')
+
+    async def get_data(self):
+        """
+        Start streaming motion capture data.
+        Data frames are delivered to `MotionListener` until `AsyncMotionClient.disconnect()` is called.
+        """
+        await self._send_command(self._adapter.get_data())
+
+    async def get_version(self):
+        """
+        Request software version details from the Motion Server.
+        """
+        await self._send_command(self._adapter.get_version())
+
+    async def get_descriptors(self):
+        await self._send_command(self._adapter.get_descriptors())
+
+    async def get_nat(self, command_string):
+        await self._send_command(self._adapter.get_nat(command_string))
+
+    async def connect(self):
+        """ Connect to NatNet server """
+        if self.is_connected:
+            return
+
+        loop = asyncio.get_running_loop()
+        data_socket = create_data_socket(self._local_ip, self._multicast_ip, self._data_port)
+        command_socket = create_command_socket()
+        data_socket.setblocking(False)
+        command_socket.setblocking(False)
+        try:
+            self._command_transport, self._command_protocol = await loop.create_datagram_endpoint(
+                lambda: _PacketProtocol(self._adapter), sock=command_socket)
+            self._data_transport, self._data_protocol = await loop.create_datagram_endpoint(
+                lambda: _PacketProtocol(self._adapter), sock=data_socket)
+        except BaseException:
+            if self._command_transport is not None:
+                self._command_transport.close()
+                self._command_transport = None
+            command_socket.close()
+            close_socket(data_socket, self._multicast_ip)
+            raise
+        self._data_socket = data_socket
+
+    async def disconnect(self):
+        """ Disconnect from NatNet server, and wait until the sockets are closed. """
+        if not self.is_connected:
+            return
+
+        self._command_transport.sendto(self._adapter.get_disconnect(), (self._server_ip, self._command_port))
+        data_transport, command_transport = self._data_transport, self._command_transport
+        self._data_transport = self._command_transport = None
+        drop_membership(self._data_socket, self._multicast_ip)
+        data_transport.close()
+        command_transport.close()
+        await asyncio.gather(self._data_protocol.closed, self._command_protocol.closed)
+        self._data_socket = None
+
+    async def run(self):
+        """
+        Connects, starts streaming motion capture data, and keeps receiving it until the task is cancelled
+        (then disconnects)
+        """
+        try:
+            await self.get_data()
+            await asyncio.Event().wait()
+        finally:
+            # the sockets are closed even when the task is cancelled while it waits for them
+            await asyncio.shield(self.disconnect())
+
+    async def _send_command(self, data):
+        await self.connect()
+        self._command_transport.sendto(data, (self._server_ip, self._command_port))
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.disconnect()
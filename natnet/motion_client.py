@@ -1,7 +1,8 @@
 ﻿import socket
+import struct
 from threading import Thread
 
-from natnet.adapter import Adapter
+from natnet.adapter import Adapter, NAT_FRAME_OF_DATA
 
 # IP address of your local network interface.
 IP_LOCAL = '127.0.0.1'
@@ -21,6 +22,96 @@ PORT_COMMAND = 1510
 # 32k byte buffer size
 SIZE_BUFFER = 32768
 
+# Kernel receive buffer of the data socket in batch receive mode (4 MB), so bursts are kept until they are drained
+SIZE_RECEIVE_BUFFER = 4 * 1024 * 1024
+
+# Start of a packet: message id, packet size, and the frame number of a frame of data message
+FRAME_HEADER = struct.Struct('<HHI')
+
+
+def create_command_socket():
+    """ Create a command socket to attach to the NatNet stream. """
+    socket_command = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    socket_command.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    socket_command.bind(('', 0))
+    socket_command.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    socket_command.setblocking(True)
+    return socket_command
+
+
+def create_data_socket(ip_local, ip_multicast, port):
+    """ Create a data socket (UDP) to attach to the NatNet stream. """
+
+    # TODO: check data socket creation issues:
+    #  https://github.com/ricardodeazambuja/OptiTrackPython/blob/master/OptiTrackPython.py
+    #  https://github.com/paparazzi/paparazzi/blob/master/sw/ground_segment/python/natnet3.x/NatNetClient.py
+
+    # create UDP socket
+    result = socket.socket(socket.AF_INET,  # Internet
+                           socket.SOCK_DGRAM,
+                           socket.IPPROTO_UDP)  # UDP
+
+    result.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    result.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                      socket.inet_aton(ip_multicast) + socket.inet_aton(ip_local))
+
+    result.bind((ip_local, port))
+    return result
+
+
+def drop_membership(data_socket, ip_multicast):
+    try:
+        membership = socket.inet_aton(ip_multicast) + socket.inet_aton('0.0.0.0')
+        data_socket.setsockopt(socket.SOL_IP, socket.IP_DROP_MEMBERSHIP, membership)
+    except socket.error:
+        pass
+
+
+def close_socket(data_socket, ip_multicast):
+    if not data_socket:
+        return
+
+    drop_membership(data_socket, ip_multicast)
+
+    # close socket
+    try:
+        data_socket.close()
+    except socket.error as err:
+        print('Closing socket failed {}'.format(err))
+
+
+class ReceiveStats(object):
+    """
+    Counts the frames of data received in batch receive mode.
+
+    Attributes:
+        datagrams (int): packets received on the data socket.
+        batches (int): wake-ups of the receive loop, each drains all the pending packets.
+        frames_decoded (int): frames that were decoded and delivered to the listeners.
+        frames_skipped (int): frames that were received but not decoded, since a newer frame was pending.
+        frames_dropped (int): frames that were never received, by gaps in the frame numbers.
+        last_frame_number (int): of the newest frame received, None before the first one.
+        receive_buffer_size (int): actual size of the kernel receive buffer, which may be capped by the system.
+    """
+    def __init__(self):
+        self.datagrams = 0
+        self.batches = 0
+        self.frames_decoded = 0
+        self.frames_skipped = 0
+        self.frames_dropped = 0
+        self.last_frame_number = None
+        self.receive_buffer_size = None
+
+    def count_frame(self, frame_number):
+        if self.last_frame_number is not None and frame_number > self.last_frame_number + 1:
+            self.frames_dropped += frame_number - self.last_frame_number - 1
+        # a restarted stream (lower frame number) starts counting again
+        self.last_frame_number = frame_number
+
+    def __repr__(self):
+        return 'ReceiveStats(datagrams={}, batches={}, frames_decoded={}, frames_skipped={}, frames_dropped={})'.format(
+            self.datagrams, self.batches, self.frames_decoded, self.frames_skipped, self.frames_dropped)
+
 
 class MotionClient(object):
     """
@@ -46,9 +137,16 @@ class MotionClient(object):
         port_data (int): NatNet Data channel.
         ip_server (str): IP address of the NatNet server.
         port_command (int): NatNet Command channel.
+        array_frames (bool): deliver frames as NumPy-backed `ArrayFrame` elements (see `Adapter`).
+        batch_receive (bool): drain all the pending data packets on every wake-up into preallocated buffers,
+                              with an enlarged kernel receive buffer, and count the frames (see `ReceiveStats`).
+        latest_only (bool): in batch receive mode, decode only the newest frame of every batch
+                            (frames the client fell behind on are skipped instead of delivered late).
+        batch_size (int): the maximal number of packets drained per wake-up in batch receive mode.
     """
     def __init__(self, listener, ip_local, ip_multicast=IP_MULTICAST, port_data=PORT_DATA,
-                 ip_server=IP_SERVER, port_command=PORT_COMMAND):
+                 ip_server=IP_SERVER, port_command=PORT_COMMAND, array_frames=False,
+                 batch_receive=False, latest_only=True, batch_size=64):
 
         self._local_ip = ip_local
         self._multicast_ip = ip_multicast
@@ -63,7 +161,18 @@ class MotionClient(object):
 
         self._is_running = False
 
-        self._adapter = Adapter(listener)
+        self._adapter = Adapter(listener, array_frames=array_frames)
+
+        self._batch_receive = batch_receive
+        self._latest_only = latest_only
+        self._batch_size = batch_size
+        self.receive_stats = ReceiveStats()
+
+    def get_data_address(self):
+        """
+        Returns the (ip, port) the data socket is bound to
+        """
+        return self._data_socket.getsockname()
 
     def get_data(self):
         """
@@ -104,7 +213,8 @@ class MotionClient(object):
         self._is_running = True
 
         # Create a separate thread for receiving data packets
-        self._data_thread = Thread(target=self._data_callback, args=(self._data_socket,))
+        data_callback = self._batch_data_callback if self._batch_receive else self._data_callback
+        self._data_thread = Thread(target=data_callback, args=(self._data_socket,))
         self._data_thread.start()
 
         # Create a separate thread for receiving command packets
@@ -114,20 +224,18 @@ class MotionClient(object):
     def disconnect(self):
         """ Disconnect from NatNet server. """
         if self._is_running:
+            # the disconnect command is sent on the open socket - sending it with '_send_command' after the
+            # threads stopped would connect again, and wait forever for the new threads
+            try:
+                self._command_socket.sendto(self._adapter.get_disconnect(), (self._server_ip, self._command_port))
+            except OSError:
+                pass
             self._is_running = False
             self._data_thread.join()
-
-            self._send_command(self._adapter.get_disconnect())
             self._command_thread.join()
 
     def _create_command_socket(self):
-        """ Create a command socket to attach to the NatNet stream. """
-        socket_command = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        socket_command.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        socket_command.bind(('', 0))
-        socket_command.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        socket_command.setblocking(True)
-        return socket_command
+        return create_command_socket()
 
     def _send_command(self, data):
         self.connect()
@@ -135,23 +243,7 @@ class MotionClient(object):
         self._command_socket.sendto(data, address)
 
     def _create_data_socket(self, port):
-        """ Create a data socket (UDP) to attach to the NatNet stream. """
-
-        # TODO: check data socket creation issues:
-        #  https://github.com/ricardodeazambuja/OptiTrackPython/blob/master/OptiTrackPython.py
-        #  https://github.com/paparazzi/paparazzi/blob/master/sw/ground_segment/python/natnet3.x/NatNetClient.py
-
-        # create UDP socket
-        result = socket.socket(socket.AF_INET,  # Internet
-                               socket.SOCK_DGRAM,
-                               socket.IPPROTO_UDP)  # UDP
-
-        result.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        result.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
-                          socket.inet_aton(self._multicast_ip) + socket.inet_aton(self._local_ip))
-
-        result.bind((self._local_ip, port))
-        return result
+        return create_data_socket(self._local_ip, self._multicast_ip, port)
 
     def _data_callback(self, data_socket, timeout=0.1):
         """ Continuously receive and process messages. """
@@ -164,23 +256,95 @@ class MotionClient(object):
         while self._is_running:
             try:
                 data = data_socket.recv(SIZE_BUFFER)
-                if len(data):
-                    self._adapter.process_message(data)
-            except (KeyboardInterrupt, SystemExit, OSError):
-                pass
-                #print('Exiting data socket')
-
             except socket.timeout:
-                print('NatNetClient socket timeout!')
+                # no data yet, check whether the client was disconnected
                 continue
+            except OSError as err:
+                if not self._is_running:
+                    break
+                # e.g. a previous packet was refused (reported on the next receive on Windows)
+                print('NatNetClient receive error: {}'.format(err))
+                continue
+
+            if len(data):
+                self._adapter.process_message(data)
 
         self._close_socket(data_socket)
 
+    def _batch_data_callback(self, data_socket, timeout=0.1):
+        """
+        Continuously receive messages, draining all the pending ones on every wake-up, and process them.
+        When latest_only is set, only the newest frame of data of every batch is decoded.
+        """
+        stats = self.receive_stats
+        try:
+            data_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SIZE_RECEIVE_BUFFER)
+        except socket.error as err:
+            print('Could not enlarge the receive buffer: {}'.format(err))
+        stats.receive_buffer_size = data_socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+        self._clear_buffer(data_socket)
+        data_socket.settimeout(timeout)
+
+        # packets are received into the same buffers on every batch, without allocating
+        buffers = [memoryview(bytearray(SIZE_BUFFER)) for i in range(self._batch_size)]
+        # non-blocking receives, per call where supported (otherwise the socket's timeout is switched per batch)
+        dont_wait = getattr(socket, 'MSG_DONTWAIT', None)
+
+        while self._is_running:
+            try:
+                sizes = [data_socket.recv_into(buffers[0])]
+            except (socket.timeout, BlockingIOError):
+                continue
+            except OSError as err:
+                if not self._is_running:
+                    break
+                # e.g. a previous packet was refused (reported on the next receive on Windows)
+                print('NatNetClient receive error: {}'.format(err))
+                continue
+
+            if dont_wait is None:
+                data_socket.settimeout(0)
+            try:
+                while len(sizes) < self._batch_size:
+                    sizes.append(data_socket.recv_into(buffers[len(sizes)], 0, dont_wait or 0))
+            except (socket.timeout, BlockingIOError):
+                pass
+            except OSError as err:
+                # the packets received so far are processed, the error repeats on the next receive if it persists
+                print('NatNetClient receive error: {}'.format(err))
+            finally:
+                # the socket must block again, or every receive would fail at once and the thread would spin
+                if dont_wait is None:
+                    data_socket.settimeout(timeout)
+
+            stats.batches += 1
+            stats.datagrams += len(sizes)
+            self._process_batch([buffer[:size] for buffer, size in zip(buffers, sizes) if size])
+
+        self._close_socket(data_socket)
+
+    def _process_batch(self, packets):
+        """ Process the packets of a batch in order, skipping all frames of data but the newest when latest_only. """
+        stats = self.receive_stats
+        frames = [i for i, packet in enumerate(packets)
+                  if len(packet) >= FRAME_HEADER.size and FRAME_HEADER.unpack_from(packet)[0] == NAT_FRAME_OF_DATA]
+        for i in frames:
+            stats.count_frame(FRAME_HEADER.unpack_from(packets[i])[2])
+        skipped = set(frames[:-1]) if self._latest_only else set()
+
+        for i, packet in enumerate(packets):
+            if i not in skipped:
+                self._adapter.process_message(packet)
+        stats.frames_skipped += len(skipped)
+        stats.frames_decoded += len(frames) - len(skipped)
+
     def _clear_buffer(self, data_socket):
         """ Clear pending messages from receiving buffer """
 
         # attempt to read a 1 byte length messages without blocking.
         # recv throws an exception as it fails to receive data from the cleared buffer
+        data_socket.settimeout(0)
         while True:
             try:
                 data_socket.recv(1)
@@ -188,24 +352,9 @@ class MotionClient(object):
                 break
 
     def _close_socket(self, data_socket):
-        if not data_socket:
-            return
-
-        # drop membership
-        try:
-            # TODO: something here is not working and the listener is not being closed correctly
-            #       it is possible that this is why the program is not terminated uopn exit
-            #       (even when calling listener.stop() in main)
-            membership = socket.inet_aton(self._multicast_ip) + socket.inet_aton('0.0.0.0')
-            data_socket.setsockopt(socket.SOL_IP, socket.IP_DROP_MEMBERSHIP, membership)
-        except socket.error:
-            pass
-
-        # close socket
-        try:
-            data_socket.close()
-        except socket.error as err:
-            print('Closing socket failed {}'.format(err))
+        close_socket(data_socket, self._multicast_ip)
 
     def __del__(self):
-        self.disconnect()
+        # the client may be collected after a failed __init__
+        if getattr(self, '_is_running', False):
+            self.disconnect()
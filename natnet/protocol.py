@@ -12,6 +12,9 @@ FloatValue = struct.Struct('<f')
 DoubleValue = struct.Struct('<d')
 Vector3 = struct.Struct('<fff')
 Quaternion = struct.Struct('<ffff')
+RigidBodyValue = struct.Struct('<I3f4ffh')  # id, position, rotation, marker error, params
+LabeledMarkerValue = struct.Struct('<I3ffhf')  # id, position, size, params, residual
+TimeInfoValue = struct.Struct('<IIdQQQ')  # time code, sub code, timestamp, hi-res timestamps
 VERSION = 'BBBB'
 
 
@@ -612,3 +615,240 @@ class Protocol(object):
             return MarkerSetType.All
         else:
             return MarkerSetType.Robot
+
+
+class OffsetProtocol(Protocol):
+    """
+    Offset-based decoder for NatNet frames.
+
+    Walks a single packet buffer with absolute offsets instead of re-slicing it for every element,
+    and unpacks fixed-size blocks (marker positions, rigid bodies, labeled markers) with one
+    `struct.iter_unpack` call per block.
+    All `*_from` methods take the whole packet and an absolute offset, and return the absolute offset
+    past the decoded element together with its value.
+    The results are identical to the matching `Protocol.unpack_*` methods, which remain available as fallback.
+    The `skip_*_from` methods only read element counts and return the offset past the element without decoding it.
+    """
+    def read_string_from(self, data, offset):
+        """
+        Unpack a null-terminated string field.
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            value (str):
+        """
+        end = data.find(b'\0', offset)
+        if end < 0:
+            end = len(data)
+        return end + 1, bytes(data[offset:end]).decode('utf-8')
+
+    def unpack_vectors_from(self, data, offset, count):
+        """
+        Unpack a block of `count` consecutive Vector3 values.
+
+        Args:
+            data (bytes):
+            offset (int):
+            count (int):
+        Returns:
+            offset (int):
+            vectors (list[tuple]): a list of (x, y, z) tuples
+        """
+        end = offset + count * Vector3.size
+        return end, list(Vector3.iter_unpack(memoryview(data)[offset:end]))
+
+    def unpack_positions_from(self, data, offset):
+        """
+        Unpack a list of positions.
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            markers (list[:class:`Position`]): a list of marker Positions
+        """
+        marker_count, = UIntValue.unpack_from(data, offset)
+        offset, vectors = self.unpack_vectors_from(data, offset + UIntValue.size, marker_count)
+        return offset, [Position(*pos) for pos in vectors]
+
+    def unpack_marker_sets_from(self, data, offset):
+        """
+        Unpack marker sets
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            marker_sets (list[:class:`MarkerSet`]): a list of MarkerSet elements
+        """
+        marker_set_count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+
+        marker_sets = []
+        for i in range(0, marker_set_count):
+            offset, model_name = self.read_string_from(data, offset)
+            offset, positions = self.unpack_positions_from(data, offset)
+            ms_type = self.get_markerset_type_from_name(model_name)
+            marker_sets.append(MarkerSet(model_name, positions, ms_type))
+
+        return offset, marker_sets
+
+    def unpack_rigid_bodies_from(self, data, offset):
+        """
+        Unpack a list of rigid bodies.
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            rigid_bodies (list[:class:`RigidBody`]): a list of RigidBody elements
+        """
+        rigid_body_count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+        end = offset + rigid_body_count * RigidBodyValue.size
+
+        rigid_bodies = []
+        for body_id, x, y, z, qw, qx, qy, qz, marker_error, param in \
+                RigidBodyValue.iter_unpack(memoryview(data)[offset:end]):
+            rigid_bodies.append(RigidBody(body_id, Position(x, y, z), Rotation(qw, qx, qy, qz)))
+
+        return end, rigid_bodies
+
+    def unpack_skeletons_from(self, data, offset):
+        """
+        Unpack skeletons.
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            skeletons (list[:class:`Skeleton`]): a list of Skeleton elements
+        """
+        skeleton_count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+
+        skeletons = []
+        for i in range(0, skeleton_count):
+            skeleton_id, = UIntValue.unpack_from(data, offset)
+            offset, bodies = self.unpack_rigid_bodies_from(data, offset + UIntValue.size)
+            skeletons.append(Skeleton(skeleton_id, bodies))
+
+        return offset, skeletons
+
+    def unpack_labeled_markers_from(self, data, offset):
+        """
+        Unpack labeled markers.
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            markers (list[:class:`LabeledMarker`]) a list of LabeledMarker elements
+        """
+        labeled_marker_count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+        end = offset + labeled_marker_count * LabeledMarkerValue.size
+
+        labeled_markers = []
+        for marker_id, x, y, z, size, param, residual in \
+                LabeledMarkerValue.iter_unpack(memoryview(data)[offset:end]):
+            labeled_markers.append(LabeledMarker(marker_id, Position(x, y, z)))
+
+        return end, labeled_markers
+
+    def unpack_force_plates_from(self, data, offset):
+        """
+        Unpacks Force Plate elements (devices share the same layout).
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            force_plates (list[:class:`ForcePlate`]): a list of ForcePlate elements
+        """
+        plate_count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+
+        force_plates = []
+        for i in range(0, plate_count):
+            plate_id, plate_channels = struct.unpack_from('<II', data, offset)
+            offset += 2 * UIntValue.size
+
+            channels = []
+            for j in range(0, plate_channels):
+                plate_frame_count, = UIntValue.unpack_from(data, offset)
+                offset += UIntValue.size
+                channels.append(list(struct.unpack_from('<{}I'.format(plate_frame_count), data, offset)))
+                offset += plate_frame_count * UIntValue.size
+
+            force_plates.append(ForcePlate(plate_id, channels))
+
+        return offset, force_plates
+
+    def unpack_time_info_from(self, data, offset):
+        """
+        Unpacks a TimeInfo element.
+
+        Args:
+            data (bytes):
+            offset (int):
+        Returns:
+            offset (int):
+            time_info (:class:`TimeInfo`):
+        """
+        time_code, time_code_sub, timestamp, time_camera_exposure, time_data_received, time_transmit = \
+            TimeInfoValue.unpack_from(data, offset)
+        result = TimeInfo(timestamp, time_code, time_code_sub, time_camera_exposure, time_data_received, time_transmit)
+        return offset + TimeInfoValue.size, result
+
+    def skip_string_from(self, data, offset):
+        end = data.find(b'\0', offset)
+        return len(data) + 1 if end < 0 else end + 1
+
+    def skip_positions_from(self, data, offset):
+        marker_count, = UIntValue.unpack_from(data, offset)
+        return offset + UIntValue.size + marker_count * Vector3.size
+
+    def skip_marker_sets_from(self, data, offset):
+        marker_set_count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+        for i in range(0, marker_set_count):
+            offset = self.skip_string_from(data, offset)
+            offset = self.skip_positions_from(data, offset)
+        return offset
+
+    def skip_rigid_bodies_from(self, data, offset):
+        rigid_body_count, = UIntValue.unpack_from(data, offset)
+        return offset + UIntValue.size + rigid_body_count * RigidBodyValue.size
+
+    def skip_skeletons_from(self, data, offset):
+        skeleton_count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+        for i in range(0, skeleton_count):
+            # skeleton id followed by its rigid bodies
+            offset = self.skip_rigid_bodies_from(data, offset + UIntValue.size)
+        return offset
+
+    def skip_labeled_markers_from(self, data, offset):
+        labeled_marker_count, = UIntValue.unpack_from(data, offset)
+        return offset + UIntValue.size + labeled_marker_count * LabeledMarkerValue.size
+
+    def skip_force_plates_from(self, data, offset):
+        plate_count, = UIntValue.unpack_from(data, offset)
+        offset += UIntValue.size
+        for i in range(0, plate_count):
+            plate_id, plate_channels = struct.unpack_from('<II', data, offset)
+            offset += 2 * UIntValue.size
+            for j in range(0, plate_channels):
+                plate_frame_count, = UIntValue.unpack_from(data, offset)
+                offset += UIntValue.size + plate_frame_count * UIntValue.size
+        return offset
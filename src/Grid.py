@@ -1,14 +1,13 @@
 import numpy as np
-import astar
 import random
-import itertools
 import pygame
 
 from enum import Enum
-from statistics import mode
-from shapely.geometry import LineString
 
 from src.globals import TOP_SCREEN_ALIGNMENT, LEFT_SCREEN_ALIGNMENT, WIDTH, HEIGHT, BLACK, GRAY, PATH_COLOR
+from src.grid_search import GridGraph, ConnectedComponents, distance_fields
+from src.pipeline import GridView
+from src.text_cache import text_cache
 
 
 class CellVal(Enum):
@@ -35,7 +34,8 @@ class Grid:
                  goal_locations,
                  paths_filename,
                  algorithm_output,
-                 surface
+                 surface,
+                 move_epsilon=0.005
                  ):
         """
         cell_size: in meters
@@ -46,6 +46,7 @@ class Grid:
         goal_locations: name of .txt file containing each robot's goal location
         paths_filename: name of .txt file where planner will output paths
         plan_filename: name of .txt file to be sent to ubuntu
+        move_epsilon: in meters, an object whose markers moved less than this is not re-placed on the grid
         """
 
         ## Parameters for interaction with the main loop to activate events
@@ -78,6 +79,16 @@ class Grid:
         # CellVal(Enum) = [white, salmon, green, red, black, royalblue, orange]
         self.colors = [(255, 255, 255), (250, 128, 114), (102, 205, 0), (255, 0, 0),
                        (0, 0, 0), (39, 64, 139), (255, 128, 0)]
+        self.background_color = (245, 245, 245)  # light-gray
+
+        ## Rendering cache parameters
+        # the background, grid lines and axis labels are pre-rendered once to this surface (see 'build_static_layer')
+        self.static_layer = None
+        # what is currently drawn on the screen, only what changed since is redrawn (see 'render')
+        self.drawn_grid = None
+        self.drawn_labels = {}
+        self.drawn_paths = {}
+        self.full_redraw = False  # True if the last call to 'render' redrew the entire screen
 
         ## Parameters for importing and exporting data from and to files
         self.mapfile = map_filename
@@ -87,10 +98,10 @@ class Grid:
         self.end_locations_file = goal_locations
 
         ## Helper parameters
-        # This is a 2D array representing the grid
+        # This is a 2D uint8 array of CellVal values representing the grid, composed from the occupancy layers below.
+        # It holds the objects that are on the grid, goals are added on demand (see 'compose_grid')
         # NOTE (!) that accessing with (y,x) to be aligned with LAB's coordinates
-        self.grid = []
-        self.endspots = []
+        self.grid = None
         self.has_paths = False
         # saves path after running the solver (for external visualization)
         self.solution_paths_on_grid = {}
@@ -101,46 +112,156 @@ class Grid:
         self.bad_bots = []  # simple list of all robots that aren't completely on one cell
         self.out_of_bounds_bots = []  # simple list of all robots that aren't completely within the bounds of the arena
 
+        ## Incremental update parameters
+        # objects are re-placed on the grid only when they moved, and only the cells they left or entered are updated
+        self.move_epsilon = move_epsilon  # meters
+        self.objects_positions = {}  # maps marker set name to its markers (x, y) when it was last placed
+        self.obstacles_cells = {}  # maps obstacle name to the grid cells it blocks
+        self.robots_cells = {}  # maps robot marker set name to (robot ID, grid cells it occupies, is fully on one cell)
+        # occupancy layers (uint8 arrays in the grid's shape): the number of obstacles,
+        # robots fully on the cell and robots partially on the cell, for each grid cell
+        self.obstacles_layer = None
+        self.full_robots_layer = None
+        self.partial_robots_layer = None
+        # the connected components of the cells that are not blocked by obstacles (see 'get_components')
+        self.components = ConnectedComponents()
+        self.reset_grid()
+
     def place_objects_on_grid(self):
         """
         adding colored object to grid, based on the cell's status
         """
-        # get cells dimension
+        # goal locations are drawn only if the location is not occupied
+        grid = self.compose_grid(goals=True)
+        labels = self.cell_labels(grid)
+
+        # travers the tiled grid cells
+        for row, column in np.argwhere(grid != CellVal.EMPTY.value).tolist():
+            # the cell is not empty, then we place a colored tile in it
+            self.draw_cell((row, column), grid[row, column], labels.get((row, column), CellVal.EMPTY.value))
+
+    def draw_cell(self, grid_cell, cell_value, label=CellVal.EMPTY.value):
+        """
+        draws the colored tile of a single (not empty) grid cell, with its robot id if a label is given
+        """
         cell_border = self.cell_dim / 10
         tile_dim = self.cell_dim - (cell_border * 2)  # NOTE that the tile we draw is square
+        row, column = grid_cell
+        x = self.screen_grid_origin[0] + (self.cell_dim * column) + self.line_width + cell_border
+        y = self.screen_grid_origin[1] + (self.cell_dim * row) + self.line_width + cell_border
+        self.draw_square_cell(x=x, y=y, tile_dim=tile_dim, cell_color=self.colors[cell_value], robot_id=label)
 
-        # set goal locations on grid
-        for robot_id, goal_loc in self.end_bots.items():
-            # draw goal tile only if location is not occupied
-            if self.grid[goal_loc[0]][goal_loc[1]] == CellVal.EMPTY.value:
-                self.grid[goal_loc[0]][goal_loc[1]] = CellVal.GOAL.value
+    def cell_labels(self, grid):
+        """
+        Returns a dictionary that maps a grid cell (row, column) to the robot id to print in it:
+        robots that are fully inside a cell, and goals that are not occupied (in the given composed grid)
+        """
+        labels = {}
+        for robot_id, (row, column) in self.bots.items():
+            if grid[row, column] == CellVal.ROBOT_FULL.value:
+                labels.setdefault((row, column), str(robot_id))
+        for robot_id, (row, column) in self.end_bots.items():
+            if grid[row, column] == CellVal.GOAL.value:
+                labels.setdefault((row, column), str(robot_id))
+        return labels
+
+    def get_cell_rect(self, grid_cell):
+        """
+        Returns the pygame.Rect on screen of the tile of a grid cell
+        """
+        cell_border = self.cell_dim / 10
+        tile_dim = self.cell_dim - (cell_border * 2)
+        row, column = grid_cell
+        x = self.screen_grid_origin[0] + (self.cell_dim * column) + self.line_width + cell_border
+        y = self.screen_grid_origin[1] + (self.cell_dim * row) + self.line_width + cell_border
+        # rounded outwards, so the rectangle covers every pixel the tile touches
+        left, top = int(np.floor(x)), int(np.floor(y))
+        return pygame.Rect(left, top, int(np.ceil(x + tile_dim)) - left + 1, int(np.ceil(y + tile_dim)) - top + 1)
 
-        # travers the grid
-        for row in range(self.rows):
-            for column in range(self.cols):
-                # is the grid cell tiled ?
-                if self.grid[row][column] != CellVal.EMPTY.value:
-                    # if the cell is not empty, then we place a colored tile in it
-                    robot_id = self.find_robot_in_loc((row, column))
-                    x = self.screen_grid_origin[0] + (self.cell_dim * column) + self.line_width + cell_border
-                    y = self.screen_grid_origin[1] + (self.cell_dim * row) + self.line_width + cell_border
-                    self.draw_square_cell(
-                        x=x, y=y, tile_dim=tile_dim, cell_color=self.colors[self.grid[row][column]], robot_id=robot_id)
-                    # print robot id to screen if cell is goal
-                    if self.grid[row][column] == CellVal.GOAL.value:
-                        robot_id = list(filter(lambda key: self.end_bots[key][0] == row and
-                                                           self.end_bots[key][1] == column,
-                                               self.end_bots.keys()))[0]
-                        self.print_text_on_screen(text=str(robot_id),
-                                                  loc_on_screen=self.get_grid_cell_center_on_screen((row, column)),
-                                                  font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=BLACK,
-                                                  bold=True)
-
-    def draw_paths(self):
-        """
-        draws the solution paths to the screen
-        """
-        for agent_id_str, path in self.solution_paths_on_grid.items():
+    def get_grid_rect(self):
+        """
+        Returns the pygame.Rect on screen of the whole grid (including its borders)
+        """
+        cont_x, cont_y = self.screen_grid_origin
+        return pygame.Rect(int(cont_x) - self.line_width, int(cont_y) - self.line_width,
+                           int(np.ceil(self.cols * self.cell_dim)) + 2 * self.line_width + 1,
+                           int(np.ceil(self.rows * self.cell_dim)) + 2 * self.line_width + 1)
+
+    def build_static_layer(self):
+        """
+        Pre-renders the parts of the screen that do not change between frames - the background,
+        the grid's lines and its rows and columns labels - to a surface in the size of the screen.
+        """
+        self.static_layer = pygame.Surface(self.surface.get_size())
+        self.static_layer.fill(self.background_color)
+        self.draw_grid(surface=self.static_layer)
+
+    def invalidate_static_layer(self):
+        """
+        Forces the static layer and all the cells to be redrawn on the next call to 'render'
+        (required after changing the grid's dimensions or visualization parameters)
+        """
+        self.static_layer = None
+
+    def get_view(self):
+        """
+        Returns a GridView of the current state of the grid - a copy that is safe to render from another thread
+        """
+        # goal locations are drawn only if the location is not occupied
+        grid = self.compose_grid(goals=True)
+        paths = {agent: list(path) for agent, path in self.solution_paths_on_grid.items()} if self.has_paths else {}
+        return GridView(grid, self.cell_labels(grid), paths)
+
+    def render(self, view=None):
+        """
+        Draws the grid to the screen, redrawing only the cells whose value or label changed since the previous call.
+        The static layer is rebuilt only when it was invalidated or when the screen's size changed.
+        view: a GridView to draw (see 'get_view'), the current state of the grid if not given
+        Returns the list of rectangles on screen that were changed (to pass to pygame.display.update)
+        """
+        dirty_rects = []
+        self.full_redraw = self.static_layer is None or self.static_layer.get_size() != self.surface.get_size()
+        if self.full_redraw:
+            self.build_static_layer()
+            self.surface.blit(self.static_layer, (0, 0))
+            self.drawn_grid = None
+            dirty_rects.append(self.surface.get_rect())
+
+        grid, labels, paths = self.get_view() if view is None else view
+
+        if self.drawn_grid is None or paths != self.drawn_paths:
+            # paths are drawn across many cells, so the whole grid is redrawn when they change
+            changed = np.ones(grid.shape, dtype=bool)
+        else:
+            changed = grid != self.drawn_grid
+            for grid_cell, label in set(labels.items()) ^ set(self.drawn_labels.items()):
+                changed[grid_cell] = True
+
+        changed_cells = np.argwhere(changed).tolist()
+        for row, column in changed_cells:
+            rect = self.get_cell_rect((row, column))
+            # restore the background and the grid's lines under the cell, and draw it again if not empty
+            self.surface.blit(self.static_layer, rect, rect)
+            if grid[row, column] != CellVal.EMPTY.value:
+                self.draw_cell((row, column), grid[row, column], labels.get((row, column), CellVal.EMPTY.value))
+            dirty_rects.append(rect)
+
+        if changed_cells and paths:
+            # redrawn cells may have erased parts of the paths
+            self.draw_paths(paths)
+            dirty_rects.append(self.get_grid_rect())
+
+        self.drawn_grid = grid
+        self.drawn_labels = labels
+        self.drawn_paths = paths
+        return dirty_rects
+
+    def draw_paths(self, paths=None):
+        """
+        draws the solution paths (self.solution_paths_on_grid if not given) to the screen
+        """
+        paths = self.solution_paths_on_grid if paths is None else paths
+        for agent_id_str, path in paths.items():
             for i in range(len(path) - 1):
                 # going over sequential steps on the path
                 curr_x, curr_y = self.get_grid_cell_center_on_screen(path[i])
@@ -183,10 +304,11 @@ class Grid:
                                       font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=BLACK,
                                       bold=True)
 
-    def draw_grid(self):
+    def draw_grid(self, surface=None):
         """
-        draws the grid to the screen based on the values in self.grid
+        draws the grid's lines and its rows and columns labels to the screen (or to the given surface)
         """
+        surface = self.surface if surface is None else surface
         # dimensions on screen
         cont_x, cont_y = self.screen_grid_origin
         grid_height = int(self.rows) * self.cell_dim
@@ -195,23 +317,23 @@ class Grid:
         # DRAW Grid Border:
         # TOP lEFT TO RIGHT
         pygame.draw.line(
-            self.surface, self.line_color,
+            surface, self.line_color,
             (cont_x, cont_y),
             (grid_width + cont_x, cont_y), self.line_width)
         # BOTTOM lEFT TO RIGHT
         pygame.draw.line(
-            self.surface, self.line_color,
+            surface, self.line_color,
             (cont_x, grid_height + cont_y),
             (grid_width + cont_x,
              grid_height + cont_y), self.line_width)
         # LEFT TOP TO BOTTOM
         pygame.draw.line(
-            self.surface, self.line_color,
+            surface, self.line_color,
             (cont_x, cont_y),
             (cont_x, cont_y + grid_height), self.line_width)
         # RIGHT TOP TO BOTTOM
         pygame.draw.line(
-            self.surface, self.line_color,
+            surface, self.line_color,
             (grid_width + cont_x, cont_y),
             (grid_width + cont_x,
              grid_height + cont_y), self.line_width)
@@ -219,7 +341,7 @@ class Grid:
         # VERTICAL DIVISIONS (draw vertical lines in grid)
         for col in range(self.cols):
             pygame.draw.line(
-                self.surface, self.line_color,
+                surface, self.line_color,
                 (cont_x + (self.cell_dim * col), cont_y),
                 (cont_x + (self.cell_dim * col), grid_height + cont_y), 2)
 
@@ -230,17 +352,19 @@ class Grid:
             self.print_text_on_screen(text=str(col),
                                       loc_on_screen=(cont_x + col * self.cell_dim + self.cell_dim / 2,
                                                      self.bottomleft + 10),
-                                      font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=BLACK)
+                                      font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=BLACK,
+                                      surface=surface)
             # lab coords in gray
             self.print_text_on_screen(text=str(x_range[col]),
                                       loc_on_screen=(cont_x + col * self.cell_dim + self.cell_dim / 2,
                                                      self.bottomleft + 30),
-                                      font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=GRAY)
+                                      font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=GRAY,
+                                      surface=surface)
 
         # HORIZONTAL DIVISIONS (draw horizontal lines in grid)
         for row in range(self.rows):
             pygame.draw.line(
-                self.surface, self.line_color,
+                surface, self.line_color,
                 (cont_x, cont_y + (self.cell_dim * row)),
                 (cont_x + grid_width, cont_y + (self.cell_dim * row)), 2)
 
@@ -252,49 +376,238 @@ class Grid:
             self.print_text_on_screen(text=str(row),
                                       loc_on_screen=(LEFT_SCREEN_ALIGNMENT - 10,
                                                      cont_y + row * self.cell_dim + self.cell_dim / 2),
-                                      font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=BLACK)
+                                      font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=BLACK,
+                                      surface=surface)
             # lab coords in gray
             self.print_text_on_screen(text=str(y_range[row]),
                                       loc_on_screen=(LEFT_SCREEN_ALIGNMENT - 30,
                                                      cont_y + row * self.cell_dim + self.cell_dim / 2),
-                                      font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=GRAY)
+                                      font_size=int(self.cell_dim / 2), font='Comic Sans MS', color=GRAY,
+                                      surface=surface)
 
-    def print_text_on_screen(self, text, loc_on_screen, font_size, font='Comic Sans MS', color=BLACK, bold=False):
+    def print_text_on_screen(self, text, loc_on_screen, font_size, font='Comic Sans MS', color=BLACK, bold=False,
+                             surface=None):
         """
-        A method for printing text to screen using pyGame objects
+        A method for printing text to screen (or to the given surface) using pyGame objects
         """
-        font = pygame.font.SysFont(font, font_size, bold=bold)
-        text = font.render(text, True, color)
+        surface = self.surface if surface is None else surface
+        text = text_cache.render(text, font, font_size, color, bold=bold)  # rendered once, then only blitted
         text_rect = text.get_rect(center=loc_on_screen)
-        self.surface.blit(text, text_rect)
+        surface.blit(text, text_rect)
 
     def reset_grid(self):
         """
-        Resets the grid so that all values are 0 (meaning nothing is in the box)
+        Resets the grid so that all values are 0 (meaning nothing is in the box),
+        and forgets all the obstacles and robots that were placed on it.
+        """
+        self.grid = np.full((self.rows, self.cols), CellVal.EMPTY.value, dtype=np.uint8)
+
+        self.obstacles_layer = np.zeros((self.rows, self.cols), dtype=np.uint8)
+        self.full_robots_layer = np.zeros((self.rows, self.cols), dtype=np.uint8)
+        self.partial_robots_layer = np.zeros((self.rows, self.cols), dtype=np.uint8)
+        self.objects_positions = {}
+        self.obstacles_cells = {}
+        self.robots_cells = {}
+        self.bots = {}
+        self.bad_bots = []
+        self.out_of_bounds_bots = []
+
+    def update_objects(self, obstacles, robots, tolerance=1):
+        """
+        Updates the grid with the current obstacles and robots (see 'add_obstacles' and 'add_robots').
+        Only objects that appeared, disappeared or moved by more than move_epsilon since they were last placed
+        are re-placed, and only the cells they left or entered are updated.
+        """
+        obstacles_names = set(obst.name for obst in obstacles)
+        for name in list(self.obstacles_cells):
+            if name not in obstacles_names:
+                self.__remove_obstacle(name)
+
+        robots_names = set(robot_markers.name for robot_id, robot_markers in robots)
+        for name in list(self.robots_cells):
+            if name not in robots_names:
+                self.__remove_robot(name)
+
+        self.add_obstacles([obst for obst in obstacles if self.__is_moved(obst)])
+        self.add_robots([(robot_id, robot_markers) for robot_id, robot_markers in robots
+                         if self.__is_moved(robot_markers)], tolerance)
+
+    def __is_moved(self, marker_set):
+        """
+        Checks if any marker of the marker set moved by more than move_epsilon since the marker set was placed
+        """
+        last_positions = self.objects_positions.get(marker_set.name)
+        if last_positions is None:
+            return True
+        positions = np.asarray(self.get_positions_list(marker_set.positions), dtype=np.float64).reshape(-1, 2)
+        return positions.shape != last_positions.shape or \
+            np.abs(positions - last_positions).max(initial=0) > self.move_epsilon
+
+    def __remove_obstacle(self, name):
+        """
+        Removes an obstacle that was placed on the grid, and updates the cells it blocked
+        """
+        self.objects_positions.pop(name, None)
+        self.__remove_from_layer(self.obstacles_layer, self.obstacles_cells.pop(name, []))
+
+    def __remove_robot(self, name):
+        """
+        Removes a robot that was placed on the grid, and updates the cells it occupied
+        """
+        self.objects_positions.pop(name, None)
+        if name not in self.robots_cells:
+            return
+        robot_id, cells, is_full = self.robots_cells.pop(name)
+        self.__remove_from_layer(self.full_robots_layer if is_full else self.partial_robots_layer, cells)
+        self.bots.pop(robot_id, None)
+        self.bad_bots = [bot for bot in self.bad_bots if bot != robot_id]
+        self.out_of_bounds_bots = [bot for bot in self.out_of_bounds_bots if bot[0] != robot_id]
+
+    def __add_to_layer(self, layer, cells):
+        """
+        Adds an object occupying the given (unique) cells to an occupancy layer, and updates these cells in the grid
+        """
+        if cells:
+            rows, cols = np.array(cells).T
+            layer[rows, cols] += 1
+            self.__update_cells(rows, cols)
+
+    def __remove_from_layer(self, layer, cells):
+        """
+        Removes an object occupying the given (unique) cells from an occupancy layer, and updates these cells
+        in the grid
+        """
+        if cells:
+            rows, cols = np.array(cells).T
+            layer[rows, cols] -= 1
+            self.__update_cells(rows, cols)
+
+    def __update_cells(self, rows, cols):
+        """
+        Sets the values of the given grid cells according to the objects that occupy them.
+        NOTE that we currently do not check or notify edge-collision (for visualization purposes)
+        """
+        obstacles = self.obstacles_layer[rows, cols] > 0
+        full_robots = self.full_robots_layer[rows, cols]
+        partial_robots = self.partial_robots_layer[rows, cols] > 0
+
+        # robot-obstacle or robot-robot collision
+        collisions = (full_robots > 0) & (obstacles | (full_robots > 1) | partial_robots)
+        for row, col in zip(rows[collisions].tolist(), cols[collisions].tolist()):
+            print(f'Collision at {(row, col)}!')
+
+        self.grid[rows, cols] = np.select(
+            [collisions, partial_robots, full_robots > 0, obstacles],
+            [CellVal.COLLISION.value, CellVal.ROBOT_PARTIAL.value, CellVal.ROBOT_FULL.value,
+             CellVal.OBSTACLE_REAL.value],
+            CellVal.EMPTY.value)
+
+    def goals_layer(self):
+        """
+        Returns a boolean array in the grid's shape, which is True in the robots' goal locations
         """
-        self.grid = []
-        for i in range(int(self.rows)):
-            self.grid.append([CellVal.EMPTY.value for i in range(int(self.cols))])
+        goals = np.zeros((self.rows, self.cols), dtype=bool)
+        if self.end_bots:
+            rows, cols = np.array(list(self.end_bots.values())).T
+            goals[rows, cols] = True
+        return goals
 
-    def __get_blocked_cells(self, vertices_list, dr=0.01):
+    def blocked_layer(self):
         """
-        Returns a list of grid cells that are blocked by an obstacle.
-        traverses in small steps through each line between any two corners of the obstacle
-        (according to the markers positions) and marks each grid cell it steps within as blocked.
-        Notice that it might miss blocked cells if the step size is to large, but if the cells are not very small it
-        supposed to be accurate enough.
+        Returns a boolean array in the grid's shape, which is True in the cells blocked by obstacles
+        (the '@' cells of the .map file)
         """
-        blocked_cells = []
-        for pair in itertools.product(vertices_list, repeat=2):
-            line_blocked_cells = self.__line_grid_intersection(pair[0], pair[1], dr)
-            # blocked_cells.append(line_blocked_cells)
-            blocked_cells += line_blocked_cells
-        return list(set(blocked_cells))
+        return np.isin(self.grid, [CellVal.OBSTACLE_ART.value, CellVal.OBSTACLE_REAL.value])
+
+    def get_components(self):
+        """
+        Returns the ConnectedComponents of the cells that are not blocked by obstacles, updated to the current grid
+        (robots move, so they do not separate components)
+        """
+        self.components.update(self.blocked_layer())
+        return self.components
+
+    def is_reachable(self, loc1, loc2):
+        """
+        Checks that a path between two (row, column) locations that avoids obstacles exists
+        """
+        return self.get_components().is_reachable(loc1, loc2)
+
+    def compose_grid(self, goals=False):
+        """
+        Returns a copy of the grid, with goal locations that are not occupied set to CellVal.GOAL if goals is True
+        """
+        grid = self.grid.copy()
+        if goals:
+            grid[self.goals_layer() & (grid == CellVal.EMPTY.value)] = CellVal.GOAL.value
+        return grid
+
+    def __get_blocked_cells(self, vertices_list):
+        """
+        Returns an array of grid cells (in LAB's coordinates, as (y, x) rows) that are blocked by an obstacle.
+        The obstacle is the convex hull of its markers, and a cell is blocked if its square touches the hull
+        (separating axis test of every cell in the hull's bounding box against the hull's edges).
+        Every line between two markers lies within the hull, so these are at least the cells such lines cross.
+        """
+        # work in cell units of Motive's (x, y), where cell (i, j) spans [i, i + 1) x [j, j + 1)
+        points = np.asarray(vertices_list, dtype=np.float64)[:, :2] / self.cell_size
+        hull = self.__convex_hull(points)
+
+        # candidate cells are all the cells of the hull's bounding box
+        low = np.floor(hull.min(axis=0)).astype(int)
+        high = np.floor(hull.max(axis=0)).astype(int)
+        xs, ys = np.meshgrid(np.arange(low[0], high[0] + 1), np.arange(low[1], high[1] + 1), indexing='ij')
+        cells = np.stack([xs.ravel(), ys.ravel()], axis=1)
+
+        # the x and y axes are already separated by the bounding box, test the hull edges' normals
+        edges = np.roll(hull, -1, axis=0) - hull
+        normals = np.stack([-edges[:, 1], edges[:, 0]], axis=1)
+        normals = normals[np.any(normals != 0, axis=1)]
+        if len(normals):
+            hull_projection = hull @ normals.T
+            centers_projection = (cells + 0.5) @ normals.T
+            cell_radius = 0.5 * np.abs(normals).sum(axis=1)
+            tolerance = 1e-9 * np.abs(normals).sum(axis=1)  # touching cells are blocked, also under rounding errors
+            overlap = (centers_projection + cell_radius >= hull_projection.min(axis=0) - tolerance) & \
+                      (centers_projection - cell_radius <= hull_projection.max(axis=0) + tolerance)
+            cells = cells[overlap.all(axis=1)]
+
+        # same conversion as 'xy_to_cell'
+        return np.stack([cells[:, 0], -cells[:, 1]], axis=1)
+
+    @staticmethod
+    def __convex_hull(points):
+        """
+        Returns the convex hull of 2D points in counter-clockwise order (Andrew's monotone chain).
+        A degenerate hull is returned as one or two points.
+        """
+        points = sorted(set(map(tuple, points.tolist())))
+        if len(points) <= 2:
+            return np.array(points)
+
+        def cross(o, a, b):
+            return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+        lower = []
+        for p in points:
+            while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+                lower.pop()
+            lower.append(p)
+        upper = []
+        for p in reversed(points):
+            while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+                upper.pop()
+            upper.append(p)
+        return np.array(lower[:-1] + upper[:-1])
 
     def get_positions_list(self, marker_positions):
         """
         Returns a set of [x,y] coordinates of the cell the marker lays within
         """
+        if isinstance(marker_positions, np.ndarray):
+            # (N, 3) positions from an array frame
+            return marker_positions[:, :2]
+
         set_coords = []
         for mi, marker_pos in enumerate(marker_positions):
             loc = [marker_pos.x, marker_pos.y]
@@ -304,9 +617,12 @@ class Grid:
     def add_obstacles(self, obstacles):
         """
         Colors all the cells that are blocked by obstacles.
+        An obstacle that is already on the grid (same name) is replaced.
         """
         for obst in obstacles:
+            self.__remove_obstacle(obst.name)
             obst_cords = self.get_positions_list(obst.positions)
+            self.objects_positions[obst.name] = np.asarray(obst_cords, dtype=np.float64).reshape(-1, 2)
 
             # check if the obstacle is out of the grid's bounds
             # consider out of bounds if one of the markers is out of bounds
@@ -317,105 +633,118 @@ class Grid:
                 # Notify about obstacle that is out of bounds
                 print(f"At least one of obstacle --{obst.name}-- markers is out of bounds. "
                       f"The obstacle will not be shown on the grid.")
+                cells = []
             else:
                 blocked_cells = self.__get_blocked_cells(obst_cords)
-                for coord in blocked_cells:
-                    new_coord = self.cell_to_grid_cell(coord)
-                    self.grid[new_coord[0]][new_coord[1]] = CellVal.OBSTACLE_REAL.value
+                cells = [self.cell_to_grid_cell(coord) for coord in blocked_cells]
+
+            self.obstacles_cells[obst.name] = cells
+            self.__add_to_layer(self.obstacles_layer, cells)
 
     def add_robots(self, robots, tolerance=1):
         """
         Adds a robot to the grid and colors the relevant cell accordingly.
+        A robot that is already on the grid (same marker set name) is replaced.
         A word on tolerance: it describes how "strict" the system will be in order to recognize a robot
         tolerance of 0: all markers must be in one cell
         tolerance of 1: all markers but one must be in the same cell
         tolerance of 2: majority of markers must be in one cell
         If the robot's configuration is outside of the specified tolerance, it will highlight all the cells the robot touches
         """
-        self.bad_bots = []
+        robots = list(robots)
+        markers_list = []
         for robot_id, robot_markers in robots:
-            # calculate the grid cells that the robots markers lay within
-            robot_cords = self.get_positions_list(robot_markers.positions)
-            relevant_markers_cells = [self.xy_to_cell(coord) for coord in robot_cords]
+            self.__remove_robot(robot_markers.name)
+            robot_cords = np.asarray(self.get_positions_list(robot_markers.positions), dtype=np.float64)
+            markers_list.append(robot_cords.reshape(-1, 2))
+            self.objects_positions[robot_markers.name] = markers_list[-1]
 
-            # check if the robot is out of the grid's bounds
-            # consider out of bounds if one of the markers is out of bounds
-            in_bounds = all(self.marker_in_bound(marker_cell) for marker_cell in relevant_markers_cells)
-            if not in_bounds:
-                self.out_of_bounds_bots.append((robot_id, relevant_markers_cells))
+        # all the robots are projected on the grid at once
+        placements, partial, out_of_bounds = self.project_robots(markers_list, tolerance)
+
+        for index, (robot_id, robot_markers) in enumerate(robots):
+            if index in out_of_bounds:
+                self.out_of_bounds_bots.append((robot_id, out_of_bounds[index]))
                 # Notify about robot that is out of bounds
                 print(f"Robot {robot_id} is out of bounds and will not be shown in the visualization.\n"
-                      f"Its markers are located in cells: {relevant_markers_cells} (in lab's coordinates)")
-
+                      f"Its markers are located in cells: {out_of_bounds[index]} (in lab's coordinates)")
+                cells, is_full = [], False
+            elif index in placements:
+                # collisions with obstacles or between robots are resolved when the cells are updated
+                grid_cell = placements[index]
+                cells, is_full = [grid_cell], True
+                self.bots[robot_id] = [grid_cell[0], grid_cell[1]]
             else:
-                # robot is in bounds.
-                # the color that the robot would appear with is depending on whether it is fully inside a cell or not.
-                # we also check for collisions with obstacles or between robots
-                mode_cell = mode(relevant_markers_cells)  # get the most common grid cell from the markers list
-                majority_count = len(relevant_markers_cells) / 2  # how many markers count as a majority
-
-                if relevant_markers_cells.count(mode_cell) == len(relevant_markers_cells):
-                    # all markers are in one cell
-                    self.set_robot_cell_color(robot_id, mode_cell)
-
-                elif relevant_markers_cells.count(mode_cell) >= len(relevant_markers_cells) - 1 \
-                        and tolerance == 1:
-                    # all markers but one are in the same cell
-                    # if tolerance is 1 then it is ok
-                    self.set_robot_cell_color(robot_id, mode_cell)
-
-                elif relevant_markers_cells.count(mode_cell) >= majority_count and tolerance == 2:
-                    # majority markers are in the same cell
-                    # if tolerance is 2 then it is ok
-                    self.set_robot_cell_color(robot_id, mode_cell)
-
-                else:
-                    # the current location of the markers does not qualify as being in one cell
-                    # according to the provided tolerance
-                    self.bad_bots.append(robot_id)  # add its id to the list of bad robots
-                    # highlight all the cells it touches
-                    for cell in relevant_markers_cells:
-                        grid_cell = self.cell_to_grid_cell(cell)  # convert to grid cell coordinates
-                        self.grid[grid_cell[0]][grid_cell[1]] = CellVal.ROBOT_PARTIAL.value
-
-    def __line_grid_intersection(self, p1, p2, dr):
-        """
-        Being called from '__get_blocked_cells' to find intersection of line with a grid cell (in LAB's coordinates).
-        """
-        ls = LineString([p1, p2])
-        points_on_line = []
-        line_length = np.ceil(ls.length)
-        num_samples = int(line_length / dr)
-        linespace = [x * dr for x in range(0, num_samples + 1)]
-        for f in linespace:
-            # p_x, p_y = ls.interpolate(f).coords[0]
-            #
-            # # swhitching order of x and y because xy_to_cell needs to get thj
-            # points_on_line.append((p_y, p_x))
-
-            p = ls.interpolate(f).coords[0]
-            points_on_line.append(p)
-
-        ar = np.array(points_on_line, 'f')
-
-        cells = list(map(lambda p: self.xy_to_cell(p), ar))
-        return cells
-
-    def check_collisions(self, grid_cell):
-        """
-        Check for robot-obstacle or robot-robot collision at location grid_cell.
-        If there exists a collision, it sets the value of the cell in the grid
-        such that it would appear in collision color.
-        NOTE that we currently do not check or notify edge-collision (for visualization purposes)
-        """
-        if self.grid[grid_cell[0]][grid_cell[1]] == CellVal.OBSTACLE_REAL.value or \
-            self.grid[grid_cell[0]][grid_cell[1]] == CellVal.ROBOT_FULL.value or \
-            self.grid[grid_cell[0]][grid_cell[1]] == CellVal.ROBOT_PARTIAL.value:
+                # the current location of the markers does not qualify as being in one cell
+                # according to the provided tolerance, highlight all the cells it touches
+                self.bad_bots.append(robot_id)
+                cells, is_full = partial[index], False
 
-            print(f'Collision at {grid_cell}!')
-            self.grid[grid_cell[0]][grid_cell[1]] = CellVal.COLLISION.value
-            return True
-        return False
+            self.robots_cells[robot_markers.name] = (robot_id, cells, is_full)
+            self.__add_to_layer(self.full_robots_layer if is_full else self.partial_robots_layer, cells)
+
+    def project_robots(self, markers_list, tolerance=1):
+        """
+        Projects the markers of many robots on the grid at once.
+        markers_list holds one (N, 2) array of Motive (x, y) coordinates per robot.
+        Returns three dicts keyed by the robot's index in markers_list:
+        placements - (row, column) of robots that are fully inside a cell (according to the tolerance, see add_robots)
+        partial - list of the (row, column) cells touched by robots that are not fully inside a cell
+        out_of_bounds - list of the markers' (y, x) cells in lab's coordinates, for robots with a marker out of bounds
+        """
+        placements, partial, out_of_bounds = {}, {}, {}
+        counts = np.array([len(markers) for markers in markers_list], dtype=np.int64)
+        if not counts.any():
+            # none of the robots has markers, so none of them is on the grid
+            out_of_bounds.update((index, []) for index in range(len(markers_list)))
+            return placements, partial, out_of_bounds
+
+        markers = np.concatenate(markers_list).reshape(-1, 2)
+        owners = np.repeat(np.arange(len(markers_list)), counts)
+
+        # same conversion as 'xy_to_cell' and 'marker_in_bound', for all the markers
+        lab_y = np.floor(markers[:, 0] / self.cell_size).astype(np.int64)
+        lab_x = (-np.floor(markers[:, 1] / self.cell_size)).astype(np.int64)
+        markers_in_bounds = (self.y_range[0] <= lab_y) & (lab_y <= self.y_range[1]) & \
+                            (self.x_range[0] <= lab_x) & (lab_x <= self.x_range[1])
+        # a robot is out of bounds if one of its markers is out of bounds (or it has no markers at all)
+        outside = np.bincount(owners, weights=~markers_in_bounds, minlength=len(markers_list)) > 0
+        outside |= counts == 0
+        for index in np.flatnonzero(outside).tolist():
+            in_robot = owners == index
+            out_of_bounds[index] = list(zip(lab_y[in_robot].tolist(), lab_x[in_robot].tolist()))
+
+        # count the markers of every (robot, grid cell) pair of the robots that are in bounds
+        inside = ~outside[owners]
+        cells = (self.y_range[1] - lab_y[inside]) * self.cols + (lab_x[inside] - self.x_range[0])
+        keys = owners[inside] * (self.rows * self.cols) + cells
+        keys, first_seen, cell_counts = np.unique(keys, return_index=True, return_counts=True)
+        key_owners, key_cells = np.divmod(keys, self.rows * self.cols)
+
+        # the mode cell of each robot is its most common cell, ties go to the cell seen first (as statistics.mode)
+        order = np.lexsort((first_seen, -cell_counts, key_owners))
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = key_owners[order][1:] != key_owners[order][:-1]
+        mode_keys = order[is_first]
+        robots_ids = key_owners[mode_keys]
+        mode_counts = cell_counts[mode_keys]
+        markers_counts = counts[robots_ids]
+
+        # all markers are in one cell,
+        # or all markers but one are in the same cell and tolerance is 1,
+        # or majority markers are in the same cell and tolerance is 2
+        is_full = (mode_counts == markers_counts) | \
+            ((mode_counts >= markers_counts - 1) & (tolerance == 1)) | \
+            ((mode_counts >= markers_counts / 2) & (tolerance == 2))
+
+        rows, cols = np.divmod(key_cells, self.cols)
+        for robot, full, mode_key in zip(robots_ids.tolist(), is_full.tolist(), mode_keys.tolist()):
+            if full:
+                placements[robot] = (int(rows[mode_key]), int(cols[mode_key]))
+        for robot, row, col in zip(key_owners.tolist(), rows.tolist(), cols.tolist()):
+            if robot not in placements:
+                partial.setdefault(robot, []).append((row, col))
+        return placements, partial, out_of_bounds
 
     def xy_to_cell(self, loc):
         """
@@ -446,23 +775,25 @@ class Grid:
                 with open(self.scenfile, 'r') as scen_file:
                     print("Loading (ONLY) goal locations from .scen file.")
                     print("Note that a new .scen and .map files would be generated (overwritten previous files).")
+                    used_goals = {tuple(goal) for goal in self.end_bots.values()}
                     for line in scen_file:
                         if line[0] == 'v':  # .scen file convension (skip line)
                             continue
                         data = line.split('\t')
                         if data[0] in self.bots:
-                            if not self.check_goal_validity((int(data[7]), int(data[6])), data[0]):
+                            if not self.check_goal_validity((int(data[7]), int(data[6])), data[0], used_goals):
                                 # proper message to user about bad goal is provided inside the check method
                                 self.end_bots = {}
                                 return
                             else:
                                 self.end_bots[data[0]] = [int(data[7]), int(data[6])]
+                                used_goals.add((int(data[7]), int(data[6])))
                                 print(f"Goal for robot {data[0]} is: ({int(data[7])}, {int(data[6])})")
 
                     self.generate_map_file()
                     print("Map generated (.map file)")
-                    self.generate_scen_file()
-                    print("Scene generated (.scen file)")
+                    if self.generate_scen_file():
+                        print("Scene generated (.scen file)")
             except IOError as e:
                 print(f"Couldn't open file: {e}.")
         else:
@@ -481,21 +812,23 @@ class Grid:
                 with open(self.end_locations_file, 'r') as txt_file:
                     # read goal locations from file
                     print("Loading goal locations from file and generating new scenario (.scen and .map files).")
+                    used_goals = {tuple(goal) for goal in self.end_bots.values()}
                     for line in txt_file:
                         data = line.split('   ')  # python doesn't recognize tab characters for some reason
                         if data[0] in self.bots:
-                            if not self.check_goal_validity((int(data[2]), int(data[1])), data[0]):
+                            if not self.check_goal_validity((int(data[2]), int(data[1])), data[0], used_goals):
                                 # proper message to user about bad goal is provided inside the check method
                                 self.end_bots = {}
                                 return
                             else:
                                 self.end_bots[data[0]] = [int(data[2]), int(data[1])]
+                                used_goals.add((int(data[2]), int(data[1])))
                                 print(f"Goal for robot {data[0]} is: ({int(data[2])}, {int(data[1])})")
 
                 self.generate_map_file()
                 print("Map generated (.map file)")
-                self.generate_scen_file()
-                print("Scene generated (.scen file)")
+                if self.generate_scen_file():
+                    print("Scene generated (.scen file)")
 
             except IOError as e:
                 print(f"Couldn't open file: {e}.")
@@ -504,14 +837,14 @@ class Grid:
             print("No valid goals file was given to the program! \n"
                   "Use random goal locations generation or provide a valid goals file at command line args.")
 
-    def init_random_scene(self, from_scratch=True):
+    def init_random_scene(self, from_scratch=True, reachable=True):
         """
         Generates a .scen file of the projected scenario according to the scenario file conventions.
         Currently, we follow the conventions required to run the common benchmarks MAPF kit.
 
-        - from_scratch - specifies that new random end locations are required
-        TODO: check that this is actually what from_scratch does and that it works
-            (also when trying to get pre-defined end locations and from_scratch is False)
+        - from_scratch - specifies that new random end locations are required for all the robots,
+            otherwise only robots without end locations get new ones
+        - reachable - specifies that a robot's end location must be reachable from its location (see 'sample_goals')
         """
 
         self.generate_map_file()
@@ -523,34 +856,41 @@ class Grid:
                   "and won't be included in the scenario file: ", self.bad_bots)
 
         # this is relevant only if we changed the arena after already generating goal locations
-        # TODO: Not sure this is required
-        for key, value in self.end_bots.items():
-            if key not in self.bots:
-                self.end_bots.pop(key)
+        for key in [key for key in self.end_bots if key not in self.bots]:
+            self.end_bots.pop(key)
 
         # set goal locations
-        robots = sorted(self.bots.items())
-        for key, value in robots:
-            if from_scratch is False and key in self.end_bots:
+        robots = sorted(self.bots)
+        if from_scratch:
+            self.end_bots = {}
+        for key in robots:
+            if key in self.end_bots:
                 print("will pull goal location from already existing goal locations set for robot ", key)
-                # TODO: Not sure this is required
-            else:
-                print("Generating random goal location for robot ", key)
-                row, col = self.get_empty_spot()
-                self.end_bots[key] = [row, col]
-                self.end_bots[key] = [row, col]
+        new_goals = self.sample_goals([key for key in robots if key not in self.end_bots], reachable=reachable)
+        for key, goal in new_goals.items():
+            print("Generating random goal location for robot ", key)
+            self.end_bots[key] = goal
+
+        missing_goals = [key for key in robots if key not in self.end_bots]
+        if missing_goals:
+            print(f"No free goal location is left for robots {missing_goals}, scenario was not generated")
+            return
 
         # write scenario to .scen file
-        self.generate_scen_file()
+        if not self.generate_scen_file():
+            return
 
         self.has_paths = False
         print("Scenario file generated (.scen file)")
 
-    def check_goal_validity(self, goal_loc, robot_id):
+    def check_goal_validity(self, goal_loc, robot_id, used_goals=None):
         """
-        Checks that a goal location is in bounds and free of obstacles and other goals.
+        Checks that a goal location is in bounds, free of obstacles and other goals, and reachable from the robot.
         Expects goal location in form (row, column).
+        used_goals: set of (row, column) goals that are already used, taken from end_bots if not given
         """
+        if used_goals is None:
+            used_goals = {tuple(goal) for goal in self.end_bots.values()}
         row, col = goal_loc
         if row < 0 or row >= self.rows or col < 0 or col >= self.cols:
             print(f"Goal location for robot {robot_id} is out of bounds... Abort!")
@@ -558,18 +898,34 @@ class Grid:
         elif self.grid[row][col] != 0:
             print(f"Goal location for robot {robot_id} is not available... Abort!")
             return False
-        elif [row, col] in self.end_bots.values():
+        elif (row, col) in used_goals:
             print(f"Goal location for robot {robot_id} is already used for another robot... Abort!")
             return False
+        elif robot_id in self.bots and not self.is_reachable(self.bots[robot_id], (row, col)):
+            print(f"Goal location for robot {robot_id} is not reachable from its location... Abort!")
+            return False
 
         return True
 
     def generate_scen_file(self):
         """
         Generates a .scen file with all scenario data, given that goal locations already been chosen
-        (either randomly, from .scen or file)
+        (either randomly, from .scen or file).
+        Returns False (and leaves the file untouched) if a robot has no path to its goal, since the solver
+        can not read a scenario without its optimal lengths
         """
         robots = sorted(self.bots.items())
+        # all the robots move on the same occupancy, it is hashed once for the distance fields cache
+        passable = ~self.blocked_layer()
+        occupancy_key = distance_fields.occupancy_key(passable)
+        lengths = {key: self.get_optimal_length((value[0], value[1]), tuple(self.end_bots[key]),
+                                                passable=passable, key=occupancy_key)
+                   for key, value in robots}
+        no_path = [key for key, length in lengths.items() if length is None]
+        if no_path:
+            print(f"Robots {no_path} have no path to their goal locations, scenario file was not generated")
+            return False
+
         with open(self.scenfile, "w") as f:
             f.write("version 1\n")  # scenario file convention
             for key, value in robots:
@@ -584,7 +940,8 @@ class Grid:
                 # goal location
                 row, col = self.end_bots[key]
                 f.write(str(col) + '\t' + str(row) + '\t')
-                f.write(f'{self.get_optimal_length((value[0], value[1]), (row, col))}\n')
+                f.write(f'{lengths[key]}\n')
+        return True
 
     def broadcast_solution(self):
         """
@@ -613,87 +970,64 @@ class Grid:
             f.write("width " + str(self.cols) + '\n')
             f.write("map\n")
 
-            # write the map to file row-by-row
-            for i in range(int(self.rows)):
-                for j in range(int(self.cols)):
-                    if self.grid[i][j] == CellVal.OBSTACLE_ART.value or self.grid[i][j] == CellVal.OBSTACLE_REAL.value:
-                        f.write('@')  # blocked cell
-                    else:
-                        f.write('.')  # free cell
-                f.write('\n')
-
-    def get_empty_spot(self):
-        """
-        Returns a random empty cell on the grid.
-        Also checks that it has not been generated before.
-        """
-        while True:  # choose within borders of arena (in lab's coords, later translated to grid coords)
-            try_x = random.randint(self.x_range[0], self.x_range[1])
-            try_y = random.randint(self.y_range[0], self.y_range[1])
-            try_grid_cell = self.cell_to_grid_cell((try_y, try_x))
-
-            if self.grid[try_grid_cell[0]][try_grid_cell[1]] != 0:
-                continue
-            for coord in self.endspots:  # make sure no two goal locations are aligned
-                if coord[1] == try_grid_cell[1] and coord[0] == try_grid_cell[0]:
-                    continue
-            break
-        self.endspots.append([try_grid_cell[0], try_grid_cell[1]])
-        return try_grid_cell
-
-    def get_optimal_length(self, loc1, loc2):
-        """
-        Returns the shortest distance between two location on the grid using A* algorithm.
-        """
-        res = astar.find_path(loc1, loc2,
-                              neighbors_fnct=lambda loc: self.neighbors(loc, diagonal_moves=False),
-                              heuristic_cost_estimate_fnct=self.heuristic,
-                              distance_between_fnct=self.distance)
-        path = list(res)
-        # calculate path's total distance
-        dist = 0
-        prev = path[0]
-        for p in path[1:]:
-            dist += self.distance(prev, p)
-            prev = p
-
-        return dist
-
-    def neighbors(self, loc, diagonal_moves=False):
-        moves = [
-            np.array([0, 1]),
-            np.array([1, 0]),
-            np.array([0, -1]),
-            np.array([-1, 0])
-        ]
-        if diagonal_moves:
-            moves += [
-                np.array([1, 1]),
-                np.array([-1, 1]),
-                np.array([1, -1]),
-                np.array([-1, -1])
-            ]
-        neighbors = []
-        for move in moves:
-            new_loc = np.array(loc) + move
-            if 0 <= new_loc[0] <= self.rows-1 and \
-                    0 <= new_loc[1] <= self.cols-1 and \
-                    self.grid[new_loc[0]][new_loc[1]] == 0:
-                neighbors.append(tuple(new_loc))
-
-        return neighbors
+            # write the map to file row-by-row, '@' for a blocked cell and '.' for a free cell
+            for row in np.where(self.blocked_layer(), '@', '.'):
+                f.write(''.join(row) + '\n')
 
-    def heuristic(self, loc, goal):
+    def sample_goals(self, robot_ids, reachable=False):
         """
-        Currently using the Euclidean distance to the goal as heuristic
+        Returns a dictionary that maps each of the given robots to a random goal location [row, column].
+        The goals are sampled without replacement from the index of free cells - empty cells that are not
+        the goals of other robots - so no two robots get the same goal.
+        If reachable is True, a robot's goal is sampled only from the free cells in its connected component
+        (see 'get_components'), so it can reach it from its location.
+        Robots that no goal is left for are missing from the dictionary.
         """
-        return np.linalg.norm(np.array(loc)-np.array(goal), 2)
-
-    def distance(self, loc1, loc2):
+        free = self.grid == CellVal.EMPTY.value
+        for key, (row, col) in self.end_bots.items():
+            if key not in robot_ids:
+                free[row, col] = False
+        free_cells = np.flatnonzero(free)
+
+        goals = {}
+        if not reachable:
+            chosen = random.sample(range(len(free_cells)), min(len(robot_ids), len(free_cells)))
+            for robot_id, i in zip(robot_ids, chosen):
+                goals[robot_id] = list(divmod(int(free_cells[i]), self.cols))
+            return goals
+
+        # the free cells of every component in a random order, each robot takes the next cell of its component
+        labels = self.get_components().labels.ravel()
+        free_cells = free_cells.tolist()
+        random.shuffle(free_cells)
+        components_cells = {}
+        for cell in free_cells:
+            components_cells.setdefault(labels[cell], []).append(cell)
+        for robot_id in robot_ids:
+            row, col = self.bots[robot_id]
+            cells = components_cells.get(labels[row * self.cols + col])
+            if cells:
+                goals[robot_id] = list(divmod(cells.pop(), self.cols))
+        return goals
+
+    def get_optimal_length(self, loc1, loc2, diagonal_moves=False, passable=None, key=None):
         """
-        Euclidean distance between two locations on the grid
+        Returns the shortest distance between two location on the grid, where only the cells blocked by obstacles
+        can not be moved into (None if there is no path). Like in the .map file and in 'is_reachable',
+        robots are not obstacles.
+        With 4 neighbors moves it is read from the distance field of loc2, which is computed once for the current
+        occupancy and cached (see src.grid_search.DistanceFieldCache). With diagonal moves A* is used.
+        passable, key: the grid's passable cells and their occupancy key, if they were already computed
+        for many lengths (see 'generate_scen_file')
         """
-        return np.linalg.norm(np.array(loc1)-np.array(loc2), 2)
+        if passable is None:
+            passable = ~self.blocked_layer()
+        if diagonal_moves:
+            length = GridGraph(passable, diagonal_moves=True).shortest_path_length(loc1, loc2)
+            return None if length is None else float(length)
+
+        length = distance_fields.get(passable, loc2, key=key)[loc1[0], loc1[1]]
+        return None if length < 0 else float(length)
 
     def marker_in_bound(self, marker_cell):
         """
@@ -702,27 +1036,6 @@ class Grid:
         return (self.y_range[1] >= marker_cell[0] >= self.y_range[0]) \
                and (self.x_range[1] >= marker_cell[1] >= self.x_range[0])
 
-    def set_robot_cell_color(self, robot_id, mode_cell):
-        """
-        Sets a robot's cell color according to the actual situation
-        """
-        grid_cell = self.cell_to_grid_cell(mode_cell)  # convert to grid cell coordinates
-
-        # first, check if we have a collision with obstacle or other robot (that already been added).
-        # NOTE that we count on that that the obstacles were processed before (call to 'add_obstacles')
-        is_collide = self.check_collisions(grid_cell)
-
-        if not is_collide:
-            # set grid cell color
-            if self.grid[grid_cell[0]][grid_cell[1]] == CellVal.EMPTY.value:
-                self.grid[grid_cell[0]][grid_cell[1]] = CellVal.ROBOT_FULL.value
-            elif self.grid[grid_cell[0]][grid_cell[1]] == CellVal.OBSTACLE_REAL.value:
-                self.grid[grid_cell[0]][grid_cell[1]] = CellVal.COLLISION.value
-
-        # otherwise, no need to change cell's color,
-        # since it has been updated inside 'check_collisions' for collision color
-        self.bots[robot_id] = [grid_cell[0], grid_cell[1]]
-
 
 if __name__ == "__main__":
     print("Main function not implemented")
@@ -1,6 +1,7 @@
 ﻿import time
 
-from natnet import MotionListener, MotionClient
+from natnet import MotionListener, MotionClient, FrameSection
+from src.pipeline import LatestValue, FrameSnapshot
 import requests
 from enum import Enum
 
@@ -16,17 +17,30 @@ class ListenerType(Enum):
 class Listener(MotionListener):
     """
     A class of callback functions that are invoked with information from NatNet server.
+    By default only rigid bodies and marker sets are consumed (this is all the arena reads),
+    other sections can be requested with `sections`.
+    Every frame is also published as an immutable FrameSnapshot to `snapshots`, for consumers on other threads.
+    With `batch_receive`, all the pending frames are drained on every wake-up and only the newest is decoded
+    (see natnet.MotionClient, its counters are in `client.receive_stats`).
     """
-    def __init__(self, type=ListenerType.Remote):
+    sections = frozenset([FrameSection.RigidBodies, FrameSection.MarkerSets])
+
+    def __init__(self, type=ListenerType.Remote, array_frames=False, sections=None, batch_receive=False):
         super(Listener, self).__init__()
+        if sections is not None:
+            self.sections = frozenset(sections)
         self.bodies = []
         self.labeled_markers = []
         self.unlabeled_markers = []
         self.marker_sets = []
+        self.frame = None  # latest ArrayFrame, only set when array_frames is True
+        self.snapshots = LatestValue()  # latest FrameSnapshot, published from the NatNet decode thread
         if type == ListenerType.Local:
-            self.client = MotionClient(self, ip_local='127.0.0.1')
+            self.client = MotionClient(self, ip_local='127.0.0.1', array_frames=array_frames,
+                                       batch_receive=batch_receive)
         else:
-            self.client = MotionClient(self, ip_local=self.get_public_ip(), ip_multicast=BROADCAST_IP, ip_server=SERVER_IP)
+            self.client = MotionClient(self, ip_local=self.get_public_ip(), ip_multicast=BROADCAST_IP,
+                                       ip_server=SERVER_IP, array_frames=array_frames, batch_receive=batch_receive)
 
     def start(self):
         self.client.get_data()
@@ -60,6 +74,19 @@ class Listener(MotionListener):
     def on_marker_sets(self, marker_sets, time_info):
         self.marker_sets = marker_sets
 
+    def on_frame_end(self, frame_number, time_info):
+        self.snapshots.publish(FrameSnapshot(frame_number, tuple(self.bodies), tuple(self.marker_sets),
+                                             timestamp=time_info.timestamp))
+
+    def on_array_frame(self, frame):
+        # marker sets positions are array views, robots' bodies are still served as RigidBody elements
+        self.frame = frame
+        self.unlabeled_markers = frame.unlabeled_markers
+        self.marker_sets = frame.marker_sets()
+        self.bodies = frame.rigid_bodies()
+        self.snapshots.publish(FrameSnapshot(frame.frame_number, tuple(self.bodies), tuple(self.marker_sets),
+                                             timestamp=frame.time_info.timestamp, body_records=frame.bodies))
+
 
 if __name__ == '__main__':
     # Create listener
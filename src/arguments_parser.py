@@ -12,6 +12,9 @@ class ArgumentsParser:
                                                        "SMALL := 2.5x2.5, MEDIUM := 3x6, LARGE := 4.5x7 (height x width),"
                                                        "with cell size 0.3m.\n"
                                                        "Ignores any other arena configurations that where provided.")
+        parser.add_argument("-e", "--epsilon", type=float, help="Minimal movement (in meters) of an obstacle's or a "
+                                                                "robot's markers for updating it on the grid, "
+                                                                "default is 0.005m.")
 
         # scenario args
         parser.add_argument("-g", "--goals", help="Goals location file name for loading defined goals.")
@@ -24,9 +27,36 @@ class ArgumentsParser:
                                                   "Note that if a file with the same name already exists, "
                                                   "it'll be overwritten.")
 
+        # pipeline args
+        parser.add_argument("-r", "--rate", type=float, help="Rate (messages per second) of broadcasting the robots' "
+                                                             "data over UDP, default is 10.")
+        parser.add_argument("-f", "--format", choices=["json", "binary"], help="Format of the robots' data messages "
+                                                                               "broadcast over UDP, default is json.")
+        parser.add_argument("--delta", action="store_true", help="Broadcast only the robots that moved since the "
+                                                                 "previous messages (with a keyframe of all the "
+                                                                 "robots from time to time, or when a client lost "
+                                                                 "a message).")
+        parser.add_argument("--multicast", help="A multicast group (<ip>:<port>) to broadcast the robots' data to, "
+                                                "in addition to the subscribed clients.")
+        parser.add_argument("-q", "--quiet", action="store_true", help="Do not print every message broadcast over "
+                                                                       "UDP, only a summary once a second.")
+        parser.add_argument("--fps", type=int, help="Rate (frames per second) of drawing the screen, default is 30.")
+
         # solver args
         parser.add_argument("-S", "--solver", help="A complete command for executing the MAPF solver, "
-                                                   "default behavior is to run a vanilla CBS solver")
+                                                   "default behavior is to run a vanilla CBS solver.\n"
+                                                   "The command may include the fields {map}, {scen}, {paths}, "
+                                                   "{agents} and {timeout}, which are filled in for each run.\n"
+                                                   "'prioritized' runs the built-in prioritized planner instead.")
+        parser.add_argument("-t", "--timeout", type=float, help="Time limit (in seconds) for the MAPF solver, "
+                                                                "default is 60s.")
+        parser.add_argument("--cache-size", type=int, help="Number of solver outputs kept for reusing when the same "
+                                                           "instance is solved again, default is 64 (0 disables).")
+        parser.add_argument("-P", "--portfolio", nargs='+', help="More MAPF solvers (in the format of --solver) to run "
+                                                                 "concurrently with the solver, the first valid "
+                                                                 "solution is used and the other solvers are stopped.")
+        parser.add_argument("--deadline", type=float, help="Time (in seconds) to keep the portfolio of solvers "
+                                                           "running for the best solution, instead of the first one.")
 
         args = parser.parse_args()
 
@@ -40,8 +70,23 @@ class ArgumentsParser:
             self.cell_size = 0.3 if not args.cell else float(args.cell)
             self.height = 3.0 if not args.height else float(args.height)
             self.width = 6.0 if not args.width else float(args.width)
+        self.epsilon = 0.005 if args.epsilon is None else float(args.epsilon)
+        self.rate = 10.0 if not args.rate else float(args.rate)
+        self.fps = 30 if not args.fps else int(args.fps)
+        self.format = "json" if not args.format else args.format
+        self.delta = args.delta
+        self.quiet = args.quiet
+        if args.multicast:
+            multicast_ip, multicast_port = args.multicast.rsplit(':', 1)
+            self.multicast = (multicast_ip, int(multicast_port))
+        else:
+            self.multicast = None
 
         self.goals = "" if not args.goals else args.goals
         self.map = "map.map" if not args.map else args.map
         self.scene = "scene.scen" if not args.scene else args.scene
         self.solver = "default" if not args.solver else args.solver
+        self.timeout = 60.0 if not args.timeout else float(args.timeout)
+        self.cache_size = 64 if args.cache_size is None else int(args.cache_size)
+        self.portfolio = [] if not args.portfolio else args.portfolio
+        self.deadline = args.deadline
@@ -1,6 +1,7 @@
 import pygame
 
 from src.globals import HOVER_GRAY_COLOR, BLACK
+from src.text_cache import text_cache
 
 
 class Button:
@@ -15,17 +16,23 @@ class Button:
         self.dim_x = (self.pos[0], self.pos[0] + self.size[0])
         self.dim_y = (self.pos[1], self.pos[1] + self.size[1])
 
-        self.font = pygame.font.SysFont("Arial", font_size, bold=True)
+        self.font = "Arial"
+        self.font_size = font_size
+        self.hovered = None  # hover state of the button when it was last drawn (None if it was never drawn)
 
-    def show(self):
+    def show(self, force=False):
         """
         draws a button to screen.
         if the mouse is on the button then makes an hover effect.
+        the button is drawn only if its hover state changed since it was last drawn, or if force is True.
+        Returns the list of rectangles on screen that were changed (to pass to pygame.display.update)
         """
-        mouse = pygame.mouse.get_pos()
+        hovered = self.is_hover()
+        if hovered == self.hovered and not force:
+            return []
+        self.hovered = hovered
 
-        if self.pos[0] <= mouse[0] <= self.pos[0] + self.size[0] and \
-                self.pos[1] <= mouse[1] <= self.pos[1] + self.size[1]:
+        if hovered:
             # HOVER effect on button
             pygame.draw.rect(self.surface, HOVER_GRAY_COLOR, [self.pos[0], self.pos[1],
                                                         self.size[0], self.size[1]],
@@ -38,11 +45,13 @@ class Button:
         # required for multiple lines text in button
         y = self.pos[1] + self.size[1] / 2 if len(self.text) == 1 else self.pos[1] + self.size[1] / 2.5
         for line in self.text:
-            text = self.font.render(line, True, BLACK)  # define text in black
+            text = text_cache.render(line, self.font, self.font_size, BLACK, bold=True)  # define text in black
             text_rect = text.get_rect(center=(self.pos[0] + self.size[0] / 2, y))
             self.surface.blit(text, text_rect)
             y += text_rect.height
 
+        return [pygame.Rect(self.pos, self.size)]
+
     def is_hover(self):
         mouse = pygame.mouse.get_pos()
         return self.dim_x[0] <= mouse[0] <= self.dim_x[1] and self.dim_y[0] <= mouse[1] <= self.dim_y[1]
\ No newline at end of file
@@ -0,0 +1,248 @@
+import hashlib
+import heapq
+import math
+
+import numpy as np
+
+from collections import OrderedDict
+from threading import Lock
+
+# (row, column) offsets of the moves to the 4 neighbors of a cell, followed by the 4 diagonal moves
+MOVES = np.array([[0, 1], [1, 0], [0, -1], [-1, 0], [1, 1], [-1, 1], [1, -1], [-1, -1]])
+SQRT2 = math.sqrt(2)
+
+
+class GridGraph:
+    """
+    The graph of a grid for shortest path queries.
+    Nodes are the indices of the cells (row * cols + column), and the neighbors of every cell are computed once
+    from the occupancy array, so a search does only integer lookups and heap operations.
+    A move costs 1 (or sqrt(2) if diagonal), and may end only in a passable cell.
+    """
+
+    def __init__(self, passable, diagonal_moves=False):
+        """
+        passable: boolean array in the grid's shape, True for the cells that can be moved into
+        diagonal_moves: if True, the diagonal neighbors of a cell are neighbors too
+        """
+        passable = np.asarray(passable, dtype=bool)
+        self.rows, self.cols = passable.shape
+        self.passable = passable.ravel()
+        self.diagonal_moves = diagonal_moves
+        self.neighbors = self.__neighbors(MOVES if diagonal_moves else MOVES[:4])
+
+    def __neighbors(self, moves):
+        # (cells, moves) arrays of the cells that every move leads to, and whether the move is possible
+        rows, cols = np.divmod(np.arange(self.rows * self.cols), self.cols)
+        to_rows = rows[:, None] + moves[:, 0]
+        to_cols = cols[:, None] + moves[:, 1]
+        valid = (to_rows >= 0) & (to_rows < self.rows) & (to_cols >= 0) & (to_cols < self.cols)
+        to_cells = np.where(valid, to_rows * self.cols + to_cols, 0)
+        valid &= self.passable[to_cells]
+
+        costs = [1 if abs(row) + abs(col) == 1 else SQRT2 for row, col in moves.tolist()]
+        neighbors = [[] for cell in range(self.rows * self.cols)]
+        for cell, move in zip(*np.nonzero(valid)):
+            neighbors[cell].append((int(to_cells[cell, move]), costs[move]))
+        return neighbors
+
+    def index(self, loc):
+        """
+        Returns the node of a (row, column) location
+        """
+        return int(loc[0]) * self.cols + int(loc[1])
+
+    def heuristic(self, cell, goal):
+        """
+        Returns the exact distance between two cells on an empty grid:
+        Manhattan distance for 4 neighbors moves, octile distance with diagonal moves
+        """
+        d_row = abs(cell // self.cols - goal // self.cols)
+        d_col = abs(cell % self.cols - goal % self.cols)
+        if not self.diagonal_moves:
+            return d_row + d_col
+        return max(d_row, d_col) + (SQRT2 - 1) * min(d_row, d_col)
+
+    def shortest_path_length(self, start, goal):
+        """
+        Returns the length of the shortest path between two (row, column) locations using A*
+        (the start may be impassable), or None if there is no path
+        """
+        start, goal = self.index(start), self.index(goal)
+        if start == goal:
+            return 0
+
+        neighbors = self.neighbors
+        heuristic = self.heuristic
+        g_scores = {start: 0}
+        closed = bytearray(self.rows * self.cols)
+        # the entries are (f, -g, cell), ties of f are broken in favor of the deeper node.
+        # improved nodes are pushed again and their stale entries are skipped when popped (lazy deletion)
+        open_list = [(heuristic(start, goal), 0, start)]
+        while open_list:
+            f, g, cell = heapq.heappop(open_list)
+            if closed[cell]:
+                continue
+            if cell == goal:
+                return -g
+            closed[cell] = 1
+            g = -g
+            for neighbor, cost in neighbors[cell]:
+                tentative = g + cost
+                if not closed[neighbor] and tentative < g_scores.get(neighbor, math.inf):
+                    g_scores[neighbor] = tentative
+                    heapq.heappush(open_list, (tentative + heuristic(neighbor, goal), -tentative, neighbor))
+        return None
+
+
+def distance_field(passable, goal):
+    """
+    Returns the distances (int32 array in the grid's shape) from every cell to the goal (row, column) with moves
+    to the 4 neighbors, -1 for cells that can not reach it. Like in GridGraph, a move may end only in a passable
+    cell, so impassable cells may have a distance (as starts) but no path goes through them.
+    Computed with a single breadth first search from the goal, a level of the search at a time.
+    """
+    passable = np.asarray(passable, dtype=bool)
+    distances = np.full(passable.shape, -1, dtype=np.int32)
+    distances[goal] = 0
+    frontier = np.zeros(passable.shape, dtype=bool)
+    frontier[goal] = passable[goal]
+    distance = 0
+    while frontier.any():
+        distance += 1
+        reached = np.zeros(passable.shape, dtype=bool)
+        reached[1:, :] |= frontier[:-1, :]
+        reached[:-1, :] |= frontier[1:, :]
+        reached[:, 1:] |= frontier[:, :-1]
+        reached[:, :-1] |= frontier[:, 1:]
+        reached &= distances < 0
+        distances[reached] = distance
+        frontier = reached & passable
+    return distances
+
+
+class DistanceFieldCache:
+    """
+    A cache of distance fields (see 'distance_field'), keyed by the occupancy they were computed on and their goal.
+    After the first query of a goal, the distance from any cell to it is a lookup - until the occupancy changes.
+    Used for optimal lengths of scenarios and as heuristic tables of the planners.
+    """
+
+    def __init__(self, max_size=256):
+        """
+        max_size: the maximal number of distance fields to keep, the least recently used are evicted
+        """
+        self.max_size = max_size
+        self.fields = OrderedDict()  # maps (occupancy key, goal) to a read-only distance field, in LRU order
+        self._lock = Lock()  # the cache is shared by the grid's thread and the planners' threads
+
+    @staticmethod
+    def occupancy_key(passable):
+        """
+        Returns the key of an occupancy: its shape and a hash of its cells
+        """
+        passable = np.asarray(passable, dtype=bool)
+        return passable.shape, hashlib.sha1(np.packbits(passable).tobytes()).hexdigest()
+
+    def get(self, passable, goal, key=None):
+        """
+        Returns the distance field of the goal (row, column) on the occupancy, computing it only if it is not cached.
+        key: the occupancy's key, if it was already computed (see 'occupancy_key')
+        """
+        goal = (int(goal[0]), int(goal[1]))
+        cache_key = (key or self.occupancy_key(passable), goal)
+        with self._lock:
+            field = self.fields.get(cache_key)
+            if field is not None:
+                self.fields.move_to_end(cache_key)
+                return field
+
+        field = distance_field(passable, goal)
+        field.flags.writeable = False  # shared by all the callers
+        with self._lock:
+            self.fields[cache_key] = field
+            while len(self.fields) > self.max_size:
+                self.fields.popitem(last=False)
+        return field
+
+    def clear(self):
+        with self._lock:
+            self.fields.clear()
+
+
+# the cache that is shared by the grid and the planners
+distance_fields = DistanceFieldCache()
+
+
+class ConnectedComponents:
+    """
+    Labels the connected components (with moves to the 4 neighbors) of the free cells of an occupancy,
+    so whether a cell can be reached from another is a lookup.
+    The labeling is kept up to date as the occupancy changes: cells that were freed are merged into the components
+    around them (union-find), and only when cells become blocked - which may split a component - all the cells
+    are labeled again.
+    """
+
+    def __init__(self):
+        self.blocked = None  # the occupancy that the components were labeled for
+        self.parents = None  # union-find parent of every cell (index row * cols + column)
+        self.labels = None  # array in the grid's shape, the component of every free cell and -1 for blocked cells
+
+    def update(self, blocked):
+        """
+        Updates the components to the given occupancy (boolean array in the grid's shape, True for blocked cells),
+        and returns the labels array
+        """
+        blocked = np.array(blocked, dtype=bool)
+        if self.blocked is None or blocked.shape != self.blocked.shape or (blocked & ~self.blocked).any():
+            self.blocked = blocked
+            self.parents = list(range(blocked.size))
+            free = ~blocked
+            cells = np.arange(blocked.size).reshape(blocked.shape)
+            # pairs of neighboring free cells, in rows and in columns
+            horizontal = free[:, :-1] & free[:, 1:]
+            vertical = free[:-1, :] & free[1:, :]
+            pairs = zip(np.concatenate([cells[:, :-1][horizontal], cells[:-1, :][vertical]]).tolist(),
+                        np.concatenate([cells[:, 1:][horizontal], cells[1:, :][vertical]]).tolist())
+        elif (self.blocked & ~blocked).any():
+            freed = np.flatnonzero(self.blocked & ~blocked).tolist()
+            self.blocked = blocked
+            rows, cols = blocked.shape
+            free = ~blocked.ravel()
+            pairs = [(cell, neighbor) for cell in freed
+                     for neighbor, valid in ((cell - cols, cell >= cols), (cell + cols, cell < (rows - 1) * cols),
+                                             (cell - 1, cell % cols > 0), (cell + 1, cell % cols < cols - 1))
+                     if valid and free[neighbor]]
+        else:
+            return self.labels
+
+        for cell, neighbor in pairs:
+            self.__union(cell, neighbor)
+        # the root of every cell is its label
+        roots = np.array(self.parents)
+        while True:
+            grand_parents = roots[roots]
+            if np.array_equal(grand_parents, roots):
+                break
+            roots = grand_parents
+        self.labels = np.where(blocked.ravel(), -1, roots).reshape(blocked.shape)
+        return self.labels
+
+    def is_reachable(self, loc1, loc2):
+        """
+        Returns True if the (row, column) locations are free cells in the same component
+        """
+        label = self.labels[loc1[0], loc1[1]]
+        return label >= 0 and label == self.labels[loc2[0], loc2[1]]
+
+    def __find(self, cell):
+        parents = self.parents
+        while parents[cell] != cell:
+            parents[cell] = parents[parents[cell]]  # path halving
+            cell = parents[cell]
+        return cell
+
+    def __union(self, cell1, cell2):
+        root1, root2 = self.__find(cell1), self.__find(cell2)
+        if root1 != root2:
+            self.parents[max(root1, root2)] = min(root1, root2)
@@ -1,5 +1,6 @@
 from natnet import RigidBody, Position, Rotation, MarkerSet
 from natnet.protocol import MarkerSetType
+from src.pipeline import LatestValue, FrameSnapshot
 
 
 class ListenerMock:
@@ -9,6 +10,14 @@ class ListenerMock:
         # initialize mock variables for test
         self.bodies = bodies
         self.marker_sets = marker_sets
+        self.snapshots = LatestValue()
+        self.frame_number = 0
+        self.publish()
+
+    def publish(self):
+        # publish the mock state as a new frame
+        self.frame_number += 1
+        self.snapshots.publish(FrameSnapshot(self.frame_number, tuple(self.bodies), tuple(self.marker_sets)))
 
     def start(self):
         pass
@@ -19,10 +28,12 @@ class ListenerMock:
     def update_body(self, new_body, idx):
         # print('RigidBodies {}'.format(bodies))
         self.bodies[idx] = new_body
+        self.publish()
 
     def update_marker_set(self, new_marker_set, idx):
         # print('RigidBodies {}'.format(bodies))
         self.marker_sets[idx] = new_marker_set
+        self.publish()
 
 
 """
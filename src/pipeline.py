@@ -0,0 +1,133 @@
+import time
+import traceback
+from collections import namedtuple
+from threading import Thread, Condition, Event
+
+# An immutable view of one motion capture frame, published by the listener from the NatNet decode thread.
+# bodies and marker_sets are tuples, and the elements in them must not be modified by consumers.
+# timestamp: of the frame (seconds since Motive started), body_records: the bodies as a structured array of
+# natnet.arrays.BODY_DTYPE records when the frame was decoded to arrays (None otherwise)
+FrameSnapshot = namedtuple('FrameSnapshot', ['frame_number', 'bodies', 'marker_sets', 'timestamp', 'body_records'],
+                           defaults=(0.0, None))
+
+# An immutable view of the grid, published by the state thread for rendering (see Grid.get_view)
+# grid: composed uint8 grid with goals, labels: maps (row, column) to a robot id, paths: solution paths to draw
+GridView = namedtuple('GridView', ['grid', 'labels', 'paths'])
+
+
+class LatestValue:
+    """
+    A slot holding the latest value published by a single producer thread.
+    Publishing replaces the (generation, value) pair with a single reference assignment, so readers never
+    block the producer and never see a partially updated value. Values that were not read before the next
+    publish are dropped - consumers always work on the newest one.
+    """
+
+    def __init__(self, value=None):
+        self._slot = (0, value)
+        self._condition = Condition()
+
+    def publish(self, value):
+        """
+        Replaces the value and wakes the consumers that wait for a new one
+        """
+        self._slot = (self._slot[0] + 1, value)
+        with self._condition:
+            self._condition.notify_all()
+
+    def get(self):
+        """
+        Returns the (generation, value) pair, generation counts the published values (0 if none was published)
+        """
+        return self._slot
+
+    def wait_newer(self, generation, timeout=None):
+        """
+        Waits until a value newer than the given generation is published, or until the timeout (in seconds) passes.
+        Returns the (generation, value) pair, which is the same generation on timeout
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._slot[0] != generation, timeout)
+        return self._slot
+
+
+class StateThread(Thread):
+    """
+    Maintains the grid: applies every newest frame snapshot and the commands submitted by the UI
+    to the planner controller, and publishes a view of the grid after each change.
+    This is the only thread that modifies the grid.
+    """
+
+    def __init__(self, planner_controller, snapshots, timeout=0.1):
+        """
+        planner_controller: the PlannerController that owns the grid
+        snapshots: LatestValue of FrameSnapshot elements
+        timeout: in seconds, the longest time to wait for a new frame before handling commands
+        """
+        super(StateThread, self).__init__(daemon=True)
+        self.planner_controller = planner_controller
+        self.snapshots = snapshots
+        self.timeout = timeout
+        self._stop_event = Event()
+
+    def run(self):
+        # the initial (empty) grid is drawn before the first frame arrives
+        self.planner_controller.views.publish(self.planner_controller.grid.get_view())
+        generation = 0
+        while not self._stop_event.is_set():
+            new_generation, snapshot = self.snapshots.wait_newer(generation, timeout=self.timeout)
+            try:
+                changed = self.planner_controller.run_commands()
+                if new_generation != generation and snapshot is not None:
+                    self.planner_controller.update_grid(snapshot)
+                    changed = True
+                if changed:
+                    self.planner_controller.views.publish(self.planner_controller.grid.get_view())
+            except Exception:
+                # keep maintaining the grid after a bad frame or a failed command
+                print('State thread error: {}'.format(traceback.format_exc()))
+            generation = new_generation
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class Broadcaster(Thread):
+    """
+    Sends the newest frame snapshot over the UDP server at a fixed rate, independently of rendering and planning.
+    """
+
+    def __init__(self, server, snapshots, encode, rate=10.0, delay=0.0):
+        """
+        server: a started UDPServer
+        snapshots: LatestValue of FrameSnapshot elements
+        encode: a function that converts a FrameSnapshot to the message to send
+        rate: messages per second
+        delay: in seconds, time to wait before the first message (for the server to stabilize)
+        """
+        super(Broadcaster, self).__init__(daemon=True)
+        self.server = server
+        self.snapshots = snapshots
+        self.encode = encode
+        self.period = 1.0 / rate
+        self.delay = delay
+        self._stop_event = Event()
+
+    def run(self):
+        self._stop_event.wait(self.delay)
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            generation, snapshot = self.snapshots.get()
+            if snapshot is not None:
+                self.server.update_data(self.encode(snapshot))
+                self.server.send_data()
+
+            # sleep until the next tick, skipping ticks that were missed instead of bursting to catch up
+            next_time += self.period
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            self._stop_event.wait(next_time - now)
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import shutil
+
+
+class PlannerCache:
+    """
+    An on-disk cache of solver outputs (_paths.txt files), keyed by the content of the instance they solve.
+    Every entry is a file named after its key in the cache directory, and its modification time is the last time
+    it was used - when there are more than max_entries files, the least recently used ones are removed.
+    """
+
+    def __init__(self, directory, max_entries=64):
+        """
+        directory: where cached outputs are kept (created if missing)
+        max_entries: the maximal number of cached outputs, 0 disables the cache
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(map_filename, scen_filename, command, agents):
+        """
+        Returns the key of a solver run: a hash of the .map and .scen files' contents, the solver command
+        and the number of agents
+        """
+        digest = hashlib.sha256()
+        for filename in (map_filename, scen_filename):
+            with open(filename, 'rb') as f:
+                digest.update(f.read())
+            digest.update(b'\0')
+        digest.update(command.encode('utf-8') + b'\0')
+        digest.update(str(agents).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the name of the cached output file of the given key, or None if it is not cached
+        """
+        if not self.max_entries:
+            return None
+        filename = self.__filename(key)
+        if not os.path.exists(filename):
+            return None
+        os.utime(filename)  # mark as recently used
+        return filename
+
+    def put(self, key, paths_filename):
+        """
+        Saves a copy of the given output file for the key, and evicts the least recently used outputs
+        """
+        if not self.max_entries:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # copied under a temporary name first, so an entry is never read half written
+        filename = self.__filename(key)
+        shutil.copyfile(paths_filename, filename + '.tmp')
+        os.replace(filename + '.tmp', filename)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used outputs until there are at most max_entries of them
+        """
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                   if name.endswith('.txt')]
+        entries.sort(key=os.path.getmtime)
+        for filename in entries[:max(len(entries) - self.max_entries, 0)]:
+            os.remove(filename)
+
+    def __filename(self, key):
+        return os.path.join(self.directory, key + '.txt')
@@ -1,10 +1,17 @@
-import ast
 import os
 import numpy as np
 import pygame
+import shutil
+
+from queue import Queue, Empty
+from threading import Thread
 
 from src.Grid import Grid
-from natnet.protocol import MarkerSetType
+from src.pipeline import LatestValue, FrameSnapshot
+from src.planner_process import PlannerState, read_paths_file
+from src.planner_cache import PlannerCache
+from src.solvers import MAPFInstance, create_solver
+from natnet.protocol import MarkerSetType, MarkerSet, Position
 
 
 class PlannerController:
@@ -34,111 +41,241 @@ class PlannerController:
                          goal_locations=self.data_path + self.arguments_parser.goals,
                          algorithm_output=self.algorithm_output,
                          paths_filename=self.paths_filename,
-                         surface=surface)
+                         surface=surface,
+                         move_epsilon=self.arguments_parser.epsilon)
         self.grid.reset_grid()
 
-    def set_grid(self):
+        # the frame snapshot the grid was last updated from
+        self.snapshot = FrameSnapshot(0, (), ())
+        # commands (functions without arguments) that modify the grid, submitted from the UI thread
+        # and executed by the thread that maintains the grid (see 'run_commands')
+        self.commands = Queue()
+        # latest GridView of the grid, for rendering from the UI thread
+        self.views = LatestValue()
+        # the MAPF solver, and its current (or last) run
+        self.solver = create_solver(self.arguments_parser.solver, portfolio=self.arguments_parser.portfolio,
+                                    deadline=self.arguments_parser.deadline)
+        self.planner_process = None
+        # outputs of previous solver runs, reused when the same instance is solved again
+        self.planner_cache = PlannerCache(self.data_path + 'planner_cache',
+                                          max_entries=self.arguments_parser.cache_size)
+        self.sent_solution_key = None  # the cache key of the last solution that was sent to ubuntu computer
+
+    def submit(self, command):
         """
-        Parses the data from the listener and sets the grid 2D array with relevent values in cells.
-        Also calls for pyGame methods to draw the grid.
+        Submits a command (function without arguments) that modifies the grid, to run on the grid's thread
+        """
+        self.commands.put(command)
+
+    def run_commands(self):
+        """
+        Runs the submitted commands, and the planner if it was requested by one of them.
+        Returns True if anything was executed
         """
-        marker_sets = []
-        for ms in self.listener.marker_sets:
-            marker_sets.append(self.get_adjusted_markers_positions(ms))
+        executed = False
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except Empty:
+                break
+            command()
+            executed = True
+
+        # if 'run planner' button is clicked, then running the planner one time
+        if self.grid.run_planner_cond:
+            self.run_planner()
+            self.grid.run_planner_cond = False
+            executed = True
+        return executed
+
+    def update_grid(self, snapshot):
+        """
+        Parses a FrameSnapshot and sets the grid 2D array with relevent values in cells.
+        """
+        self.snapshot = snapshot
+        marker_sets = [self.get_adjusted_markers_positions(ms) for ms in snapshot.marker_sets]
 
         obstacles = [ms for ms in marker_sets if ms.type == MarkerSetType.Obstacle]
 
         # (robot_id, MarkersSet)
         robots = [(ms.name[ms.name.index('-')+1::], ms) for ms in marker_sets if ms.type == MarkerSetType.Robot]
 
-        self.grid.reset_grid()  # TODO: find a way to clean grid object inplace instead of reset every cycle
-        self.grid.add_obstacles(obstacles)  # TODO: only if obstacles changed
-        self.grid.add_robots(robots, tolerance=0)  # TODO: only if robots moved
-
-        self.grid.surface.fill((245, 245, 245))  # fill screen background with light-gray color
-        self.grid.draw_grid()
-        self.grid.place_objects_on_grid()
+        # only obstacles and robots that moved since the previous cycle are re-placed on the grid
+        self.grid.update_objects(obstacles, robots, tolerance=0)
 
-        # if 'run planner' button is clicked, then running the planner one time
-        if self.grid.run_planner_cond:
-            self.run_planner()
-            self.grid.run_planner_cond = False
+    def set_grid(self):
+        """
+        Parses the data from the listener and sets the grid 2D array with relevent values in cells.
+        Also calls for pyGame methods to draw the grid.
+        This runs everything on the calling thread, see src.pipeline.StateThread for updating the grid on its own.
+        Returns the list of rectangles on screen that were changed (to pass to pygame.display.update)
+        """
+        generation, snapshot = self.listener.snapshots.get()
+        if snapshot is not None:
+            self.update_grid(snapshot)
+        self.run_commands()
 
-        # draw paths to screen after solution was found (currently remains after robots start moving)
+        # only the cells that changed since the previous cycle are redrawn,
+        # paths are drawn to screen after solution was found (currently remains after robots start moving)
         # first time is a bit slow because the program first sends the solution to the second computer
         # before updating the screen
-        if self.grid.has_paths:
-            self.grid.draw_paths()
+        return self.grid.render()
+
+    def get_instance(self):
+        """
+        Returns the MAPFInstance of the current scenario: the agents are the robots on the grid, in the order of the
+        .scen file, with their goals. Returns None if a robot has no goal, or can not reach it.
+        """
+        robots = sorted(self.grid.bots.items())  # same order as in the .scen file
+        missing_goals = [robot_id for robot_id, loc in robots if robot_id not in self.grid.end_bots]
+        if missing_goals:
+            print(f"Robots {missing_goals} have no goal locations, set goals before running the planner")
+            return None
+        # an instance where a robot is walled off from its goal is reported at once, instead of after the timeout
+        unreachable_goals = [robot_id for robot_id, loc in robots
+                             if not self.grid.is_reachable(loc, self.grid.end_bots[robot_id])]
+        if unreachable_goals:
+            print(f"Goals of robots {unreachable_goals} are not reachable, the scenario is unsolvable")
+            return None
+        return MAPFInstance(occupancy=self.grid.blocked_layer(),
+                            starts=[tuple(loc) for robot_id, loc in robots],
+                            goals=[tuple(self.grid.end_bots[robot_id]) for robot_id, loc in robots],
+                            map_filename=self.data_path + self.arguments_parser.map,
+                            scen_filename=self.data_path + self.arguments_parser.scene,
+                            paths_filename=self.paths_filename,
+                            timeout=self.arguments_parser.timeout)
 
     def run_planner(self):
         """
-        Running the MAPF planner and sending the solution to ubuntu computer if SEND_SOLUTION flag is turned on
+        Starts the MAPF planner in the background and returns immediately.
+        When it finishes, the solution paths are swapped in on the grid and sent to ubuntu computer
+        if SEND_SOLUTION flag is turned on (see 'on_planner_complete')
         """
+        if self.planner_process is not None and self.planner_process.is_running():
+            if self.planner_process.state == PlannerState.RUNNING:
+                print(f"{self.planner_process.status()}, press Escape to cancel it before running it again")
+            else:
+                # its solution is still being cached and sent to ubuntu computer (see 'on_planner_complete')
+                print(f"{self.planner_process.status()}, its solution is still being sent, try again when it is done")
+            return
+
         print("Planner Called")
-        os.system(f'wsl ~/CBSH2-RTC/cbs -m {self.data_path + self.arguments_parser.map} '
-                  f'-a {self.data_path + self.arguments_parser.scene} -o test.csv --outputPaths={self.paths_filename} '
-                  f'-k {len(self.grid.bots)} -t 60')
+        instance = self.get_instance()
+        if instance is None:
+            return
+
+        key = self.get_planner_cache_key(instance) if self.solver.cacheable else None
+        cached_filename = self.planner_cache.get(key) if key is not None else None
+        if cached_filename is not None:
+            # the same instance was already solved, its solution is used instantly
+            print("Planner finished! (solution loaded from cache)")
+            shutil.copyfile(cached_filename, self.paths_filename)
+            paths = read_paths_file(self.paths_filename)
+            self.set_solution_paths(paths)
+            if self.SEND_SOLUTION and key != self.sent_solution_key:
+                Thread(target=self.send_solution, args=(paths, key), daemon=True).start()
+            return
+
+        self.planner_process = self.solver.start(instance,
+                                                 on_complete=lambda process: self.on_planner_complete(process, key))
+
+    def get_planner_cache_key(self, instance):
+        """
+        Returns the key of the instance in the planner cache (None if the .map or .scen files are missing)
+        """
+        try:
+            return self.planner_cache.key(instance.map_filename, instance.scen_filename,
+                                          self.solver.describe(instance), len(instance.starts))
+        except OSError:
+            return None
+
+    def cancel_planner(self):
+        """
+        Cancels the running planner (if there is one)
+        """
+        if self.planner_process is not None and self.planner_process.is_running():
+            print("Cancelling planner")
+            self.planner_process.cancel()
+
+    def on_planner_complete(self, planner_process, key=None):
+        """
+        Called (on the planner's thread) when the planner ended.
+        Saves its solution in the planner cache under the given key, swaps it in on the grid
+        and sends it to ubuntu computer.
+        """
+        print(planner_process.status())
+        if planner_process.state != PlannerState.FINISHED:
+            if planner_process.output:
+                print("Planner output:\n" + "\n".join(planner_process.output))
+            return
+
         print("Planner finished!")
-        self.grid.has_paths = True
-        self.paths_to_plan()
+        paths = planner_process.paths
+        if key is not None:
+            self.planner_cache.put(key, self.paths_filename)
+        # the grid is only modified on its own thread, the new paths replace the old ones at once
+        self.submit(lambda: self.set_solution_paths(paths))
 
         # sending the solution and additional acenario data to ubuntu computer for execution
         if self.SEND_SOLUTION:
-            os.system(f'pscp -pw qawsedrf {self.algorithm_output} {self.ubuntu_dir}')  # send solution paths
-
-            with open(self.scenario_data, 'w') as scenario_data_file:
-                # prepare scenario data file to be used for automatically running the robots from ubuntu computer.
-                # add here additional data required in pre-defined format
-                # (need to follow the conventions so it could be parsed).
-                robots_ids = [body.body_id for body in self.listener.bodies if int(body.body_id) // 100 == 1]
-                robots_ids.sort()
-                scenario_data_file.write(f"robots:")  # format: "robots:<id>,<id>..."
-                for rid in robots_ids:
-                    scenario_data_file.write(f"{rid},")
-                scenario_data_file.write("\n")
-                scenario_data_file.write(f"cell_size:{self.arguments_parser.cell_size}\n")  # format: "cell_size:<cell_size>"
-                scenario_data_file.write(f"height:{self.arguments_parser.height}\n")
-                scenario_data_file.write(f"width:{self.arguments_parser.width}\n")
-                scenario_data_file.write(f"solution:\n")
-                for id, path in self.grid.solution_paths_on_grid.items():
-                    scenario_data_file.write(f"{id}:{path}\n")
-            os.system(f'pscp -pw qawsedrf {self.scenario_data} {self.ubuntu_dir}')  # send scenario peripheral data
-
-    def paths_to_plan(self):
-        """
-        Converts the output of the CBS planner to the input of Hadar's ROS code and saves it in a file by the name of
-        self.algorithm_output, to send to ubuntu computer (no other need for this file since the formatted solution is
-        saved in _paths.txt file
-        """
-        paths_file = open(self.paths_filename, "r")
+            self.send_solution(paths, key)
+
+    def set_solution_paths(self, paths):
+        """
+        Replaces the solution paths that are drawn on the grid
+        """
+        self.grid.solution_paths_on_grid = paths
+        self.grid.has_paths = True
+
+    def send_solution(self, paths, key=None):
+        """
+        Sends the solution and additional scenario data to ubuntu computer.
+        key is the solution's planner cache key, a cached solution is not sent again if it was the last one sent
+        """
+        self.paths_to_plan(paths)
+        os.system(f'pscp -pw qawsedrf {self.algorithm_output} {self.ubuntu_dir}')  # send solution paths
+
+        with open(self.scenario_data, 'w') as scenario_data_file:
+            # prepare scenario data file to be used for automatically running the robots from ubuntu computer.
+            # add here additional data required in pre-defined format
+            # (need to follow the conventions so it could be parsed).
+            robots_ids = [body.body_id for body in self.snapshot.bodies if int(body.body_id) // 100 == 1]
+            robots_ids.sort()
+            scenario_data_file.write(f"robots:")  # format: "robots:<id>,<id>..."
+            for rid in robots_ids:
+                scenario_data_file.write(f"{rid},")
+            scenario_data_file.write("\n")
+            scenario_data_file.write(f"cell_size:{self.arguments_parser.cell_size}\n")  # format: "cell_size:<cell_size>"
+            scenario_data_file.write(f"height:{self.arguments_parser.height}\n")
+            scenario_data_file.write(f"width:{self.arguments_parser.width}\n")
+            scenario_data_file.write(f"solution:\n")
+            for id, path in paths.items():
+                scenario_data_file.write(f"{id}:{path}\n")
+        os.system(f'pscp -pw qawsedrf {self.scenario_data} {self.ubuntu_dir}')  # send scenario peripheral data
+        self.sent_solution_key = key
+
+    def paths_to_plan(self, paths):
+        """
+        Converts the solution paths (in the format of solution_paths_on_grid) to the input of Hadar's ROS code and
+        saves it in a file by the name of self.algorithm_output, to send to ubuntu computer
+        (no other need for this file since the formatted solution is saved in _paths.txt file)
+        """
         plan_file = open(self.algorithm_output, "w")
 
         plan_file.write("schedule:\n")
         all_robots_starts_at_zero_zero = True
 
-        for line in paths_file:
-            # get and write agent number
-            space_idx = line.index(" ")
-            colon_idx = line.index(":")
-            agent_id = line[space_idx:colon_idx].replace(" ", "")
+        for agent_id, path in paths.items():
+            # write agent number
             plan_file.write("\tagent" + agent_id + ":\n")
 
-            # get sequence of coordinates
-            path_string = line[colon_idx + 2::]
-            path_list = path_string.split('->')
-            # parse and write out coordinates
+            # write out coordinates
             start_location = []
             counter = 0
 
-            path_list_locs = list(filter(lambda loc: loc != '\n' and loc != '', path_list))
-
-            # save paths in class (as tuples not strings)
-            clean_path = list(map(lambda loc: ast.literal_eval(loc), path_list_locs))
-            self.grid.solution_paths_on_grid[agent_id] = clean_path
-
-            for coord in path_list_locs:
+            for coord in path:
                 # this is to compensate for the flipped coordinates that the planner outputs
-                y, x = ast.literal_eval(coord)
+                y, x = coord
 
                 if all_robots_starts_at_zero_zero:
                     if not start_location:
@@ -148,15 +285,18 @@ class PlannerController:
                 plan_file.write('\t\t- x: ' + x + '\n\t\t y: ' + y + '\n\t\t t: ' + str(counter) + '\n')
                 counter = counter + 1
         plan_file.close()
-        paths_file.close()
 
     def get_adjusted_markers_positions(self, marker_set):
         """
-        Saves markers from listeners with 4 digits after decimal point
+        Returns a copy of the markers from listeners with 4 digits after decimal point
+        (the listener's marker set is left untouched, it may be shared with other threads)
         """
-        for i in range(len(marker_set.positions)):
-            marker_set.positions[i].x = float("{:.4f}".format(marker_set.positions[i].x))
-            marker_set.positions[i].y = float("{:.4f}".format(marker_set.positions[i].y))
-            marker_set.positions[i].z = float("{:.4f}".format(marker_set.positions[i].z))
-        return marker_set
+        if isinstance(marker_set.positions, np.ndarray):
+            # (N, 3) positions from an array frame, rounded into a new array to leave the frame untouched
+            return MarkerSet(marker_set.name, np.round(marker_set.positions.astype(np.float64), 4), marker_set.type)
+
+        positions = [Position(float("{:.4f}".format(position.x)),
+                              float("{:.4f}".format(position.y)),
+                              float("{:.4f}".format(position.z))) for position in marker_set.positions]
+        return MarkerSet(marker_set.name, positions, marker_set.type)
 
@@ -0,0 +1,491 @@
+import ast
+import multiprocessing
+import os
+import shlex
+import subprocess
+import time
+import traceback
+
+from abc import ABC, abstractmethod
+from collections import deque
+from enum import Enum
+from threading import Thread, Event, Condition
+
+
+class PlannerState(Enum):
+    """
+    Represents the state of a planner run
+    """
+    RUNNING = 0
+    FINISHED = 1  # the solver exited successfully
+    FAILED = 2  # the solver exited with an error, or could not be started
+    CANCELLED = 3
+    TIMED_OUT = 4
+
+
+class PlannerRun(ABC):
+    """
+    A single run of a MAPF solver in the background, so that the caller is never blocked while it plans.
+    The run can be cancelled, it is stopped when its timeout passes, and a completion callback is invoked
+    (on the run's thread, with this PlannerRun) once it ended in any way.
+    When the run is FINISHED, paths holds the solution: a dictionary that maps agent id (its index in the
+    scenario, as string) to its list of (row, column) locations.
+    """
+
+    def __init__(self, timeout=None, on_complete=None):
+        """
+        timeout: in seconds, the run is stopped if it is still running after this time (None for no limit)
+        on_complete: a function that is called with this PlannerRun when the run ends
+        """
+        self.timeout = timeout
+        self.on_complete = on_complete
+
+        self.state = None  # PlannerState, None before the run is started
+        self.paths = None
+        self.output = deque(maxlen=50)  # last lines the solver printed
+        self.start_time = None
+        self.end_time = None
+
+        self._cancelled = Event()
+        self._done = Event()
+
+    @abstractmethod
+    def start(self):
+        """
+        Starts the run and returns immediately
+        """
+
+    def cancel(self):
+        """
+        Asks the solver to stop, the completion callback is invoked with PlannerState.CANCELLED once it stopped
+        """
+        if self.is_running():
+            self._cancelled.set()
+
+    def is_running(self):
+        """
+        Returns True from the start of the run until its completion callback returned
+        (the callback already sees the final state, but the run is not over while it works on the result)
+        """
+        return self.state is not None and not self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Waits until the run ended and its completion callback returned, returns the final PlannerState
+        (or PlannerState.RUNNING if the timeout passed first)
+        """
+        self._done.wait(timeout)
+        return self.state
+
+    def elapsed(self):
+        """
+        Returns the time (in seconds) the solver has been running, or ran in total if it ended
+        """
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.monotonic()) - self.start_time
+
+    def progress(self):
+        """
+        Returns the part of the timeout that passed, between 0 and 1 (None if there is no timeout)
+        """
+        if not self.timeout:
+            return None
+        return min(self.elapsed() / self.timeout, 1.0)
+
+    def status(self):
+        """
+        Returns a short description of the run, for printing
+        """
+        if self.state is None:
+            return "Planner not started"
+        description = f"Planner {self.state.name.lower().replace('_', ' ')} ({self.elapsed():.1f}s"
+        if self.timeout:
+            description += f" of {self.timeout:.0f}s"
+        return description + ")"
+
+    def _finish(self, state):
+        self.end_time = time.monotonic()
+        self.state = state
+        try:
+            if self.on_complete is not None:
+                self.on_complete(self)
+        except Exception:
+            print('Planner completion error: {}'.format(traceback.format_exc()))
+        finally:
+            self._done.set()
+
+
+class PlannerProcess(PlannerRun):
+    """
+    Runs an external MAPF solver command in a background subprocess.
+    The solver is killed when the timeout passes, and its paths are read from the paths file it wrote.
+    """
+
+    def __init__(self, command, timeout=None, on_complete=None, kill_grace=2.0, paths_filename=None):
+        """
+        command: the solver's command line (a string, see 'split_command')
+        timeout: in seconds, the solver is killed if it is still running after this time (None for no limit)
+        on_complete: a function that is called with this PlannerProcess when the run ends
+        kill_grace: in seconds, the time given to the solver to exit after it is asked to terminate
+        paths_filename: the paths file the solver writes (in CBS's format), read into paths when it finished
+        """
+        super(PlannerProcess, self).__init__(timeout=timeout, on_complete=on_complete)
+        self.command = command
+        self.kill_grace = kill_grace
+        self.paths_filename = paths_filename
+        self.returncode = None
+        self._process = None
+
+    def start(self):
+        """
+        Starts the solver and returns immediately
+        """
+        self.start_time = time.monotonic()
+        self.state = PlannerState.RUNNING
+        try:
+            self._process = subprocess.Popen(split_command(self.command), stdout=subprocess.PIPE,
+                                             stderr=subprocess.STDOUT, universal_newlines=True)
+        except OSError as e:
+            self.output.append(str(e))
+            self._finish(PlannerState.FAILED)
+            return self
+
+        Thread(target=self.__read_output, daemon=True).start()
+        Thread(target=self.__watch, daemon=True).start()
+        return self
+
+    def __read_output(self):
+        for line in self._process.stdout:
+            self.output.append(line.rstrip())
+        self._process.stdout.close()
+
+    def __watch(self):
+        # wait for the solver to exit, while checking for cancellation and the timeout
+        state = None
+        while state is None:
+            remaining = None if self.timeout is None else self.start_time + self.timeout - time.monotonic()
+            try:
+                self._process.wait(timeout=0.1 if remaining is None else max(min(remaining, 0.1), 0))
+            except subprocess.TimeoutExpired:
+                if self._cancelled.is_set():
+                    state = PlannerState.CANCELLED
+                elif remaining is not None and remaining <= 0:
+                    state = PlannerState.TIMED_OUT
+                else:
+                    continue
+                self.__stop_process()
+            else:
+                state = PlannerState.FINISHED if self._process.returncode == 0 else PlannerState.FAILED
+
+        self.returncode = self._process.returncode
+        if state == PlannerState.FINISHED and self.paths_filename is not None:
+            try:
+                self.paths = read_paths_file(self.paths_filename)
+            except (OSError, ValueError, SyntaxError) as e:
+                self.output.append(f"Bad paths file: {e}")
+                state = PlannerState.FAILED
+        self._finish(state)
+
+    def __stop_process(self):
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=self.kill_grace)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+
+class PlannerThread(PlannerRun):
+    """
+    Runs an in-process MAPF solver function on a background thread.
+    The function is called with a `should_stop` function, which it must check regularly and return (None)
+    once it returns True - after the run was cancelled or when its timeout passed.
+    The function returns the paths, or None if it found no solution.
+    """
+
+    def __init__(self, solve, timeout=None, on_complete=None):
+        """
+        solve: the solver function, called with a `should_stop` function
+        timeout: in seconds, the solver is asked to stop if it is still running after this time (None for no limit)
+        on_complete: a function that is called with this PlannerThread when the run ends
+        """
+        super(PlannerThread, self).__init__(timeout=timeout, on_complete=on_complete)
+        self.solve = solve
+
+    def start(self):
+        """
+        Starts the solver and returns immediately
+        """
+        self.start_time = time.monotonic()
+        self.state = PlannerState.RUNNING
+        Thread(target=self.__run, daemon=True).start()
+        return self
+
+    def should_stop(self):
+        return self._cancelled.is_set() or (self.timeout is not None and self.elapsed() >= self.timeout)
+
+    def __run(self):
+        try:
+            self.paths = self.solve(self.should_stop)
+        except Exception:
+            self.output.append(traceback.format_exc())
+            self._finish(PlannerState.FAILED)
+            return
+
+        if self._cancelled.is_set():
+            self.paths = None
+            state = PlannerState.CANCELLED
+        elif self.paths is not None:
+            state = PlannerState.FINISHED
+        elif self.should_stop():
+            state = PlannerState.TIMED_OUT
+        else:
+            self.output.append("No solution found")
+            state = PlannerState.FAILED
+        self._finish(state)
+
+
+def run_worker(connection, solve, args):
+    """
+    The target of PlannerWorker's process: sends (True, paths) or (False, error) back through the connection
+    """
+    try:
+        connection.send((True, solve(*args)))
+    except Exception:
+        connection.send((False, traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+class PlannerWorker(PlannerRun):
+    """
+    Runs an in-process MAPF solver function in a separate worker process, so it plans on a core of its own
+    instead of sharing the interpreter with the UI and the other solvers.
+    The function and its arguments must be picklable, and it is called without a `should_stop` function -
+    the worker is terminated when the run is cancelled or its timeout passes.
+    The function returns the paths, or None if it found no solution.
+    """
+    # workers are spawned (not forked) on every platform, forking a process that runs threads is unsafe
+    context = multiprocessing.get_context('spawn')
+
+    def __init__(self, solve, args=(), timeout=None, on_complete=None, kill_grace=2.0):
+        """
+        solve: the solver function, called with args in the worker process
+        timeout: in seconds, the worker is terminated if it is still running after this time (None for no limit)
+        on_complete: a function that is called with this PlannerWorker when the run ends
+        kill_grace: in seconds, the time given to the worker to exit after it is asked to terminate
+        """
+        super(PlannerWorker, self).__init__(timeout=timeout, on_complete=on_complete)
+        self.solve = solve
+        self.args = args
+        self.kill_grace = kill_grace
+        self.returncode = None
+        self._process = None
+
+    def start(self):
+        """
+        Starts the worker and returns immediately
+        """
+        self.start_time = time.monotonic()
+        self.state = PlannerState.RUNNING
+        receiver, sender = self.context.Pipe(duplex=False)
+        self._process = self.context.Process(target=run_worker, args=(sender, self.solve, self.args), daemon=True)
+        try:
+            self._process.start()
+        except Exception as e:
+            # the solver could not be pickled, or the process could not be created
+            self.output.append(str(e))
+            receiver.close()
+            self._finish(PlannerState.FAILED)
+            return self
+        finally:
+            sender.close()
+
+        Thread(target=self.__watch, args=(receiver,), daemon=True).start()
+        return self
+
+    def __watch(self, receiver):
+        # wait for the worker's result, while checking for cancellation and the timeout
+        state = None
+        while state is None:
+            if receiver.poll(0.1):
+                try:
+                    succeeded, result = receiver.recv()
+                except EOFError:
+                    succeeded, result = False, "Worker exited without a result"
+                if succeeded and result is not None:
+                    self.paths = result
+                    state = PlannerState.FINISHED
+                else:
+                    self.output.append(result or "No solution found")
+                    state = PlannerState.FAILED
+            elif self._cancelled.is_set():
+                state = PlannerState.CANCELLED
+            elif self.timeout is not None and self.elapsed() >= self.timeout:
+                state = PlannerState.TIMED_OUT
+        receiver.close()
+
+        self._process.join(timeout=self.kill_grace if state == PlannerState.FINISHED else 0)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout=self.kill_grace)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self.returncode = self._process.exitcode
+        self._finish(state)
+
+
+class PlannerPortfolio(PlannerRun):
+    """
+    Runs several MAPF solvers on the same instance concurrently (at most max_workers at a time, the others wait
+    for a free worker), and ends with the first valid solution - or, if a deadline is given, with the best
+    (lowest sum of costs) valid solution found by then. The solvers that are still running are cancelled.
+    """
+
+    def __init__(self, members, validate, timeout=None, on_complete=None, deadline=None, max_workers=None,
+                 paths_filename=None):
+        """
+        members: list of (name, start) pairs, start is a function that is called with on_complete
+                 and returns the started PlannerRun of the solver
+        validate: a function that returns True if the given paths are a valid solution
+        timeout: in seconds, the solvers are cancelled if there is no solution after this time (None for no limit)
+        on_complete: a function that is called with this PlannerPortfolio when the run ends
+        deadline: in seconds, the time to keep collecting solutions for the best one (None for the first one)
+        max_workers: the maximal number of solvers running at once (None for the number of CPUs)
+        paths_filename: where the chosen paths are written (in CBS's format)
+        """
+        super(PlannerPortfolio, self).__init__(timeout=timeout, on_complete=on_complete)
+        self.members = members
+        self.validate = validate
+        self.deadline = deadline
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.paths_filename = paths_filename
+        self.runs = [None] * len(members)  # the started PlannerRun of every member
+        self.winner = None  # the name of the member whose solution was chosen
+        self._ended = []  # indices of members that ended and were not handled yet
+        self._changed = Condition()
+
+    def start(self):
+        """
+        Starts the solvers and returns immediately
+        """
+        self.start_time = time.monotonic()
+        self.state = PlannerState.RUNNING
+        Thread(target=self.__run, daemon=True).start()
+        return self
+
+    def status(self):
+        description = super(PlannerPortfolio, self).status()
+        if self.winner is not None:
+            description += f", solved by {self.winner}"
+        return description
+
+    def __member_complete(self, index):
+        with self._changed:
+            self._ended.append(index)
+            self._changed.notify()
+
+    def __run(self):
+        pending = list(range(len(self.members)))
+        running = set()
+        best, best_cost = None, None
+        with self._changed:
+            while True:
+                # (the condition's lock is reentrant, a member that fails to start completes within start)
+                while pending and len(running) < self.max_workers:
+                    index = pending.pop(0)
+                    running.add(index)
+                    name, start = self.members[index]
+                    self.runs[index] = start(lambda run, index=index: self.__member_complete(index))
+
+                for index in self._ended:
+                    running.discard(index)
+                    run = self.runs[index]
+                    name = self.members[index][0]
+                    self.output.append(f"{name}: {run.status()}")
+                    if run.state != PlannerState.FINISHED:
+                        self.output.extend(f"{name}: {line}" for line in list(run.output)[-5:])
+                    elif not self.validate(run.paths):
+                        self.output.append(f"{name}: invalid solution")
+                    elif best is None or solution_cost(run.paths) < best_cost:
+                        best, best_cost = index, solution_cost(run.paths)
+                self._ended.clear()
+
+                all_ended = not pending and not running
+                if self._cancelled.is_set():
+                    state = PlannerState.CANCELLED
+                elif best is not None and (self.deadline is None or self.elapsed() >= self.deadline or all_ended):
+                    state = PlannerState.FINISHED
+                elif all_ended:
+                    state = PlannerState.FAILED
+                elif self.timeout is not None and self.elapsed() >= self.timeout:
+                    # a deadline longer than the timeout ends with the best solution found by then
+                    state = PlannerState.FINISHED if best is not None else PlannerState.TIMED_OUT
+                else:
+                    self._changed.wait(0.1)
+                    continue
+                break
+
+        for run in self.runs:
+            if run is not None:
+                run.cancel()
+        if state == PlannerState.FINISHED:
+            self.winner = self.members[best][0]
+            self.paths = self.runs[best].paths
+            if self.paths_filename is not None:
+                write_paths_file(self.paths, self.paths_filename)
+        self._finish(state)
+
+
+def split_command(command):
+    """
+    Returns the arguments of a command line for subprocess.Popen: split like a POSIX shell would, except on Windows,
+    where the command line is passed as is and parsed by the program (so backslashes in paths are kept)
+    """
+    return command if os.name == 'nt' else shlex.split(command)
+
+
+def quote_argument(argument):
+    """
+    Returns an argument (e.g. a path) quoted for a command line, so spaces in it do not split it into several
+    arguments (see 'split_command')
+    """
+    argument = str(argument)
+    return subprocess.list2cmdline([argument]) if os.name == 'nt' else shlex.quote(argument)
+
+
+def solution_cost(paths):
+    """
+    Returns the sum of costs of the paths: the number of time steps every agent takes to reach its goal
+    """
+    return sum(len(path) - 1 for path in paths.values())
+
+
+def read_paths_file(paths_filename):
+    """
+    Reads a paths file in CBS's output format, a line per agent: "Agent <id>: (row,column)->(row,column)->..."
+    Returns a dictionary that maps agent id (string) to its list of (row, column) locations
+    """
+    paths = {}
+    with open(paths_filename, "r") as paths_file:
+        for line in paths_file:
+            if not line.strip():
+                continue
+            space_idx = line.index(" ")
+            colon_idx = line.index(":")
+            agent_id = line[space_idx:colon_idx].replace(" ", "")
+            path_list = line[colon_idx + 2::].split('->')
+            # save paths as tuples not strings
+            paths[agent_id] = [ast.literal_eval(loc) for loc in path_list if loc.strip()]
+    return paths
+
+
+def write_paths_file(paths, paths_filename):
+    """
+    Writes paths (a dictionary that maps agent id to its list of (row, column) locations) in CBS's output format
+    """
+    with open(paths_filename, "w") as paths_file:
+        for agent_id, path in paths.items():
+            paths_file.write(f"Agent {agent_id}: " + "".join(f"({row},{col})->" for row, col in path) + "\n")
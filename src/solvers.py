@@ -0,0 +1,321 @@
+import heapq
+import os
+import random
+
+import numpy as np
+
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+from src.grid_search import distance_fields
+from src.planner_process import PlannerProcess, PlannerThread, PlannerWorker, PlannerPortfolio, quote_argument
+
+# the default solver, the fields in braces are filled by 'ExternalSolver.get_command'
+CBS_COMMAND = 'wsl ~/CBSH2-RTC/cbs -m {map} -a {scen} -o test.csv --outputPaths={paths} -k {agents} -t {timeout}'
+
+# A MAPF instance as built from the grid by the planner controller.
+# occupancy: boolean array in the grid's shape, True for blocked cells
+# starts, goals: (row, column) of every agent, in the order of the agents in the .scen file
+# map_filename, scen_filename: the instance's files, paths_filename: where an external solver writes its paths
+# timeout: in seconds, the time limit of the solver
+MAPFInstance = namedtuple('MAPFInstance', ['occupancy', 'starts', 'goals', 'map_filename', 'scen_filename',
+                                           'paths_filename', 'timeout'])
+
+
+class Solver(ABC):
+    """
+    Interface of a MAPF solver used by the planner controller.
+    A solver starts a PlannerRun for an instance, whose paths are in the format of solution_paths_on_grid.
+    """
+    name = ""
+    cacheable = False  # True if the solver's outputs should be kept in the planner cache
+
+    @abstractmethod
+    def start(self, instance, on_complete=None):
+        """
+        Starts solving the instance in the background, returns the started PlannerRun
+        """
+
+    def describe(self, instance):
+        """
+        Returns a string that identifies the solver's configuration for the instance (used in cache keys)
+        """
+        return self.name
+
+
+class ExternalSolver(Solver):
+    """
+    A solver that runs an external command (CBS by default) that reads the .map and .scen files
+    and writes its paths to a file.
+    """
+    name = "external"
+    cacheable = True
+
+    def __init__(self, command=CBS_COMMAND, kill_grace=5.0):
+        """
+        command: the solver's command line, may include the fields {map}, {scen}, {paths}, {agents} and {timeout}
+        kill_grace: in seconds, the solver is killed if it is still running this long after its timeout
+        """
+        self.command = command
+        self.kill_grace = kill_grace
+
+    def get_command(self, instance):
+        """
+        Returns the command line of the solver for the instance (with the files' paths quoted)
+        """
+        return self.command.format(map=quote_argument(instance.map_filename),
+                                   scen=quote_argument(instance.scen_filename),
+                                   paths=quote_argument(instance.paths_filename), agents=len(instance.starts),
+                                   timeout=instance.timeout)
+
+    def describe(self, instance):
+        return self.get_command(instance)
+
+    def start(self, instance, on_complete=None):
+        # a failed run must not leave the paths of a previous run behind
+        if os.path.exists(instance.paths_filename):
+            os.remove(instance.paths_filename)
+        # the solver stops by itself when its time is up, it is killed if it does not
+        return PlannerProcess(self.get_command(instance), timeout=instance.timeout + self.kill_grace,
+                              on_complete=on_complete, paths_filename=instance.paths_filename).start()
+
+
+class PrioritizedSolver(Solver):
+    """
+    A built-in prioritized planner: agents are planned one after the other (longest first) with a space-time A*,
+    each avoiding the paths of the agents planned before it through a reservation table.
+    Agents move to one of the 4 neighboring cells or wait in place on every time step, and stay at their goals
+    after reaching them. If an ordering of the agents fails, random orderings are tried.
+    Prioritized planning is fast but incomplete, and its solutions are not guaranteed to be optimal.
+    """
+    name = "prioritized"
+
+    def __init__(self, max_orderings=10, seed=0, shuffle_first=False, processes=False):
+        """
+        max_orderings: the maximal number of agents' orderings to try
+        seed: of the random orderings
+        shuffle_first: if True, the first ordering is already random (instead of longest first)
+        processes: if True, the solver runs in a worker process instead of a thread (see PlannerWorker)
+        """
+        self.max_orderings = max_orderings
+        self.seed = seed
+        self.shuffle_first = shuffle_first
+        self.processes = processes
+
+    def describe(self, instance):
+        return f"{self.name} (seed {self.seed})" if self.shuffle_first else self.name
+
+    def start(self, instance, on_complete=None):
+        if self.processes:
+            return PlannerWorker(self.solve, (instance,), timeout=instance.timeout, on_complete=on_complete).start()
+        return PlannerThread(lambda should_stop: self.solve(instance, should_stop), timeout=instance.timeout,
+                             on_complete=on_complete).start()
+
+    def solve(self, instance, should_stop=lambda: False):
+        """
+        Returns the paths of the instance's agents: a dictionary that maps agent id (its index, as string)
+        to its list of (row, column) locations, or None if no solution was found.
+        """
+        rows, cols = instance.occupancy.shape
+        free = ~np.asarray(instance.occupancy, dtype=bool).ravel()
+        starts = [row * cols + col for row, col in instance.starts]
+        goals = [row * cols + col for row, col in instance.goals]
+        if not all(free[cell] for cell in starts + goals) or \
+                len(set(starts)) != len(starts) or len(set(goals)) != len(goals):
+            return None  # an agent is on a blocked cell, or two agents share a start or a goal
+
+        # the cells reachable from every free cell in one time step (including waiting in place)
+        moves = self.__moves(free, rows, cols)
+        occupancy_key = distance_fields.occupancy_key(free.reshape(rows, cols))
+        distances = [distance_fields.get(free.reshape(rows, cols), goal, key=occupancy_key).ravel().tolist()
+                     for goal in instance.goals]
+        if any(distance[start] < 0 for distance, start in zip(distances, starts)):
+            return None  # an agent can not reach its goal
+
+        # longest first, then random orderings
+        order = sorted(range(len(starts)), key=lambda agent: -distances[agent][starts[agent]])
+        rng = random.Random(self.seed)
+        if self.shuffle_first:
+            rng.shuffle(order)
+        for i in range(self.max_orderings):
+            if should_stop():
+                return None
+            paths = self.__plan(order, starts, goals, moves, distances, rows * cols, should_stop)
+            if paths is not None:
+                return {str(agent): [divmod(cell, cols) for cell in paths[agent]] for agent in range(len(starts))}
+            rng.shuffle(order)
+        return None
+
+    @staticmethod
+    def __moves(free, rows, cols):
+        moves = [[] for cell in range(rows * cols)]
+        for cell in np.flatnonzero(free).tolist():
+            row, col = divmod(cell, cols)
+            moves[cell].append(cell)
+            if row > 0 and free[cell - cols]:
+                moves[cell].append(cell - cols)
+            if row < rows - 1 and free[cell + cols]:
+                moves[cell].append(cell + cols)
+            if col > 0 and free[cell - 1]:
+                moves[cell].append(cell - 1)
+            if col < cols - 1 and free[cell + 1]:
+                moves[cell].append(cell + 1)
+        return moves
+
+    def __plan(self, order, starts, goals, moves, distances, size, should_stop):
+        # reservation table of the agents that were already planned
+        vertices = set()  # (time, cell) occupied
+        edges = set()  # (time, from cell, to cell) of moves that arrive at time
+        resting = {}  # maps a goal cell to the time from which an agent stays in it
+        last_visit = {}  # maps a cell to the last time an agent is in it (before resting)
+
+        paths = {}
+        for agent in order:
+            # no agent waits for more than the time all the planned agents need plus a full sweep of the grid
+            horizon = max(last_visit.values(), default=0) + size
+            path = self.__space_time_astar(starts[agent], goals[agent], moves, distances[agent], vertices, edges,
+                                           resting, last_visit, horizon, should_stop)
+            if path is None:
+                return None
+
+            for time_step, cell in enumerate(path):
+                vertices.add((time_step, cell))
+                last_visit[cell] = max(last_visit.get(cell, 0), time_step)
+                if time_step > 0:
+                    edges.add((time_step, path[time_step - 1], cell))
+            resting[goals[agent]] = len(path) - 1
+            paths[agent] = path
+        return paths
+
+    @staticmethod
+    def __space_time_astar(start, goal, moves, distance, vertices, edges, resting, last_visit, horizon, should_stop):
+        # the agent may finish only when no other agent passes through its goal afterwards
+        earliest_finish = last_visit.get(goal, -1) + 1
+        never = float('inf')
+
+        open_list = [(distance[start], 0, start)]
+        parents = {(start, 0): None}
+        expansions = 0
+        while open_list:
+            f, time_step, cell = heapq.heappop(open_list)
+            if cell == goal and time_step >= earliest_finish:
+                path = []
+                state = (cell, time_step)
+                while state is not None:
+                    path.append(state[0])
+                    state = parents[state]
+                return path[::-1]
+
+            expansions += 1
+            if expansions % 1024 == 0 and should_stop():
+                return None
+            next_time = time_step + 1
+            if next_time > horizon:
+                continue
+            for neighbor in moves[cell]:
+                if (neighbor, next_time) in parents or (next_time, neighbor) in vertices or \
+                        resting.get(neighbor, never) <= next_time or (next_time, neighbor, cell) in edges:
+                    continue
+                parents[(neighbor, next_time)] = (cell, time_step)
+                heapq.heappush(open_list, (next_time + distance[neighbor], next_time, neighbor))
+        return None
+
+
+class PortfolioSolver(Solver):
+    """
+    Runs several solvers on the same instance concurrently, and takes the first valid solution - or the best one
+    found within a deadline - cancelling the others (see PlannerPortfolio).
+    Every solver writes its paths to its own file, and the chosen paths are written to the instance's paths file.
+    """
+    name = "portfolio"
+
+    def __init__(self, solvers, deadline=None, max_workers=None, kill_grace=5.0):
+        """
+        solvers: the Solver elements to run
+        deadline: in seconds, the time to keep collecting solutions for the best one (None for the first one)
+        max_workers: the maximal number of solvers running at once (None for the number of CPUs)
+        kill_grace: in seconds, added to the instance's timeout before the portfolio stops waiting for solvers
+        """
+        self.solvers = solvers
+        self.deadline = deadline
+        self.max_workers = max_workers
+        self.kill_grace = kill_grace
+        # the solution may come from any of the solvers, so it is cached only if all of them are deterministic
+        self.cacheable = all(solver.cacheable for solver in solvers)
+
+    def describe(self, instance):
+        members = [solver.describe(member) for solver, member in zip(self.solvers, self.get_members(instance))]
+        return f"{self.name} (deadline {self.deadline}): " + " | ".join(members)
+
+    def get_members(self, instance):
+        """
+        Returns the instance of every solver, each with its own paths file
+        """
+        root, extension = os.path.splitext(instance.paths_filename)
+        return [instance._replace(paths_filename=f"{root}.{i}{extension}") for i in range(len(self.solvers))]
+
+    def start(self, instance, on_complete=None):
+        members = [(f"{i}:{solver.name}", lambda on_member_complete, solver=solver, member=member:
+                    solver.start(member, on_complete=on_member_complete))
+                   for i, (solver, member) in enumerate(zip(self.solvers, self.get_members(instance)))]
+        return PlannerPortfolio(members, validate=lambda paths: is_valid_solution(instance, paths),
+                                timeout=instance.timeout + self.kill_grace, on_complete=on_complete,
+                                deadline=self.deadline, max_workers=self.max_workers,
+                                paths_filename=instance.paths_filename).start()
+
+
+def is_valid_solution(instance, paths):
+    """
+    Returns True if paths (in the format of solution_paths_on_grid) solve the instance: every agent moves
+    from its start to its goal through free cells, one step (or a wait) at a time, and stays at its goal -
+    with no two agents in the same cell, or swapping cells, at the same time
+    """
+    if paths is None or sorted(paths) != sorted(str(agent) for agent in range(len(instance.starts))):
+        return False
+    rows, cols = instance.occupancy.shape
+    timed_paths = []
+    for agent, (start, goal) in enumerate(zip(instance.starts, instance.goals)):
+        path = [tuple(location) for location in paths[str(agent)]]
+        if not path or path[0] != tuple(start) or path[-1] != tuple(goal):
+            return False
+        for row, col in path:
+            if not (0 <= row < rows and 0 <= col < cols) or instance.occupancy[row, col]:
+                return False
+        if any(abs(a[0] - b[0]) + abs(a[1] - b[1]) > 1 for a, b in zip(path, path[1:])):
+            return False
+        timed_paths.append(path)
+
+    makespan = max((len(path) for path in timed_paths), default=0)
+    for time_step in range(makespan):
+        locations = [path[min(time_step, len(path) - 1)] for path in timed_paths]
+        if len(set(locations)) != len(locations):
+            return False
+        if time_step > 0:
+            moves = {(path[min(time_step - 1, len(path) - 1)], location)
+                     for path, location in zip(timed_paths, locations)}
+            if any(a != b and (b, a) in moves for a, b in moves):
+                return False
+    return True
+
+
+def create_solver(solver, portfolio=(), deadline=None):
+    """
+    Returns the solver for the --solver argument: "default" for CBS, "prioritized" for the built-in
+    prioritized planner, or any other external solver command.
+    If portfolio (a list of more --solver arguments) is given, returns a PortfolioSolver that runs all of them
+    concurrently, where the in-process solvers run in worker processes, and the prioritized planners
+    after the first one use random agents' orderings
+    """
+    if not portfolio:
+        return create_single_solver(solver)
+
+    solvers = [create_single_solver(s, seed=i, processes=True) for i, s in enumerate([solver] + list(portfolio))]
+    return PortfolioSolver(solvers, deadline=deadline)
+
+
+def create_single_solver(solver, seed=0, processes=False):
+    if solver == "default":
+        return ExternalSolver(CBS_COMMAND)
+    if solver == PrioritizedSolver.name:
+        return PrioritizedSolver(seed=seed, shuffle_first=seed > 0, processes=processes)
+    return ExternalSolver(solver)
@@ -0,0 +1,135 @@
+import json
+import struct
+
+import numpy as np
+
+from threading import Lock
+
+# Binary telemetry format of the robots' state broadcast (all little-endian), decoded by close_loop_client/udp_client.py
+# header: magic, format version, flags, sequence number, frame number, frame timestamp (seconds), number of records
+HEADER = struct.Struct('<4sBBIIdH')
+MAGIC = b'CRLT'
+VERSION = 2
+# flags: the message holds all the robots (otherwise, only the robots whose pose changed since the previous messages)
+KEYFRAME = 0x01
+# record per robot: body id, position (x, y, z) and rotation quaternion (x, y, z, w), in the broadcast's axes
+RECORD_DTYPE = np.dtype([('id', '<u4'), ('pos', '<f4', (3,)), ('quat', '<f4', (4,))])
+
+
+def robots_records(snapshot):
+    """
+    Returns the robots' bodies of a FrameSnapshot as BODY_DTYPE-like fields (id, pos, quat with w first),
+    sorted by id. By convention, all rigid bodies which represent robots have sequential ids starting from 101.
+    """
+    if snapshot.body_records is not None:
+        ids, positions, rotations = snapshot.body_records['id'], snapshot.body_records['pos'], \
+            snapshot.body_records['quat']
+    else:
+        bodies = snapshot.bodies
+        ids = np.array([int(body.body_id) for body in bodies], dtype=np.uint32)
+        positions = np.array([(body.position.x, body.position.y, body.position.z) for body in bodies],
+                             dtype=np.float64).reshape(-1, 3)
+        rotations = np.array([(body.rotation.w, body.rotation.x, body.rotation.y, body.rotation.z)
+                              for body in bodies], dtype=np.float64).reshape(-1, 4)
+
+    robots = np.flatnonzero(ids // 100 == 1)
+    robots = robots[np.argsort(ids[robots], kind='stable')]
+    return ids[robots], positions[robots], rotations[robots]
+
+
+def pack_binary(frame_number, timestamp, ids, positions, rotations, sequence=0, flags=KEYFRAME):
+    """
+    Returns a message in the binary telemetry format: a header and a packed record per robot.
+    Positions and rotations are flipped to the broadcast's axes like in the json format
+    (see main.get_robots_state_to_send): position (x, y, z) -> (-y, x, z), rotation (w, x, y, z) -> (x, y, z, w)
+    sequence: number of the message in its stream (0 for messages that are not numbered)
+    """
+    records = np.empty(len(ids), dtype=RECORD_DTYPE)
+    records['id'] = ids
+    records['pos'][:, 0] = -positions[:, 1]
+    records['pos'][:, 1] = positions[:, 0]
+    records['pos'][:, 2] = positions[:, 2]
+    records['quat'] = rotations
+    header = HEADER.pack(MAGIC, VERSION, flags, sequence, frame_number & 0xFFFFFFFF, timestamp, len(records))
+    return header + records.tobytes()
+
+
+def robots_dicts(ids, positions, rotations):
+    """
+    Returns the robots as dictionaries in the json format, flipped to the broadcast's axes
+    (see main.get_robots_state_to_send)
+    """
+    return [{"body_id": body_id,
+             "position": {"x": -position[1], "y": position[0], "z": position[2]},
+             "rotation": {"w": rotation[3], "x": rotation[0], "y": rotation[1], "z": rotation[2]}}
+            for body_id, position, rotation in zip(ids.tolist(), positions.tolist(), rotations.tolist())]
+
+
+def encode_binary(snapshot):
+    """
+    Returns the robots' state of a FrameSnapshot as a (not numbered) keyframe in the binary telemetry format
+    """
+    return pack_binary(snapshot.frame_number, snapshot.timestamp, *robots_records(snapshot))
+
+
+class DeltaEncoder:
+    """
+    Encodes the robots' state of consecutive frames as a numbered stream of keyframes, which hold all the robots,
+    and deltas, which hold only the robots whose pose changed by more than a threshold since it was last sent.
+    A keyframe is sent every keyframe_interval messages, when robots appear or disappear,
+    and when a client requests one (after it detected a lost message by a gap in the sequence numbers).
+    In the json format a message is {"sequence", "frame_number", "timestamp", "keyframe", "bodies"}.
+    """
+
+    def __init__(self, binary=False, keyframe_interval=30, position_threshold=0.001, rotation_threshold=0.001):
+        """
+        binary: True for the binary telemetry format, False for json
+        keyframe_interval: the maximal number of messages between keyframes
+        position_threshold: in meters, a robot is sent when its position changed more than this (on any axis)
+        rotation_threshold: a robot is sent when a component of its rotation quaternion changed more than this
+        """
+        self.binary = binary
+        self.keyframe_interval = keyframe_interval
+        self.position_threshold = position_threshold
+        self.rotation_threshold = rotation_threshold
+        self.sequence = 0  # of the last message, numbers start from 1 and skip 0 when wrapping
+        self.keyframe_sequence = None  # of the last keyframe
+        self.sent = None  # (ids, positions, rotations) of the robots as last sent
+        self.keyframe_requested = False
+        self._lock = Lock()  # keyframes are requested from the server's thread
+
+    def request_keyframe(self):
+        """
+        Makes the next message a keyframe (may be called from any thread)
+        """
+        with self._lock:
+            self.keyframe_requested = True
+
+    def encode(self, snapshot):
+        """
+        Returns the next message of the stream, for the given FrameSnapshot
+        """
+        ids, positions, rotations = robots_records(snapshot)
+        self.sequence = self.sequence % 0xFFFFFFFF + 1
+
+        with self._lock:
+            requested, self.keyframe_requested = self.keyframe_requested, False
+        keyframe = requested or self.sent is None or not np.array_equal(ids, self.sent[0]) or \
+            (self.sequence - self.keyframe_sequence) % 0xFFFFFFFF >= self.keyframe_interval
+        if keyframe:
+            self.keyframe_sequence = self.sequence
+            self.sent = (ids, positions.copy(), rotations.copy())
+            changed = slice(None)
+        else:
+            _, sent_positions, sent_rotations = self.sent
+            changed = (np.abs(positions - sent_positions).max(axis=1, initial=0) > self.position_threshold) | \
+                      (np.abs(rotations - sent_rotations).max(axis=1, initial=0) > self.rotation_threshold)
+            sent_positions[changed] = positions[changed]
+            sent_rotations[changed] = rotations[changed]
+
+        if self.binary:
+            return pack_binary(snapshot.frame_number, snapshot.timestamp, ids[changed], positions[changed],
+                               rotations[changed], sequence=self.sequence, flags=KEYFRAME if keyframe else 0)
+        return json.dumps({"sequence": self.sequence, "frame_number": snapshot.frame_number,
+                           "timestamp": snapshot.timestamp, "keyframe": keyframe,
+                           "bodies": robots_dicts(ids[changed], positions[changed], rotations[changed])})
@@ -0,0 +1,55 @@
+import pygame
+
+from collections import OrderedDict
+
+
+class TextCache:
+    """
+    A cache of pyGame fonts and rendered text surfaces, shared by everything that prints text to the screen.
+    Looking a font up (pygame.font.SysFont) and rasterizing text are done once for every
+    (font, size, bold, text, color), afterwards printing the text is only a blit of the cached surface.
+    """
+
+    def __init__(self, max_size=1024):
+        """
+        max_size: the maximal number of rendered text surfaces to keep, the least recently used are evicted
+        """
+        self.max_size = max_size
+        self.fonts = {}  # maps (font, size, bold) to a pygame.font.Font
+        self.surfaces = OrderedDict()  # maps (font, size, bold, text, color) to a rendered surface, in LRU order
+
+    def get_font(self, font, font_size, bold=False):
+        """
+        Returns the pygame.font.Font for the given system font name, size and boldness
+        """
+        key = (font, font_size, bold)
+        if key not in self.fonts:
+            self.fonts[key] = pygame.font.SysFont(font, font_size, bold=bold)
+        return self.fonts[key]
+
+    def render(self, text, font, font_size, color, bold=False):
+        """
+        Returns a surface with the given text rendered on it (antialiased), rendering it only if it is not cached
+        """
+        key = (font, font_size, bold, text, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.get_font(font, font_size, bold).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        """
+        Forgets all the cached fonts and surfaces (required if pygame.font is re-initialized)
+        """
+        self.fonts.clear()
+        self.surfaces.clear()
+
+
+# the cache that is shared by the grid and the buttons
+text_cache = TextCache()
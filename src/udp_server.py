@@ -1,54 +1,222 @@
-import errno
 import socket
 import time
-from threading import Thread
-from queue import Queue
+from collections import deque
+from threading import Thread, Lock, Event
+
+from src.pipeline import LatestValue
+
+# a subscriber that sends this message is unregistered at once (any other message registers it, or is a heartbeat)
+UNSUBSCRIBE_MESSAGE = b"bye"
+# a subscriber that lost a message of a delta stream sends this to get all the robots in the next one
+# (it is a heartbeat as well, see src.telemetry.DeltaEncoder)
+KEYFRAME_REQUEST_MESSAGE = b"keyframe"
+
+
+class Subscriber:
+    """
+    A client that receives the broadcast data, with its send statistics
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.registered_time = time.monotonic()
+        self.last_seen = self.registered_time  # time of the last message (registration or heartbeat) from it
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.errors = 0
+
+    def __repr__(self):
+        return 'Subscriber(address={}, messages_sent={}, bytes_sent={}, errors={})'.format(
+            self.address, self.messages_sent, self.bytes_sent, self.errors)
+
+
+class RateLimitedLog:
+    """
+    Prints messages of each kind at most once every interval seconds, with the number of messages of that kind
+    that were suppressed since it was last printed
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.last_printed = {}  # maps a kind of message to the time it was last printed
+        self.suppressed = {}  # maps a kind of message to the number of messages suppressed since
+        self._lock = Lock()  # messages are logged from the server's thread and from the sending thread
+
+    def log(self, kind, message):
+        now = time.monotonic()
+        with self._lock:
+            last = self.last_printed.get(kind)
+            if last is not None and now - last < self.interval:
+                self.suppressed[kind] = self.suppressed.get(kind, 0) + 1
+                return
+            self.last_printed[kind] = now
+            suppressed = self.suppressed.pop(kind, 0)
+        print(message if not suppressed else f"{message} ({suppressed} more suppressed)")
 
 
 class UDPServer(Thread):
-    def __init__(self):
-        super(UDPServer, self).__init__()
-        self.localIP = "132.68.36.158"
-        self.localPort = 20001
+    """
+    Pushes the latest data to all the subscribed clients (and to a multicast group, if one is given).
+    A client subscribes by sending any message to the server, and must keep sending messages (heartbeats)
+    to stay subscribed - clients that were not heard from for subscriber_timeout seconds are expired.
+    The server's thread only handles the subscriptions, data is pushed by calling 'send_data'
+    (see src.pipeline.Broadcaster, which does it at a fixed rate).
+    The data to send is kept in a single slot that every update replaces, so neither the producer nor the sender
+    ever blocks on the other - data that was replaced before it was sent is dropped (and counted).
+    """
+
+    def __init__(self, local_ip="132.68.36.158", port=20001, multicast_group=None, subscriber_timeout=5.0,
+                 on_keyframe_request=None, history_size=0, quiet=False, log_interval=1.0):
+        """
+        local_ip, port: the address the server listens on for subscriptions
+        multicast_group: (ip, port) of a multicast group to send the data to as well, None for subscribers only
+        subscriber_timeout: in seconds, a subscriber that sent no heartbeat for this long is removed
+        on_keyframe_request: function without arguments, called (on the server's thread) when a client subscribes
+        or requests a keyframe - so the next message holds the full state (see src.telemetry.DeltaEncoder)
+        history_size: number of the latest messages to keep and send to every new subscriber (0 for none)
+        quiet: if True, the data is not printed on every update and send, only a summary every log_interval
+        log_interval: in seconds, the minimal time between repeated log messages of the same kind
+        """
+        super(UDPServer, self).__init__(daemon=True)
+        self.localIP = local_ip
+        self.localPort = port
+        self.multicast_group = multicast_group
+        self.subscriber_timeout = subscriber_timeout
+        self.on_keyframe_request = on_keyframe_request
         self.bufferSize = 32768
         self.UDPServerSocket = None
-        self._data_thread = None
-        self._data = None
-        self._queue = None
+        self.subscribers = {}  # maps a client's address to its Subscriber
+        self.multicast_stats = Subscriber(multicast_group)
+        self._subscribers_lock = Lock()  # subscribers are registered on the server's thread and sent to on others
+        self._stop_event = Event()
+        self.data = LatestValue()  # the latest data to send, with its generation (number of updates)
+        self.history = deque(maxlen=history_size)  # (generation, bytes) of the latest messages, oldest first
+        self._history_lock = Lock()
+        self.sent_generation = 0  # of the last data sent
+        self.messages_dropped = 0  # updates that were replaced before they were sent
+        self.quiet = quiet
+        self.log = RateLimitedLog(log_interval)
 
-    def run(self):
+    def start(self):
+        # the socket is bound before returning, so data can be sent as soon as the server is started
         self.UDPServerSocket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
         self.UDPServerSocket.bind((self.localIP, self.localPort))
-        self._queue = Queue()
+        self.UDPServerSocket.settimeout(0.5)
+        if self.multicast_group is not None:
+            self.UDPServerSocket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        super(UDPServer, self).start()
         print("UDP server up and listening")
 
+    def get_address(self):
+        """
+        Returns the (ip, port) the server is bound to
+        """
+        return self.UDPServerSocket.getsockname()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                message, address = self.UDPServerSocket.recvfrom(self.bufferSize)
+            except socket.timeout:
+                message, address = None, None
+            except OSError as e:
+                # e.g. a previous send to a client that exited was refused (reported on the next receive on Windows)
+                if self._stop_event.is_set():
+                    break
+                message, address = None, None
+
+            keyframe_requested = False
+            new_subscriber = None
+            with self._subscribers_lock:
+                if message is not None:
+                    message = message.strip()
+                    if message == UNSUBSCRIBE_MESSAGE:
+                        if self.subscribers.pop(address, None) is not None:
+                            print(f"UDP client {address} unsubscribed")
+                    elif address in self.subscribers:
+                        self.subscribers[address].last_seen = time.monotonic()
+                        keyframe_requested = message == KEYFRAME_REQUEST_MESSAGE
+                    else:
+                        new_subscriber = self.subscribers[address] = Subscriber(address)
+                        keyframe_requested = True
+                        print(f"UDP client {address} subscribed")
+                self.__expire_subscribers()
+
+            if new_subscriber is not None:
+                # a late joiner gets the recent messages at once, instead of waiting for the next update
+                with self._history_lock:
+                    history = list(self.history)
+                for generation, data in history:
+                    self.__send(new_subscriber, data)
+            if keyframe_requested and self.on_keyframe_request is not None:
+                self.on_keyframe_request()
+
+    def __expire_subscribers(self):
+        now = time.monotonic()
+        for address, subscriber in list(self.subscribers.items()):
+            if now - subscriber.last_seen > self.subscriber_timeout:
+                del self.subscribers[address]
+                print(f"UDP client {address} expired ({subscriber})")
+
+    def stop(self):
+        self._stop_event.set()
+        if self.UDPServerSocket is not None:
+            self.UDPServerSocket.close()
+
     def update_data(self, data):
-        print("update: ", data)
-        if self._queue.empty():
-            self._queue.put(data)
-        else:
-            self._queue.get()
-            self._queue.put(data)
+        """
+        Replaces the data to send (a json string or binary telemetry bytes, see src/telemetry.py)
+        """
+        # messages are converted to bytes once, on the producer's thread
+        data = data if isinstance(data, bytes) else str.encode(data or "")
+        with self._history_lock:
+            self.data.publish(data)
+            if self.history.maxlen:
+                self.history.append(self.data.get())
+        if not self.quiet:
+            print("update: ", data)
 
     def send_data(self):
-        data = self._queue.get()
-        self.UDPServerSocket.setblocking(0)
+        """
+        Pushes the latest data to all the subscribers, and to the multicast group.
+        Returns immediately with False if there is no data that was not sent already
+        """
+        generation, data = self.data.get()
+        if generation == self.sent_generation:
+            return False
+        self.messages_dropped += generation - self.sent_generation - 1
+        self.sent_generation = generation
+
+        with self._subscribers_lock:
+            targets = list(self.subscribers.values())
+        if self.multicast_group is not None:
+            targets.append(self.multicast_stats)
+
+        if not self.quiet:
+            print("data at time of sending: ", data)
+        for subscriber in targets:
+            self.__send(subscriber, data)
+        if self.quiet:
+            self.log.log('sent', f"UDP server: sent message {generation} ({len(data)} bytes) to {len(targets)} "
+                                 f"subscribers, {self.messages_dropped} messages dropped")
+        return True
+
+    def __send(self, subscriber, data):
         try:
-            bytesAddressPair = self.UDPServerSocket.recvfrom(self.bufferSize)
-        except socket.error as e:
-            err = e.args[0]
-            if err == errno.EAGAIN or err == errno.EWOULDBLOCK:
-                # occurs when the client program is not running and nobody tries to pull data
-                print('No client side data available - sleeping 1 second')
-                time.sleep(1)
-            else:
-                # a "real" error occurred
-                print(e)
+            self.UDPServerSocket.sendto(data, subscriber.address)
+        except OSError as e:
+            subscriber.errors += 1
+            self.log.log(('error', subscriber.address), f"Failed sending to {subscriber.address}: {e}")
         else:
-            message = bytesAddressPair[0]
-            address = bytesAddressPair[1]
+            subscriber.messages_sent += 1
+            subscriber.bytes_sent += len(data)
 
-            # print(self._queue.qsize())
-            print("data at time of sending: ", data)
-            bytesToSend = str.encode(data or "")
-            self.UDPServerSocket.sendto(bytesToSend, address)
+    def stats(self):
+        """
+        Returns the send statistics of the current subscribers (and of the multicast group)
+        """
+        with self._subscribers_lock:
+            stats = list(self.subscribers.values())
+        if self.multicast_group is not None:
+            stats.append(self.multicast_stats)
+        return stats
@@ -0,0 +1,103 @@
+import os
+import time
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+import astar
+from src.grid_search import GridGraph, distance_field
+
+
+def generated_map(seed, rows=60, cols=60, density=0.25):
+    """
+    Returns a random occupancy (True for passable cells) with a start and a goal in the same component
+    """
+    rng = np.random.default_rng(seed)
+    while True:
+        passable = rng.random((rows, cols)) > density
+        start, goal = [tuple(int(v) for v in rng.integers(0, (rows, cols))) for i in range(2)]
+        passable[start] = passable[goal] = True
+        if distance_field(passable, goal)[start] >= 0:
+            return passable, start, goal
+
+
+def search(passable, start, goal, diagonal_moves=False, weight=1.0):
+    """
+    Searches the occupancy with the astar package, returns (path, number of expanded nodes)
+    """
+    rows, cols = passable.shape
+    moves = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    if diagonal_moves:
+        moves += [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+    expansions = []
+
+    def neighbors(loc):
+        expansions.append(loc)
+        locs = [(loc[0] + d_row, loc[1] + d_col) for d_row, d_col in moves]
+        return [(row, col) for row, col in locs if 0 <= row < rows and 0 <= col < cols and passable[row, col]]
+
+    def distance(loc1, loc2):
+        return ((loc1[0] - loc2[0]) ** 2 + (loc1[1] - loc2[1]) ** 2) ** 0.5
+
+    def manhattan(loc, goal):
+        return abs(loc[0] - goal[0]) + abs(loc[1] - goal[1])
+
+    path = astar.find_path(start, goal, neighbors_fnct=neighbors, distance_between_fnct=distance,
+                           heuristic_cost_estimate_fnct=distance if diagonal_moves else manhattan, weight=weight)
+    return (None if path is None else list(path)), len(expansions)
+
+
+def path_length(path):
+    return sum(((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5 for a, b in zip(path, path[1:]))
+
+
+def test_astar_finds_shortest_paths():
+    for seed in range(20):
+        passable, start, goal = generated_map(seed, rows=20, cols=20)
+        path, expansions = search(passable, start, goal)
+        assert path[0] == start and path[-1] == goal
+        assert all(passable[loc] for loc in path)
+        assert path_length(path) == distance_field(passable, goal)[start]
+
+        path, expansions = search(passable, start, goal, diagonal_moves=True)
+        optimal = GridGraph(passable, diagonal_moves=True).shortest_path_length(start, goal)
+        assert abs(path_length(path) - optimal) < 1e-9
+
+
+def test_astar_decrease_key():
+    # with diagonal moves the first (diagonal) path found to a node is improved later,
+    # and stale open set entries must be skipped
+    passable = np.ones((5, 5), dtype=bool)
+    passable[1:4, 2] = False
+    path, expansions = search(passable, (2, 0), (2, 4), diagonal_moves=True)
+    assert abs(path_length(path) - 4 * 2 ** 0.5) < 1e-9
+    assert search(passable, (2, 0), (2, 0))[0] == [(2, 0)]
+    passable[:, 2] = False
+    assert search(passable, (2, 0), (2, 4))[0] is None
+
+
+def test_weighted_astar_is_bounded():
+    for seed in range(20):
+        passable, start, goal = generated_map(seed, rows=30, cols=30)
+        optimal = distance_field(passable, goal)[start]
+        path, expansions = search(passable, start, goal, weight=2.0)
+        assert optimal <= path_length(path) <= 2.0 * optimal
+
+
+if __name__ == '__main__':
+    test_astar_finds_shortest_paths()
+    test_astar_decrease_key()
+    test_weighted_astar_is_bounded()
+
+    # benchmark: node expansions and wall-clock time on generated 60x60 grid maps
+    maps = [generated_map(seed) for seed in range(30)]
+    for diagonal_moves in (False, True):
+        for weight in (1.0, 1.5):
+            expansions, started = 0, time.perf_counter()
+            for passable, start, goal in maps:
+                expansions += search(passable, start, goal, diagonal_moves, weight)[1]
+            elapsed = (time.perf_counter() - started) / len(maps)
+            print(f"{'8' if diagonal_moves else '4'}-connected, weight {weight}: "
+                  f"{expansions / len(maps):.0f} expansions, {elapsed * 1000:.1f}ms per search")
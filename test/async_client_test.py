@@ -0,0 +1,61 @@
+import asyncio
+import os
+import struct
+import time
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from natnet import AsyncMotionClient, MotionListener
+from natnet.adapter import NAT_REQUEST_FRAME_OF_DATA, NAT_DISCONNECT
+from net_helpers import make_socket, make_frames
+
+
+class FrameListener(MotionListener):
+    def __init__(self):
+        super(FrameListener, self).__init__()
+        self.frames = []
+        self.received = asyncio.Event()
+
+    def on_frame_end(self, frame_number, time_info):
+        self.frames.append((time.monotonic(), frame_number))
+        self.received.set()
+
+
+async def receive_command(server):
+    data, address = await asyncio.get_running_loop().sock_recvfrom(server, 1024)
+    return struct.unpack_from('<H', data)[0]
+
+
+def test_async_client_receives_frames():
+    async def run():
+        server = make_socket(timeout=0)  # the command channel of a mock NatNet server
+        listener = FrameListener()
+        client = AsyncMotionClient(listener, ip_local='127.0.0.1', port_data=0,
+                                   ip_server='127.0.0.1', port_command=server.getsockname()[1])
+        task = asyncio.create_task(client.run())
+        assert await asyncio.wait_for(receive_command(server), 5) == NAT_REQUEST_FRAME_OF_DATA
+
+        # frames are delivered as they arrive, without a polling timeout
+        sender = make_socket()
+        sent_time = time.monotonic()
+        sender.sendto(make_frames([1])[0], client.get_data_address())
+        await asyncio.wait_for(listener.received.wait(), 5)
+        assert len(listener.frames) == 1 and listener.frames[0][0] - sent_time < 0.05
+
+        # the task is cancelled cleanly: the server is told to disconnect and the sockets are closed
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        assert await asyncio.wait_for(receive_command(server), 5) == NAT_DISCONNECT
+        assert not client.is_connected
+        sender.close()
+        server.close()
+
+    asyncio.run(asyncio.wait_for(run(), 10))
+
+
+if __name__ == '__main__':
+    test_async_client_receives_frames()
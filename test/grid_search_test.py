@@ -0,0 +1,148 @@
+import os
+import timeit
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+import astar
+from src.grid_search import GridGraph, DistanceFieldCache, ConnectedComponents, distance_field
+
+
+def reference_length(passable, start, goal, diagonal_moves=False):
+    """
+    Reference shortest path length: the generic A* with Euclidean distances
+    """
+    rows, cols = passable.shape
+    moves = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    if diagonal_moves:
+        moves += [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+    def neighbors(loc):
+        locs = [(loc[0] + d_row, loc[1] + d_col) for d_row, d_col in moves]
+        return [(row, col) for row, col in locs if 0 <= row < rows and 0 <= col < cols and passable[row, col]]
+
+    def distance(loc1, loc2):
+        return np.linalg.norm(np.array(loc1) - np.array(loc2), 2)
+
+    path = astar.find_path(start, goal, neighbors_fnct=neighbors, heuristic_cost_estimate_fnct=distance,
+                           distance_between_fnct=distance)
+    if path is None:
+        return None
+    path = list(path)
+    return sum(distance(a, b) for a, b in zip(path, path[1:]))
+
+
+def random_instance(rng, rows=15, cols=20, density=0.3):
+    passable = rng.random((rows, cols)) > density
+    start = tuple(int(v) for v in rng.integers(0, (rows, cols)))
+    goal = tuple(int(v) for v in rng.integers(0, (rows, cols)))
+    passable[goal] = True
+    return passable, start, goal
+
+
+def test_shortest_path_length_matches_reference():
+    rng = np.random.default_rng(0)
+    for diagonal_moves in (False, True):
+        for i in range(100):
+            passable, start, goal = random_instance(rng)
+            expected = reference_length(passable, start, goal, diagonal_moves)
+            length = GridGraph(passable, diagonal_moves=diagonal_moves).shortest_path_length(start, goal)
+            if expected is None:
+                assert length is None
+            else:
+                assert abs(length - expected) < 1e-9
+
+
+def test_shortest_path_length_around_wall():
+    passable = np.ones((3, 5), dtype=bool)
+    passable[:2, 2] = False
+    graph = GridGraph(passable)
+    assert graph.shortest_path_length((0, 0), (0, 4)) == 8
+    assert isinstance(graph.shortest_path_length((0, 0), (0, 4)), int)
+    assert graph.shortest_path_length((0, 0), (0, 0)) == 0
+    passable[2, 2] = False
+    assert GridGraph(passable).shortest_path_length((0, 0), (0, 4)) is None
+
+
+def test_distance_field_matches_shortest_path_lengths():
+    rng = np.random.default_rng(2)
+    for i in range(20):
+        passable, start, goal = random_instance(rng, rows=8, cols=10)
+        graph = GridGraph(passable)
+        field = distance_field(passable, goal)
+        for row in range(8):
+            for col in range(10):
+                length = graph.shortest_path_length((row, col), goal)
+                assert field[row, col] == (-1 if length is None else length)
+
+
+def test_distance_field_cache():
+    cache = DistanceFieldCache(max_size=2)
+    passable = np.ones((4, 4), dtype=bool)
+    field = cache.get(passable, (0, 0))
+    assert field[0, 2] == 2
+    assert cache.get(passable.copy(), (0, 0)) is field
+    assert not field.flags.writeable
+
+    # a changed occupancy has its own fields
+    passable[:3, 1] = False
+    assert cache.get(passable, (0, 0))[0, 2] == 8
+    cache.get(passable, (3, 3))
+    assert len(cache.fields) == 2
+    assert cache.get(np.ones((4, 4), dtype=bool), (0, 0)) is not field  # evicted
+
+
+def test_connected_components_follow_occupancy_changes():
+    rng = np.random.default_rng(3)
+    components = ConnectedComponents()
+    blocked = rng.random((12, 15)) < 0.4
+    for i in range(30):
+        labels = components.update(blocked)
+        free = ~blocked
+        cells = np.argwhere(free)
+        for cell in cells[rng.choice(len(cells), size=5)]:
+            reachable = (distance_field(free, tuple(cell)) >= 0) & free
+            assert np.array_equal(labels == labels[tuple(cell)], reachable)
+        assert (labels[blocked] == -1).all()
+
+        # obstacles are removed (merging components), or removed and added
+        changed = rng.random(blocked.shape) < 0.05
+        blocked = blocked & ~changed if i % 2 else blocked ^ changed
+
+
+if __name__ == '__main__':
+    test_shortest_path_length_matches_reference()
+    test_shortest_path_length_around_wall()
+    test_distance_field_matches_shortest_path_lengths()
+    test_distance_field_cache()
+    test_connected_components_follow_occupancy_changes()
+
+    # benchmark: optimal lengths of a scenario on an open 40x40 grid
+    rng = np.random.default_rng(1)
+    passable = rng.random((40, 40)) > 0.2
+    pairs = [tuple(map(tuple, rng.integers(0, 40, size=(2, 2)).tolist())) for i in range(20)]
+    for start, goal in pairs:
+        passable[goal] = True
+
+    def grid_search():
+        graph = GridGraph(passable)
+        return [graph.shortest_path_length(start, goal) for start, goal in pairs]
+
+    def reference():
+        return [reference_length(passable, start, goal) for start, goal in pairs]
+
+    print(f"reference A*: {timeit.timeit(reference, number=3) / 3 * 1000:.1f}ms")
+    print(f"GridGraph:    {timeit.timeit(grid_search, number=3) / 3 * 1000:.1f}ms")
+
+    def fields():
+        cache = DistanceFieldCache()
+        key = cache.occupancy_key(passable)
+        return [cache.get(passable, goal, key=key)[start] for start, goal in pairs]
+
+    print(f"distance fields (first query): {timeit.timeit(fields, number=3) / 3 * 1000:.1f}ms")
+    cache = DistanceFieldCache()
+    [cache.get(passable, goal) for start, goal in pairs]
+    cached = timeit.timeit(lambda: [cache.get(passable, goal)[start] for start, goal in pairs], number=100) / 100
+    print(f"distance fields (cached):      {cached * 1000:.2f}ms")
@@ -0,0 +1,388 @@
+import os
+import random
+import timeit
+from statistics import mode
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pygame
+
+from natnet import MarkerSet, Position
+from natnet.protocol import MarkerSetType
+from src import mockup
+from src.Grid import Grid, CellVal
+
+
+def make_grid(cell_size=0.3, rows=20, cols=20):
+    grid = Grid(cell_size=cell_size, rows=rows, cols=cols, map_filename='test.map', scene_filename='test.scen',
+                goal_locations='', paths_filename='test_paths.txt', algorithm_output='', surface=None)
+    grid.reset_grid()
+    return grid
+
+
+def sampled_blocked_cells(grid, vertices_list, dr=0.01):
+    """
+    Reference rasterization: samples every line between two markers each `dr` meters.
+    """
+    cells = set()
+    for p1 in vertices_list:
+        for p2 in vertices_list:
+            p1, p2 = np.asarray(p1, dtype=np.float64), np.asarray(p2, dtype=np.float64)
+            length = np.linalg.norm(p2 - p1)
+            steps = np.append(np.arange(0, length, dr), length)
+            for f in steps:
+                point = p1 + (p2 - p1) * (f / length if length else 0)
+                cells.add(tuple(int(v) for v in grid.xy_to_cell(np.float32(point))))
+    return cells
+
+
+def blocked_cells(grid, vertices_list):
+    return {tuple(cell) for cell in grid._Grid__get_blocked_cells(vertices_list).tolist()}
+
+
+def test_blocked_cells_cover_sampled_lines():
+    grid = make_grid()
+    obstacles = [ms for ms in mockup.simple_listener_mock.marker_sets if ms.type == MarkerSetType.Obstacle]
+
+    rng = random.Random(0)
+    polygons = [grid.get_positions_list(obstacle.positions) for obstacle in obstacles]
+    polygons += [[[rng.uniform(-2, 2), rng.uniform(-2, 2)] for i in range(rng.randint(1, 6))] for j in range(50)]
+
+    for vertices in polygons:
+        assert sampled_blocked_cells(grid, vertices) <= blocked_cells(grid, vertices)
+
+
+def test_blocked_cells_of_square_obstacle():
+    grid = make_grid(cell_size=1.0)
+
+    # a square strictly inside cells x in [0, 2], y in [-1, 1] (Motive coordinates)
+    square = [[0.5, -0.5], [2.5, -0.5], [2.5, 1.5], [0.5, 1.5]]
+    expected = {(x, -y) for x in range(0, 3) for y in range(-1, 2)}
+    assert blocked_cells(grid, square) == expected
+
+    # a single marker blocks only its own cell, and a segment along x only the cells it crosses
+    assert blocked_cells(grid, [[0.5, 0.5]]) == {(0, 0)}
+    assert blocked_cells(grid, [[0.5, 0.5], [3.5, 0.5]]) == {(x, 0) for x in range(0, 4)}
+
+
+def test_add_obstacles_marks_hull_cells():
+    grid = make_grid(cell_size=1.0)
+    obstacle = MarkerSet('Obstacle1', [Position(0.5, -0.5, 0), Position(2.5, -0.5, 0), Position(2.5, 1.5, 0),
+                                       Position(0.5, 1.5, 0)], MarkerSetType.Obstacle)
+    grid.add_obstacles([obstacle])
+
+    blocked = sum(cell == CellVal.OBSTACLE_REAL.value for row in grid.grid for cell in row)
+    assert blocked == 9
+
+
+def mockup_objects(robot_shift=0.0):
+    marker_sets = mockup.simple_listener_mock.marker_sets
+    obstacles = [ms for ms in marker_sets if ms.type == MarkerSetType.Obstacle]
+    robots = [(ms.name[ms.name.index('-') + 1::],
+               MarkerSet(ms.name, [Position(p.x + robot_shift, p.y, p.z) for p in ms.positions], ms.type))
+              for ms in marker_sets if ms.type == MarkerSetType.Robot]
+    return obstacles, robots
+
+
+def test_update_objects_matches_full_rebuild():
+    grid = make_grid()
+    for robot_shift in (0.0, 0.001, 0.3, 0.6, 0.6):
+        obstacles, robots = mockup_objects(robot_shift)
+        grid.update_objects(obstacles, robots, tolerance=0)
+
+        rebuilt = make_grid()
+        rebuilt.add_obstacles(obstacles)
+        rebuilt.add_robots(robots, tolerance=0)
+        assert np.array_equal(grid.grid, rebuilt.grid)
+        assert grid.bots == rebuilt.bots
+
+    # removing a robot clears only its cell
+    obstacles, robots = mockup_objects(0.6)
+    row, col = grid.bots[robots[0][0]]
+    grid.update_objects(obstacles, robots[1:], tolerance=0)
+    assert grid.grid[row][col] == CellVal.EMPTY.value
+    assert robots[0][0] not in grid.bots
+
+
+def test_update_objects_skips_unmoved_objects():
+    grid = make_grid()
+    obstacles, robots = mockup_objects()
+    grid.update_objects(obstacles, robots, tolerance=0)
+
+    # any write to the grid would replace these marks
+    for name, cells in grid.obstacles_cells.items():
+        for row, col in cells:
+            grid.grid[row][col] = CellVal.OBSTACLE_ART.value
+    grid.update_objects(obstacles, mockup_objects(robot_shift=grid.move_epsilon / 2)[1], tolerance=0)
+
+    assert all(grid.grid[row][col] == CellVal.OBSTACLE_ART.value
+               for cells in grid.obstacles_cells.values() for row, col in cells)
+
+
+def test_layers_compose_grid_and_map(tmp_path='.'):
+    grid = make_grid(cell_size=1.0, rows=4, cols=4)
+    grid.mapfile = os.path.join(str(tmp_path), 'layers_test.map')
+    obstacle = MarkerSet('Obstacle1', [Position(0.5, 0.5, 0)], MarkerSetType.Obstacle)
+    robot = MarkerSet('Ruby-1', [Position(0.5, 0.5, 0), Position(0.6, 0.6, 0)], MarkerSetType.Robot)
+    grid.update_objects([obstacle], [('1', robot)], tolerance=0)
+
+    row, col = grid.bots['1']
+    assert grid.grid.dtype == np.uint8
+    assert grid.grid[row, col] == CellVal.COLLISION.value
+
+    # the robot leaves the obstacle's cell
+    robot = MarkerSet('Ruby-1', [Position(1.5, 0.5, 0), Position(1.6, 0.6, 0)], MarkerSetType.Robot)
+    grid.update_objects([obstacle], [('1', robot)], tolerance=0)
+    assert grid.grid[row, col] == CellVal.OBSTACLE_REAL.value
+    assert grid.grid[tuple(grid.bots['1'])] == CellVal.ROBOT_FULL.value
+
+    grid.end_bots = {'1': [0, 0]}
+    assert grid.compose_grid(goals=True)[0, 0] == CellVal.GOAL.value
+    assert grid.grid[0, 0] == CellVal.EMPTY.value
+
+    grid.generate_map_file()
+    with open(grid.mapfile) as f:
+        lines = f.read().splitlines()
+    os.remove(grid.mapfile)
+    assert lines[:4] == ['type octile', 'height 4', 'width 4', 'map']
+    assert [line.count('@') for line in lines[4:]] == [0, 1, 0, 0]
+    assert lines[4 + row][col] == '@'
+
+
+def scalar_projection(grid, markers, tolerance):
+    """
+    Reference projection of a single robot, marker by marker.
+    """
+    markers_cells = [grid.xy_to_cell(coord) for coord in markers]
+    if not all(grid.marker_in_bound(cell) for cell in markers_cells):
+        return 'out', [(int(y), int(x)) for y, x in markers_cells]
+    mode_count = markers_cells.count(mode(markers_cells))
+    if mode_count == len(markers_cells) or (mode_count >= len(markers_cells) - 1 and tolerance == 1) or \
+            (mode_count >= len(markers_cells) / 2 and tolerance == 2):
+        return 'full', grid.cell_to_grid_cell(mode(markers_cells))
+    return 'partial', sorted(set(grid.cell_to_grid_cell(cell) for cell in markers_cells))
+
+
+def test_project_robots_matches_scalar_projection():
+    grid = make_grid(rows=10, cols=10)
+    rng = np.random.default_rng(0)
+    for tolerance in (0, 1, 2):
+        markers_list = []
+        for i in range(200):
+            center = rng.uniform(-1.8, 1.8, size=2)
+            markers_list.append(center + rng.normal(scale=0.1, size=(rng.integers(1, 6), 2)))
+
+        placements, partial, out_of_bounds = grid.project_robots(markers_list, tolerance)
+        assert len(placements) + len(partial) + len(out_of_bounds) == len(markers_list)
+        for index, markers in enumerate(markers_list):
+            kind, cells = scalar_projection(grid, markers, tolerance)
+            if kind == 'full':
+                assert placements[index] == cells
+            elif kind == 'partial':
+                assert sorted(partial[index]) == cells
+            else:
+                assert out_of_bounds[index] == cells
+
+
+def test_add_robots_classifies_robots():
+    grid = make_grid(cell_size=1.0, rows=4, cols=4)
+    full = MarkerSet('Ruby-1', [Position(0.5, 0.5, 0), Position(0.6, 0.6, 0)], MarkerSetType.Robot)
+    partial = MarkerSet('Ruby-2', [Position(-0.5, 0.5, 0), Position(-1.5, 0.5, 0)], MarkerSetType.Robot)
+    outside = MarkerSet('Ruby-3', [Position(9.5, 0.5, 0)], MarkerSetType.Robot)
+    grid.add_robots([('1', full), ('2', partial), ('3', outside)], tolerance=0)
+
+    assert grid.bots == {'1': [1, 2]}
+    assert grid.bad_bots == ['2']
+    assert grid.out_of_bounds_bots == [('3', [(9, 0)])]
+    assert sorted(grid.robots_cells['Ruby-2'][1]) == [(2, 2), (3, 2)]
+    assert grid.grid[2, 2] == grid.grid[3, 2] == CellVal.ROBOT_PARTIAL.value
+
+
+def test_add_robots_without_markers():
+    grid = make_grid(cell_size=1.0, rows=4, cols=4)
+    # robots whose markers are all hidden are out of bounds, whether or not other robots are tracked
+    grid.add_robots([('101', MarkerSet('Robot-101', [], MarkerSetType.Robot))])
+    assert grid.out_of_bounds_bots == [('101', [])] and grid.robots_cells['Robot-101'] == ('101', [], False)
+    full = MarkerSet('Ruby-1', [Position(0.5, 0.5, 0)], MarkerSetType.Robot)
+    grid.add_robots([('102', MarkerSet('Robot-102', [], MarkerSetType.Robot)), ('1', full)])
+    assert grid.out_of_bounds_bots[-1] == ('102', []) and grid.bots == {'1': [1, 2]}
+
+
+def make_walled_grid(tmp_path):
+    """
+    A 4x6 grid with a wall at column 3 - robots '1' and '2' are left of it and robot '3' is right of it
+    """
+    grid = make_grid(cell_size=1.0, rows=4, cols=6)
+    grid.mapfile = os.path.join(str(tmp_path), 'goals_test.map')
+    grid.scenfile = os.path.join(str(tmp_path), 'goals_test.scen')
+    grid.grid[:, 3] = CellVal.OBSTACLE_REAL.value
+    grid.bots = {'1': [0, 0], '2': [3, 2], '3': [1, 5]}
+    for row, col in grid.bots.values():
+        grid.grid[row, col] = CellVal.ROBOT_FULL.value
+    return grid
+
+
+def test_sample_goals_without_replacement(tmp_path='.'):
+    grid = make_walled_grid(tmp_path)
+    grid.end_bots = {'3': [0, 4]}
+    random.seed(0)
+    for i in range(20):
+        goals = grid.sample_goals(['1', '2'])
+        cells = [tuple(goal) for goal in goals.values()]
+        assert sorted(goals) == ['1', '2'] and len(set(cells)) == 2
+        assert all(grid.grid[cell] == CellVal.EMPTY.value and cell != (0, 4) for cell in cells)
+
+    # the 16 free cells that are not goals run out
+    assert len(grid.sample_goals(['a' + str(i) for i in range(20)])) == 16
+
+    for i in range(20):
+        goals = grid.sample_goals(['1', '2', '3'], reachable=True)
+        assert all(col < 3 for row, col in (goals['1'], goals['2'])) and goals['3'][1] > 3
+        assert goals['1'] != goals['2']
+
+
+def test_unreachable_goal_is_invalid(tmp_path='.'):
+    grid = make_walled_grid(tmp_path)
+    assert grid.check_goal_validity((0, 1), '1')
+    assert not grid.check_goal_validity((0, 4), '1')
+    assert grid.check_goal_validity((0, 4), '3')
+
+    # a gap in the wall connects the two sides
+    grid.grid[2, 3] = CellVal.EMPTY.value
+    assert grid.check_goal_validity((0, 4), '1')
+
+
+def test_robots_do_not_wall_off_goals(tmp_path='.'):
+    grid = make_walled_grid(tmp_path)
+    # a robot stands in the only gap of the wall, it will move away - so the goal is valid and has a path
+    grid.grid[2, 3] = CellVal.ROBOT_FULL.value
+    grid.bots['4'] = [2, 3]
+    assert grid.check_goal_validity((0, 4), '1')
+    assert grid.is_reachable((0, 0), (0, 4))
+    assert grid.get_optimal_length((0, 0), (0, 4)) == 8.0
+    assert grid.get_optimal_length((0, 0), (0, 4), diagonal_moves=True) is not None
+    # robots are not obstacles on the way either
+    assert grid.get_optimal_length((3, 1), (3, 4)) == 5.0
+
+
+def test_scen_file_is_not_written_without_paths(tmp_path='.'):
+    grid = make_walled_grid(tmp_path)
+    grid.end_bots = {'1': [0, 1], '2': [3, 0], '3': [0, 4]}
+    assert grid.generate_scen_file()
+    with open(grid.scenfile) as f:
+        scenario = f.read()
+    assert 'None' not in scenario and len(scenario.splitlines()) == 4
+
+    # robot '1' is walled off from its goal, the scenario file is kept as it was
+    grid.end_bots['1'] = [0, 5]
+    assert not grid.generate_scen_file()
+    with open(grid.scenfile) as f:
+        assert f.read() == scenario
+    os.remove(grid.scenfile)
+
+
+def test_init_random_scene(tmp_path='.'):
+    grid = make_walled_grid(tmp_path)
+    grid.end_bots = {'1': [2, 0], '9': [0, 1]}  # robot '9' left the arena
+    grid.init_random_scene(from_scratch=False)
+    assert sorted(grid.end_bots) == ['1', '2', '3'] and grid.end_bots['1'] == [2, 0]
+    grid.init_random_scene()
+    assert len({tuple(goal) for goal in grid.end_bots.values()}) == 3
+    with open(grid.scenfile) as f:
+        assert len(f.read().splitlines()) == 4
+    os.remove(grid.mapfile)
+    os.remove(grid.scenfile)
+
+
+def make_drawn_grid():
+    pygame.font.init()
+    grid = make_grid()
+    grid.surface = pygame.Surface((800, 600))
+    return grid
+
+
+def test_render_redraws_changed_cells_only():
+    grid = make_drawn_grid()
+    obstacles, robots = mockup_objects()
+    grid.update_objects(obstacles, robots, tolerance=0)
+    assert grid.render()[0] == grid.surface.get_rect()
+    assert grid.full_redraw
+
+    # nothing changed
+    assert grid.render() == []
+    assert not grid.full_redraw
+
+    # a robot moved one cell, its previous and new cells are redrawn
+    robot_id = robots[0][0]
+    previous = tuple(grid.bots[robot_id])
+    grid.update_objects(obstacles, mockup_objects(robot_shift=0.3)[1][:1] + robots[1:], tolerance=0)
+    assert sorted(grid.render()) == sorted([grid.get_cell_rect(previous),
+                                            grid.get_cell_rect(tuple(grid.bots[robot_id]))])
+
+    # a new goal location is redrawn
+    grid.end_bots = {robots[1][0]: [0, 0]}
+    assert grid.render() == [grid.get_cell_rect((0, 0))]
+
+    # the incremental drawing is the same as drawing everything from scratch
+    rebuilt = make_drawn_grid()
+    rebuilt.update_objects(obstacles, mockup_objects(robot_shift=0.3)[1][:1] + robots[1:], tolerance=0)
+    rebuilt.end_bots = dict(grid.end_bots)
+    rebuilt.surface.fill(rebuilt.background_color)
+    rebuilt.draw_grid()
+    rebuilt.place_objects_on_grid()
+    assert pygame.image.tobytes(grid.surface, 'RGB') == pygame.image.tobytes(rebuilt.surface, 'RGB')
+
+
+def test_render_rebuilds_static_layer_on_resize():
+    grid = make_drawn_grid()
+    grid.render()
+    static_layer = grid.static_layer
+    grid.render()
+    assert grid.static_layer is static_layer
+
+    grid.surface = pygame.Surface((1024, 768))
+    assert grid.render()[0] == grid.surface.get_rect()
+    assert grid.static_layer.get_size() == (1024, 768)
+
+    grid.invalidate_static_layer()
+    assert grid.render()[0] == grid.surface.get_rect()
+
+
+if __name__ == '__main__':
+    test_blocked_cells_cover_sampled_lines()
+    test_blocked_cells_of_square_obstacle()
+    test_add_obstacles_marks_hull_cells()
+    test_update_objects_matches_full_rebuild()
+    test_update_objects_skips_unmoved_objects()
+    test_layers_compose_grid_and_map()
+    test_project_robots_matches_scalar_projection()
+    test_add_robots_classifies_robots()
+    test_add_robots_without_markers()
+    test_render_redraws_changed_cells_only()
+    test_render_rebuilds_static_layer_on_resize()
+    test_sample_goals_without_replacement()
+    test_unreachable_goal_is_invalid()
+    test_robots_do_not_wall_off_goals()
+    test_scen_file_is_not_written_without_paths()
+    test_init_random_scene()
+
+    grid = make_grid()
+    obstacles = [ms for ms in mockup.simple_listener_mock.marker_sets if ms.type == MarkerSetType.Obstacle]
+    seconds = timeit.timeit(lambda: grid.add_obstacles(obstacles), number=100)
+    print('add_obstacles: {:.2f} ms for {} obstacles'.format(seconds * 10, len(obstacles)))
+    obstacles, robots = mockup_objects()
+    seconds = timeit.timeit(lambda: grid.update_objects(obstacles, robots, tolerance=0), number=100)
+    print('update_objects without motion: {:.3f} ms'.format(seconds * 10))
+    markers_list = [np.random.uniform(-2.5, 2.5, size=(4, 2)) for i in range(30)]
+    seconds = timeit.timeit(lambda: grid.project_robots(markers_list), number=100)
+    print('project_robots: {:.3f} ms for {} robots'.format(seconds * 10, len(markers_list)))
+    grid = make_drawn_grid()
+    grid.update_objects(obstacles, robots, tolerance=0)
+    grid.render()
+    seconds = timeit.timeit(lambda: grid.render(), number=100)
+    print('render without changes: {:.3f} ms'.format(seconds * 10))
+    seconds = timeit.timeit(lambda: (grid.surface.fill(grid.background_color), grid.draw_grid(),
+                                     grid.place_objects_on_grid()), number=100)
+    print('full redraw: {:.3f} ms'.format(seconds * 10))
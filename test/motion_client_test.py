@@ -0,0 +1,184 @@
+import contextlib
+import io
+import os
+import socket
+import struct
+import time
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from natnet import MotionClient, MotionListener
+from natnet.motion_client import SIZE_BUFFER, SIZE_RECEIVE_BUFFER
+from natnet.adapter import NAT_REQUEST_FRAME_OF_DATA, NAT_DISCONNECT
+from natnet.arrays import ArrayProtocol
+from net_helpers import wait_for, make_socket, make_frames
+
+
+class FrameListener(MotionListener):
+    def __init__(self):
+        super(FrameListener, self).__init__()
+        self.frame_numbers = []
+        self.array_frames = []
+
+    def on_frame_end(self, frame_number, time_info):
+        self.frame_numbers.append(frame_number)
+
+    def on_array_frame(self, frame):
+        self.frame_numbers.append(frame.frame_number)
+        self.array_frames.append(frame)
+
+
+def test_batch_receive_counts_frames():
+    server = make_socket()  # the command channel of a mock NatNet server
+    listener = FrameListener()
+    client = MotionClient(listener, ip_local='127.0.0.1', port_data=0, ip_server='127.0.0.1',
+                          port_command=server.getsockname()[1], batch_receive=True)
+    try:
+        client.get_data()
+        assert struct.unpack_from('<H', server.recv(1024))[0] == NAT_REQUEST_FRAME_OF_DATA
+        time.sleep(0.2)  # pending packets are cleared when the client starts receiving
+
+        # a burst of frames, frame 4 was lost on the way
+        sender = make_socket()
+        for frame in make_frames([1, 2, 3, 5, 6]):
+            sender.sendto(frame, client.get_data_address())
+        stats = client.receive_stats
+        assert wait_for(lambda: stats.last_frame_number == 6 and listener.frame_numbers[-1:] == [6])
+        assert stats.datagrams == 5 and stats.frames_dropped == 1
+        assert stats.frames_decoded + stats.frames_skipped == 5
+        assert listener.frame_numbers == sorted(listener.frame_numbers)
+        assert stats.receive_buffer_size > 32768
+        sender.close()
+    finally:
+        client.disconnect()
+    assert struct.unpack_from('<H', server.recv(1024))[0] == NAT_DISCONNECT
+    server.close()
+
+
+def test_latest_only_decodes_newest_frame():
+    listener = FrameListener()
+    client = MotionClient(listener, ip_local='127.0.0.1', batch_receive=True)
+    client._process_batch([memoryview(frame) for frame in make_frames([7, 8, 9])])
+    assert listener.frame_numbers == [9]
+    assert (client.receive_stats.frames_decoded, client.receive_stats.frames_skipped) == (1, 2)
+
+    client = MotionClient(listener, ip_local='127.0.0.1', batch_receive=True, latest_only=False)
+    client._process_batch([memoryview(frame) for frame in make_frames([10, 11, 13])])
+    assert listener.frame_numbers == [9, 10, 11, 13]
+    assert (client.receive_stats.frames_decoded, client.receive_stats.frames_dropped) == (3, 1)
+
+
+def test_batch_array_frames_do_not_alias_buffers():
+    first, second = make_frames([1, 2])
+    _, expected = ArrayProtocol().unpack_array_frame_from(first, 4)
+    # the second frame's unlabeled markers are moved, in place
+    start = first.find(expected.unlabeled_markers.tobytes())
+    moved = (expected.unlabeled_markers + 1).astype('<f4').tobytes()
+    second = second[:start] + moved + second[start + len(moved):]
+
+    listener = FrameListener()
+    client = MotionClient(listener, ip_local='127.0.0.1', batch_receive=True, array_frames=True)
+    buffer = memoryview(bytearray(SIZE_BUFFER))  # received into again by every batch
+    for frame in (first, second):
+        buffer[:len(frame)] = frame
+        client._process_batch([buffer[:len(frame)]])
+        # the frame decoded from the buffer itself is not changed by the next packets either
+        _, decoded = ArrayProtocol().unpack_array_frame_from(buffer, 4)
+        buffer[:len(frame)] = bytes(len(frame))
+        assert decoded.unlabeled_markers.tobytes() == frame[start:start + len(moved)]
+
+    assert listener.frame_numbers == [1, 2]
+    assert (listener.array_frames[0].unlabeled_markers == expected.unlabeled_markers).all()
+    assert (listener.array_frames[1].unlabeled_markers == expected.unlabeled_markers + 1).all()
+
+
+class FlakySocket:
+    """
+    A data socket that fails while a batch is drained, then times out once the client is disconnected
+    """
+    def __init__(self, client, frame):
+        self.client = client
+        self.frame = frame
+        self.timeouts = []
+        self.receives = 0
+
+    def setsockopt(self, *args):
+        pass
+
+    def getsockopt(self, *args):
+        return SIZE_RECEIVE_BUFFER
+
+    def settimeout(self, timeout):
+        self.timeouts.append(timeout)
+
+    def recv(self, size):
+        raise BlockingIOError()
+
+    def recv_into(self, buffer, size=0, flags=0):
+        self.receives += 1
+        if self.receives == 1:
+            buffer[:len(self.frame)] = self.frame
+            return len(self.frame)
+        if self.receives == 2:
+            raise ConnectionResetError()
+        self.client._is_running = False
+        raise socket.timeout()
+
+    def close(self):
+        pass
+
+
+def test_batch_receive_restores_timeout_after_errors():
+    listener = FrameListener()
+    client = MotionClient(listener, ip_local='127.0.0.1', batch_receive=True)
+    data_socket = FlakySocket(client, make_frames([1])[0])
+    dont_wait = getattr(socket, 'MSG_DONTWAIT', None)
+    if dont_wait is not None:
+        del socket.MSG_DONTWAIT  # as on Windows, the socket's timeout is switched while a batch is drained
+    try:
+        client._is_running = True
+        client._batch_data_callback(data_socket, timeout=0.1)
+    finally:
+        if dont_wait is not None:
+            socket.MSG_DONTWAIT = dont_wait
+    # the socket blocks again after the failed drain, and the frame received before the error is delivered
+    assert data_socket.timeouts[-2:] == [0, 0.1]
+    assert listener.frame_numbers == [1] and data_socket.receives == 3
+
+
+class ClosingSocket(FlakySocket):
+    """
+    A data socket that fails once, then is closed while the client is disconnected
+    """
+    def recv(self, size):
+        if size == 1:
+            raise BlockingIOError()  # nothing pending when the client starts receiving
+        self.receives += 1
+        if self.receives == 1:
+            return self.frame
+        if self.receives == 2:
+            raise ConnectionResetError()
+        self.client._is_running = False
+        raise OSError('closed')
+
+
+def test_receive_continues_after_errors():
+    listener = FrameListener()
+    client = MotionClient(listener, ip_local='127.0.0.1')
+    data_socket = ClosingSocket(client, make_frames([1])[0])
+    client._is_running = True
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        client._data_callback(data_socket, timeout=0.1)
+    # the error is reported and receiving goes on, until the socket is closed by disconnecting
+    assert listener.frame_numbers == [1] and data_socket.receives == 3
+    assert output.getvalue().splitlines() == ['NatNetClient receive error: ']
+
+
+if __name__ == '__main__':
+    test_batch_receive_counts_frames()
+    test_latest_only_decodes_newest_frame()
+    test_batch_array_frames_do_not_alias_buffers()
+    test_batch_receive_restores_timeout_after_errors()
+    test_receive_continues_after_errors()
@@ -0,0 +1,41 @@
+import os
+import socket
+import struct
+import time
+
+# a NatNet 3.0 frame of data message, recorded from Motive
+PATH_FRAME = os.path.join(os.path.dirname(__file__), 'data', 'frame_packet_v3.bin')
+
+
+def wait_for(condition, timeout=5.0):
+    """
+    Polls the condition (a function without arguments) until it is true or the timeout (in seconds) passes.
+    Returns the condition's last value
+    """
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def make_socket(timeout=5.0):
+    """
+    Returns a UDP socket bound to a free port on the local host (timeout 0 for a non-blocking socket)
+    """
+    udp_socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    udp_socket.bind(('127.0.0.1', 0))
+    udp_socket.settimeout(timeout)
+    return udp_socket
+
+
+def make_frames(frame_numbers):
+    """
+    Returns copies of the recorded frame of data message, with the given frame numbers
+    """
+    with open(PATH_FRAME, 'rb') as f:
+        frame = bytearray(f.read())
+    frames = []
+    for frame_number in frame_numbers:
+        struct.pack_into('<I', frame, 4, frame_number)
+        frames.append(bytes(frame))
+    return frames
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import mockup
+from src.pipeline import LatestValue, FrameSnapshot, GridView, StateThread, Broadcaster
+from src.planner_controller import PlannerController
+
+
+def make_planner_controller(listener):
+    arguments = SimpleNamespace(cell_size=0.3, height=6.0, width=6.0, epsilon=0.005, map='test.map',
+                                scene='test.scen', goals='', solver='default', timeout=60.0, cache_size=0,
+                                portfolio=[], deadline=None)
+    return PlannerController(arguments_parser=arguments, listener=listener, surface=None)
+
+
+def test_latest_value_keeps_newest_only():
+    slot = LatestValue()
+    assert slot.get() == (0, None)
+
+    slot.publish('a')
+    slot.publish('b')
+    assert slot.get() == (2, 'b')
+
+    # waiting for a newer value than the one already read times out with the same generation
+    assert slot.wait_newer(2, timeout=0.01) == (2, 'b')
+
+    threading.Timer(0.05, slot.publish, args=('c',)).start()
+    assert slot.wait_newer(2, timeout=5) == (3, 'c')
+
+
+def test_state_thread_publishes_grid_views():
+    listener = mockup.ListenerMock(list(mockup.simple_listener_mock.bodies),
+                                   list(mockup.simple_listener_mock.marker_sets))
+    planner_controller = make_planner_controller(listener)
+    state_thread = StateThread(planner_controller, listener.snapshots, timeout=0.01)
+    state_thread.start()
+    try:
+        generation, view = planner_controller.views.wait_newer(1, timeout=5)
+        deadline = time.monotonic() + 5
+        while not view.labels and time.monotonic() < deadline:
+            generation, view = planner_controller.views.wait_newer(generation, timeout=0.1)
+        assert isinstance(view, GridView)
+        assert set(view.labels.values()) == set(planner_controller.grid.bots)
+
+        # commands run on the state thread, and their result is published
+        ran_on = []
+        planner_controller.submit(lambda: ran_on.append(threading.current_thread()))
+        generation, view = planner_controller.views.wait_newer(generation, timeout=5)
+        assert ran_on == [state_thread]
+    finally:
+        state_thread.stop()
+        state_thread.join()
+
+
+class RecordingServer:
+    def __init__(self):
+        self.sent = []
+        self.data = None
+
+    def update_data(self, data):
+        self.data = data
+
+    def send_data(self):
+        self.sent.append((time.monotonic(), self.data))
+
+
+def test_broadcaster_sends_latest_snapshot_at_fixed_rate():
+    snapshots = LatestValue()
+    server = RecordingServer()
+    broadcaster = Broadcaster(server, snapshots, encode=lambda snapshot: snapshot.frame_number, rate=50)
+    broadcaster.start()
+    try:
+        time.sleep(0.1)
+        assert server.sent == []  # nothing to send before the first frame
+
+        for frame_number in range(1, 101):
+            snapshots.publish(FrameSnapshot(frame_number, (), ()))
+        time.sleep(0.3)
+    finally:
+        broadcaster.stop()
+        broadcaster.join()
+
+    # frames published between two ticks are not sent, and the rate does not depend on the frames' rate
+    assert [data for sent_time, data in server.sent] == [100] * len(server.sent)
+    assert 5 <= len(server.sent) <= 25
+
+
+if __name__ == '__main__':
+    test_latest_value_keeps_newest_only()
+    test_state_thread_publishes_grid_views()
+    test_broadcaster_sends_latest_snapshot_at_fixed_rate()
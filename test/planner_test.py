@@ -0,0 +1,337 @@
+import os
+import shlex
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import mockup
+from src.Grid import CellVal
+from src.planner_controller import PlannerController
+from src.planner_cache import PlannerCache
+from src.planner_process import PlannerProcess, PlannerState, read_paths_file
+from src.solvers import MAPFInstance, ExternalSolver, PrioritizedSolver, PortfolioSolver, CBS_COMMAND, \
+    create_solver, is_valid_solution
+
+
+def stub_command(*args):
+    return ' '.join([shlex.quote(sys.executable), shlex.quote(os.path.join(os.path.dirname(__file__),
+                                                                           'stub_solver.py'))] + list(args))
+
+
+# the stub solver in place of CBS, with the same fields as CBS_COMMAND
+STUB_SOLVER = stub_command('-m', '{map}', '-a', '{scen}', '--outputPaths={paths}', '-k', '{agents}', '-t', '{timeout}')
+
+
+def make_planner_controller(data_path, solver=STUB_SOLVER, timeout=10.0, cache_size=0, portfolio=(), deadline=None):
+    arguments = SimpleNamespace(cell_size=0.3, height=6.0, width=6.0, epsilon=0.005, map='test.map',
+                                scene='test.scen', goals='', solver=solver, timeout=timeout, cache_size=cache_size,
+                                portfolio=list(portfolio), deadline=deadline)
+    planner_controller = PlannerController(arguments_parser=arguments, listener=mockup.simple_listener_mock,
+                                           surface=None)
+    planner_controller.SEND_SOLUTION = False
+    planner_controller.data_path = data_path
+    planner_controller.paths_filename = os.path.join(data_path, 'test_paths.txt')
+    planner_controller.algorithm_output = os.path.join(data_path, 'algorithm_output')
+    planner_controller.grid.mapfile = os.path.join(data_path, 'test.map')
+    planner_controller.grid.scenfile = os.path.join(data_path, 'test.scen')
+    planner_controller.planner_cache.directory = os.path.join(data_path, 'planner_cache')
+    return planner_controller
+
+
+def make_scenario(planner_controller):
+    planner_controller.update_grid(mockup.simple_listener_mock.snapshots.get()[1])
+    grid = planner_controller.grid
+    robots = sorted(grid.bots)
+    grid.end_bots = {robot_id: [0, i] for i, robot_id in enumerate(robots)}
+    grid.generate_map_file()
+    grid.generate_scen_file()
+    return robots
+
+
+def test_planner_process_states():
+    completed = []
+    finished = PlannerProcess(stub_command('--fail'), on_complete=completed.append).start()
+    assert finished.wait(timeout=10) == PlannerState.FAILED
+    assert completed == [finished]
+    assert 'stub solver failed' in finished.output
+
+    missing = PlannerProcess('no-such-solver-command').start()
+    assert missing.wait(timeout=10) == PlannerState.FAILED
+
+    timed_out = PlannerProcess(stub_command('--sleep', '30'), timeout=0.5, kill_grace=0.5).start()
+    assert timed_out.wait(timeout=10) == PlannerState.TIMED_OUT
+    assert timed_out.elapsed() < 5
+    assert timed_out.progress() == 1.0
+
+
+def test_planner_process_cancel():
+    process = PlannerProcess(stub_command('--sleep', '30'), timeout=20, kill_grace=0.5).start()
+    deadline = time.monotonic() + 10
+    while not process.output and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert process.is_running()
+    assert process.output[0] == 'stub solver started'
+
+    process.cancel()
+    assert process.wait(timeout=10) == PlannerState.CANCELLED
+    assert not process.is_running()
+    assert 'cancelled' in process.status()
+
+
+def test_run_planner_in_background():
+    with tempfile.TemporaryDirectory() as data_path:
+        planner_controller = make_planner_controller(data_path + os.sep)
+        robots = make_scenario(planner_controller)
+        grid = planner_controller.grid
+
+        planner_controller.run_planner()
+        # the planner runs in the background, its paths are swapped in by the grid's thread
+        assert planner_controller.planner_process.wait(timeout=10) == PlannerState.FINISHED
+        assert not grid.has_paths
+        assert planner_controller.run_commands()
+
+        assert grid.has_paths
+        assert sorted(grid.solution_paths_on_grid) == [str(i) for i in range(len(robots))]
+        for i, robot_id in enumerate(robots):
+            path = grid.solution_paths_on_grid[str(i)]
+            assert list(path[0]) == grid.bots[robot_id]
+            assert list(path[-1]) == [0, i]
+
+
+def assert_valid_solution(paths, starts, goals):
+    assert sorted(paths) == [str(i) for i in range(len(starts))]
+    for i in range(len(starts)):
+        path = paths[str(i)]
+        assert path[0] == starts[i]
+        assert path[-1] == goals[i]
+        for a, b in zip(path, path[1:]):
+            assert abs(a[0] - b[0]) + abs(a[1] - b[1]) <= 1
+
+    # agents stay at their goals after reaching them
+    makespan = max(len(path) for path in paths.values())
+    timed = [path + [path[-1]] * (makespan - len(path)) for path in paths.values()]
+    for t in range(makespan):
+        locations = [path[t] for path in timed]
+        assert len(set(locations)) == len(locations)  # vertex conflict
+        if t > 0:
+            moves = {(path[t - 1], path[t]) for path in timed if path[t - 1] != path[t]}
+            assert not any((b, a) in moves for a, b in moves)  # swap conflict
+
+
+def test_planner_is_not_run_again_while_completing():
+    with tempfile.TemporaryDirectory() as data_path:
+        planner_controller = make_planner_controller(data_path + os.sep)
+        make_scenario(planner_controller)
+        on_planner_complete = planner_controller.on_planner_complete
+        runs = []
+
+        def run_again(planner_process, key=None):
+            # the run already ended, but its solution is still handled: a second run is rejected
+            assert planner_process.state == PlannerState.FINISHED and planner_process.is_running()
+            planner_controller.run_planner()
+            runs.append(planner_controller.planner_process)
+            on_planner_complete(planner_process, key)
+
+        planner_controller.on_planner_complete = run_again
+        planner_controller.run_planner()
+        process = planner_controller.planner_process
+        assert process.wait(timeout=10) == PlannerState.FINISHED
+        assert runs == [process] and not process.is_running()
+
+
+def test_run_planner_with_spaces_in_paths():
+    with tempfile.TemporaryDirectory(prefix='planner data ') as data_path:
+        planner_controller = make_planner_controller(data_path + os.sep)
+        robots = make_scenario(planner_controller)
+        # the files' paths are quoted in the solver's command line
+        assert planner_controller.solver.get_command(planner_controller.get_instance()).count(data_path) == 3
+        planner_controller.run_planner()
+        assert planner_controller.planner_process.wait(timeout=10) == PlannerState.FINISHED
+        assert len(planner_controller.planner_process.paths) == len(robots)
+
+
+def test_unsolvable_instance_is_not_planned():
+    with tempfile.TemporaryDirectory() as data_path:
+        planner_controller = make_planner_controller(data_path + os.sep)
+        robots = make_scenario(planner_controller)
+        grid = planner_controller.grid
+        # the first robot's goal is walled off
+        row, col = grid.end_bots[robots[0]]
+        for neighbor in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+            if 0 <= neighbor[0] < grid.rows and 0 <= neighbor[1] < grid.cols:
+                grid.grid[neighbor] = CellVal.OBSTACLE_REAL.value
+
+        assert planner_controller.get_instance() is None
+        planner_controller.run_planner()
+        assert planner_controller.planner_process is None
+
+
+def test_prioritized_solver():
+    # a wall with a gap in the middle, the agents cross it in opposite directions
+    occupancy = np.zeros((5, 5), dtype=bool)
+    occupancy[:, 2] = True
+    occupancy[2, 2] = False
+    starts = [(2, 0), (2, 4), (0, 1), (4, 3)]
+    goals = [(2, 4), (2, 0), (4, 3), (0, 1)]
+    instance = MAPFInstance(occupancy, starts, goals, '', '', '', timeout=10.0)
+
+    paths = PrioritizedSolver().solve(instance)
+    assert paths is not None
+    assert_valid_solution(paths, starts, goals)
+
+    # a goal on an obstacle, and a goal that can not be reached
+    assert PrioritizedSolver().solve(instance._replace(goals=[(0, 2), (2, 0), (4, 3), (0, 1)])) is None
+    occupancy = occupancy.copy()
+    occupancy[2, 2] = True
+    assert PrioritizedSolver().solve(instance._replace(occupancy=occupancy)) is None
+
+
+def test_create_solver():
+    assert isinstance(create_solver('prioritized'), PrioritizedSolver)
+    assert create_solver('default').command == CBS_COMMAND
+    external = create_solver(STUB_SOLVER)
+    assert isinstance(external, ExternalSolver) and external.cacheable
+    instance = MAPFInstance(None, [(0, 0)], [(0, 1)], 'a.map', 'a.scen', 'a_paths.txt', timeout=5)
+    assert external.get_command(instance) == stub_command('-m', 'a.map', '-a', 'a.scen', '--outputPaths=a_paths.txt',
+                                                          '-k', '1', '-t', '5')
+
+
+def test_run_prioritized_planner():
+    with tempfile.TemporaryDirectory() as data_path:
+        planner_controller = make_planner_controller(data_path + os.sep, solver='prioritized')
+        robots = make_scenario(planner_controller)
+        grid = planner_controller.grid
+
+        planner_controller.run_planner()
+        assert planner_controller.planner_process.wait(timeout=10) == PlannerState.FINISHED
+        planner_controller.run_commands()
+        assert_valid_solution(grid.solution_paths_on_grid, [tuple(grid.bots[robot_id]) for robot_id in robots],
+                              [(0, i) for i in range(len(robots))])
+
+
+def test_portfolio_takes_first_valid_solution():
+    with tempfile.TemporaryDirectory() as data_path:
+        # the first CBS stand-in fails, the second one never ends, the prioritized planner solves the scenario
+        planner_controller = make_planner_controller(data_path + os.sep, solver=STUB_SOLVER + ' --fail',
+                                                     portfolio=[STUB_SOLVER + ' --sleep 30', 'prioritized'])
+        robots = make_scenario(planner_controller)
+        solver = planner_controller.solver
+        assert isinstance(solver, PortfolioSolver) and not solver.cacheable
+        assert solver.solvers[2].processes
+        solver.max_workers = 3  # all at once, regardless of the number of CPUs
+
+        planner_controller.run_planner()
+        portfolio = planner_controller.planner_process
+        assert portfolio.wait(timeout=20) == PlannerState.FINISHED
+        assert portfolio.winner == '2:prioritized'
+        assert portfolio.runs[0].state == PlannerState.FAILED
+        # the solver that is still running is stopped
+        assert portfolio.runs[1].wait(timeout=10) == PlannerState.CANCELLED
+
+        planner_controller.run_commands()
+        grid = planner_controller.grid
+        assert read_paths_file(planner_controller.paths_filename) == grid.solution_paths_on_grid
+        assert is_valid_solution(planner_controller.get_instance(), grid.solution_paths_on_grid)
+        assert len(grid.solution_paths_on_grid) == len(robots)
+
+
+def test_portfolio_with_deadline_takes_best_solution():
+    with tempfile.TemporaryDirectory() as data_path:
+        # prioritized planners with different agents' orderings
+        planner_controller = make_planner_controller(data_path + os.sep, solver='prioritized',
+                                                     portfolio=['prioritized', 'prioritized'], deadline=30.0)
+        make_scenario(planner_controller)
+        planner_controller.solver.max_workers = 3
+        planner_controller.run_planner()
+        portfolio = planner_controller.planner_process
+        # every solver ended before the deadline, there is no need to wait for it
+        assert portfolio.wait(timeout=20) == PlannerState.FINISHED
+        assert portfolio.elapsed() < 30.0
+        costs = [sum(len(path) - 1 for path in run.paths.values()) for run in portfolio.runs]
+        assert sum(len(path) - 1 for path in portfolio.paths.values()) == min(costs)
+
+
+def test_portfolio_deadline_after_timeout_keeps_solution():
+    with tempfile.TemporaryDirectory() as data_path:
+        # the deadline is longer than the portfolio's timeout, and the CBS stand-in never ends
+        planner_controller = make_planner_controller(data_path + os.sep, solver='prioritized', timeout=2.0,
+                                                     portfolio=[STUB_SOLVER + ' --sleep 30'], deadline=30.0)
+        make_scenario(planner_controller)
+        solver = planner_controller.solver
+        solver.max_workers = 2
+        solver.kill_grace = 0.5
+        planner_controller.run_planner()
+        portfolio = planner_controller.planner_process
+        # the solution that was found before the timeout is used
+        assert portfolio.wait(timeout=20) == PlannerState.FINISHED
+        assert portfolio.elapsed() < 30.0
+        assert portfolio.winner == '0:prioritized'
+        assert portfolio.runs[1].wait(timeout=10) == PlannerState.CANCELLED
+
+
+def test_planner_cache_evicts_least_recently_used():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = PlannerCache(os.path.join(directory, 'cache'), max_entries=2)
+        output = os.path.join(directory, 'paths.txt')
+        for key in ('a', 'b'):
+            with open(output, 'w') as f:
+                f.write(key)
+            cache.put(key, output)
+            time.sleep(0.01)
+
+        assert cache.get('a') is not None  # 'a' becomes the most recently used
+        time.sleep(0.01)
+        cache.put('c', output)
+        assert cache.get('b') is None
+        with open(cache.get('a')) as f:
+            assert f.read() == 'a'
+        assert cache.get('c') is not None
+
+        assert PlannerCache(os.path.join(directory, 'cache'), max_entries=0).get('a') is None
+
+
+def test_repeated_instance_is_loaded_from_cache():
+    with tempfile.TemporaryDirectory() as data_path:
+        planner_controller = make_planner_controller(data_path + os.sep, cache_size=4)
+        make_scenario(planner_controller)
+        planner_controller.run_planner()
+        first_process = planner_controller.planner_process
+        assert first_process.wait(timeout=10) == PlannerState.FINISHED
+        planner_controller.run_commands()
+        solution = planner_controller.grid.solution_paths_on_grid
+
+        # same instance: no solver is started, and the solution is set at once
+        planner_controller.grid.has_paths = False
+        planner_controller.run_planner()
+        assert planner_controller.planner_process is first_process
+        assert planner_controller.grid.has_paths
+        assert planner_controller.grid.solution_paths_on_grid == solution
+
+        # a changed scenario is solved again
+        planner_controller.grid.end_bots = {robot_id: [1, i] for i, robot_id in enumerate(planner_controller.grid.bots)}
+        planner_controller.grid.generate_scen_file()
+        planner_controller.run_planner()
+        assert planner_controller.planner_process is not first_process
+        assert planner_controller.planner_process.wait(timeout=10) == PlannerState.FINISHED
+
+
+if __name__ == '__main__':
+    test_planner_process_states()
+    test_planner_process_cancel()
+    test_run_planner_in_background()
+    test_planner_is_not_run_again_while_completing()
+    test_run_planner_with_spaces_in_paths()
+    test_unsolvable_instance_is_not_planned()
+    test_prioritized_solver()
+    test_create_solver()
+    test_run_prioritized_planner()
+    test_portfolio_takes_first_valid_solution()
+    test_portfolio_with_deadline_takes_best_solution()
+    test_portfolio_deadline_after_timeout_keeps_solution()
+    test_planner_cache_evicts_least_recently_used()
+    test_repeated_instance_is_loaded_from_cache()
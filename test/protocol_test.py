@@ -0,0 +1,196 @@
+import os
+import struct
+import timeit
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from natnet import MotionListener, FrameSection, Position
+from natnet.adapter import Adapter
+from natnet.arrays import ArrayFrame
+
+PATH_DATA = os.path.join(os.path.dirname(__file__), 'data')
+PATH_FRAME = 'frame_packet_v3.bin'
+
+
+class RecordingListener(MotionListener):
+    """
+    Keeps the last frame delivered by the adapter, as printable strings for comparison.
+    """
+    def __init__(self):
+        super(RecordingListener, self).__init__()
+        self.frame = {}
+
+    def on_rigid_body(self, bodies, time_info):
+        self.frame['bodies'] = repr(bodies)
+        self.frame['time_info'] = repr(time_info)
+
+    def on_skeletons(self, skeletons, time_info):
+        self.frame['skeletons'] = repr(skeletons)
+
+    def on_labeled_markers(self, markers, time_info):
+        self.frame['labeled_markers'] = repr(markers)
+
+    def on_unlabeled_markers(self, markers, time_info):
+        self.frame['unlabeled_markers'] = repr(markers)
+
+    def on_marker_sets(self, marker_sets, time_info):
+        self.frame['marker_sets'] = repr([(ms.name, ms.type, ms.positions) for ms in marker_sets])
+
+    def on_array_frame(self, frame):
+        self.frame['array_frame'] = frame
+
+
+def read_frame():
+    with open(os.path.join(PATH_DATA, PATH_FRAME), 'rb') as f:
+        return f.read()
+
+
+def build_frame(marker_sets, bodies, frame_number=1, skeletons=(), labeled_markers=(), force_plates=()):
+    """
+    Packs a NatNet 3.0 frame of data message with the given marker sets {name: [(x, y, z)]},
+    rigid bodies [(id, (x, y, z), (w, x, y, z))], skeletons [(id, bodies)], labeled markers [(id, (x, y, z))]
+    and force plates [(id, [[value]])].
+    """
+    def pack_bodies(bodies_list):
+        packed = struct.pack('<I', len(bodies_list))
+        for body_id, position, rotation in bodies_list:
+            packed += struct.pack('<I3f4ffh', body_id, *(position + rotation + (0.001, 1)))
+        return packed
+
+    payload = struct.pack('<II', frame_number, len(marker_sets))
+    for name, positions in marker_sets.items():
+        payload += name.encode('utf-8') + b'\0' + struct.pack('<I', len(positions))
+        for position in positions:
+            payload += struct.pack('<fff', *position)
+    payload += struct.pack('<I', 0)  # no unlabeled markers
+    payload += pack_bodies(bodies)
+    payload += struct.pack('<I', len(skeletons))
+    for skeleton_id, skeleton_bodies in skeletons:
+        payload += struct.pack('<I', skeleton_id) + pack_bodies(skeleton_bodies)
+    payload += struct.pack('<I', len(labeled_markers))
+    for marker_id, position in labeled_markers:
+        payload += struct.pack('<I3ffhf', marker_id, *(position + (0.01, 0, 0.0)))
+    payload += struct.pack('<I', len(force_plates))
+    for plate_id, channels in force_plates:
+        payload += struct.pack('<II', plate_id, len(channels))
+        for values in channels:
+            payload += struct.pack('<I{}I'.format(len(values)), len(values), *values)
+    payload += struct.pack('<I', 0)  # no devices
+    payload += struct.pack('<IIdQQQ', 0, 0, 1.5, 1, 2, 3)
+    payload += struct.pack('<h', 0)
+    return struct.pack('<HH', 7, len(payload)) + payload
+
+
+SYNTHETIC_FRAME = build_frame(
+    marker_sets={'Obstacle1': [(0.5, 1.0, 0.25), (0.75, 1.25, 0.25)],
+                 'Ruby-1': [(0.25, -0.5, 0.125), (0.5, -0.5, 0.125), (0.375, -0.25, 0.125)],
+                 'all': [(0.5, 1.0, 0.25)]},
+    bodies=[(101, (0.375, -0.5, 0.125), (1.0, 0.0, 0.0, 0.0)),
+            (305, (0.5, 1.0, 0.25), (0.5, 0.5, 0.5, 0.5))],
+    labeled_markers=[(7, (0.5, 1.0, 0.25))],
+    force_plates=[(1, [[1, 2, 3], [4]])])
+
+
+def decode(frame, offset_decoding):
+    listener = RecordingListener()
+    Adapter(listener, offset_decoding=offset_decoding).process_message(frame)
+    return listener.frame
+
+
+def test_offset_decoder_matches_protocol():
+    for frame in (read_frame(), SYNTHETIC_FRAME):
+        legacy = decode(frame, offset_decoding=False)
+        offset = decode(frame, offset_decoding=True)
+
+        assert set(legacy) == {'bodies', 'time_info', 'skeletons', 'labeled_markers', 'unlabeled_markers',
+                               'marker_sets'}
+        assert offset == legacy
+
+
+def test_offset_decoder_accepts_buffers():
+    frame = read_frame()
+    expected = decode(frame, offset_decoding=True)
+
+    assert decode(bytearray(frame), offset_decoding=True) == expected
+    assert decode(memoryview(frame), offset_decoding=True) == expected
+
+
+def test_array_frame_matches_protocol():
+    for frame in (read_frame(), SYNTHETIC_FRAME):
+        expected = decode(frame, offset_decoding=False)
+
+        listener = RecordingListener()
+        Adapter(listener, array_frames=True).process_message(frame)
+        array_frame = listener.frame['array_frame']
+
+        assert isinstance(array_frame, ArrayFrame)
+        assert repr(array_frame.rigid_bodies()) == expected['bodies']
+        assert repr(array_frame.time_info) == expected['time_info']
+        assert repr([(ms.name, ms.type, [Position(*p) for p in ms.positions.tolist()])
+                     for ms in array_frame.marker_sets()]) == expected['marker_sets']
+        assert repr([Position(*p) for p in array_frame.unlabeled_markers.tolist()]) == expected['unlabeled_markers']
+        assert array_frame.bodies['tracking_valid'].all()
+
+
+def test_array_frame_marker_set_index():
+    listener = RecordingListener()
+    Adapter(listener, array_frames=True).process_message(SYNTHETIC_FRAME)
+    array_frame = listener.frame['array_frame']
+
+    assert array_frame.markers.shape == (6, 3)
+    assert array_frame.markers.dtype.name == 'float32'
+    assert array_frame.marker_set_positions('Ruby-1').tolist() == [[0.25, -0.5, 0.125], [0.5, -0.5, 0.125],
+                                                                   [0.375, -0.25, 0.125]]
+    assert array_frame.bodies['id'].tolist() == [101, 305]
+
+
+class BodiesListener(RecordingListener):
+    sections = frozenset([FrameSection.RigidBodies])
+
+
+def test_unsubscribed_sections_are_skipped():
+    skeleton_frame = build_frame(marker_sets={'Obstacle1': [(0.5, 1.0, 0.25)]},
+                                 bodies=[(101, (0.375, -0.5, 0.125), (1.0, 0.0, 0.0, 0.0))],
+                                 skeletons=[(1, [(1, (0.0, 0.0, 1.0), (1.0, 0.0, 0.0, 0.0))])],
+                                 labeled_markers=[(7, (0.5, 1.0, 0.25))],
+                                 force_plates=[(1, [[1, 2, 3]])])
+    for frame in (read_frame(), SYNTHETIC_FRAME, skeleton_frame):
+        listener = BodiesListener()
+        Adapter(listener).process_message(frame)
+        expected = decode(frame, offset_decoding=True)
+
+        assert set(listener.frame) == {'bodies', 'time_info'}
+        assert listener.frame['bodies'] == expected['bodies']
+        assert listener.frame['time_info'] == expected['time_info']
+
+
+def test_listeners_receive_their_sections_only():
+    listener = BodiesListener()
+    everything = RecordingListener()
+    adapter = Adapter(listener)
+    adapter.add_listener(everything)
+    adapter.process_message(SYNTHETIC_FRAME)
+
+    assert set(listener.frame) == {'bodies', 'time_info'}
+    assert everything.frame == decode(SYNTHETIC_FRAME, offset_decoding=False)
+
+
+if __name__ == '__main__':
+    test_offset_decoder_matches_protocol()
+    test_offset_decoder_accepts_buffers()
+    test_array_frame_matches_protocol()
+    test_array_frame_marker_set_index()
+    test_unsubscribed_sections_are_skipped()
+    test_listeners_receive_their_sections_only()
+
+    frame = read_frame()
+    for offset_decoding in (False, True):
+        adapter = Adapter(MotionListener(), offset_decoding=offset_decoding)
+        seconds = timeit.timeit(lambda: adapter.process_message(frame), number=10000)
+        print('offset_decoding={}: {:.1f} us/frame'.format(offset_decoding, seconds * 100))
+    bodies_only = MotionListener()
+    bodies_only.sections = frozenset([FrameSection.RigidBodies])
+    adapter = Adapter(bodies_only)
+    seconds = timeit.timeit(lambda: adapter.process_message(frame), number=10000)
+    print('rigid bodies only: {:.1f} us/frame'.format(seconds * 100))
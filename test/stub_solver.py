@@ -0,0 +1,51 @@
+"""
+A stand-in for the CBS solver, for testing the planner without it.
+Accepts the same arguments as CBS and writes a paths file in its format, where every agent moves along
+its row and then along its column to the goal (the paths may collide, they are not a real MAPF solution).
+"""
+import argparse
+import time
+
+
+def straight_path(start, goal):
+    path = [start]
+    row, col = start
+    while row != goal[0]:
+        row += 1 if goal[0] > row else -1
+        path.append((row, col))
+    while col != goal[1]:
+        col += 1 if goal[1] > col else -1
+        path.append((row, col))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--map')
+    parser.add_argument('-a', '--agents')
+    parser.add_argument('-o', '--output')
+    parser.add_argument('--outputPaths')
+    parser.add_argument('-k', '--agentNum', type=int)
+    parser.add_argument('-t', '--cutoffTime', type=float)
+    parser.add_argument('--sleep', type=float, default=0, help='seconds to wait before solving')
+    parser.add_argument('--fail', action='store_true', help='exit with an error instead of solving')
+    args = parser.parse_args()
+
+    print('stub solver started', flush=True)
+    time.sleep(args.sleep)
+    if args.fail:
+        raise SystemExit('stub solver failed')
+
+    with open(args.agents) as scen_file:
+        lines = [line.split('\t') for line in scen_file if not line.startswith('version')]
+    with open(args.outputPaths, 'w') as paths_file:
+        for agent, data in enumerate(lines[:args.agentNum]):
+            start = (int(data[5]), int(data[4]))
+            goal = (int(data[7]), int(data[6]))
+            paths_file.write('Agent {}: {}\n'.format(agent, ''.join('({},{})->'.format(*loc)
+                                                                   for loc in straight_path(start, goal))))
+    print('stub solver finished', flush=True)
+
+
+if __name__ == '__main__':
+    main()
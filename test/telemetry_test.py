@@ -0,0 +1,136 @@
+import json
+import os
+import timeit
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from close_loop_client.udp_client import decode_binary, decode_message, RobotsState
+from natnet.arrays import BODY_DTYPE
+from natnet.protocol import RigidBody, Position
+from src import mockup
+from src.telemetry import encode_binary, DeltaEncoder
+
+
+def json_message(snapshot):
+    """
+    Reference: the json message of main.get_message_to_send
+    """
+    bodies = []
+    for body in sorted(snapshot.bodies, key=lambda body: int(body.body_id)):
+        if int(body.body_id) // 100 != 1:
+            continue
+        body_dict = body.to_dict()
+        rotation, position = body_dict['rotation'], body_dict['position']
+        rotation['x'], rotation['w'], rotation['z'], rotation['y'] = \
+            rotation['w'], rotation['z'], rotation['y'], rotation['x']
+        position['x'], position['y'] = -position['y'], position['x']
+        bodies.append(body_dict)
+    return json.dumps(bodies)
+
+
+def assert_same_bodies(bodies, expected):
+    assert [body['body_id'] for body in bodies] == [body['body_id'] for body in expected]
+    for body, expected_body in zip(bodies, expected):
+        for key in ('position', 'rotation'):
+            for axis, value in expected_body[key].items():
+                assert abs(body[key][axis] - value) < 1e-6
+
+
+def test_binary_message_matches_json():
+    snapshot = mockup.simple_listener_mock.snapshots.get()[1]._replace(frame_number=42, timestamp=12.5)
+    message = decode_binary(encode_binary(snapshot))
+    assert (message['sequence'], message['frame_number'], message['timestamp'], message['keyframe']) == \
+        (None, 42, 12.5, True)
+    expected = json.loads(json_message(snapshot))
+    assert len(expected) > 0
+    assert_same_bodies(message['bodies'], expected)
+
+    # both formats are decoded by the client
+    assert decode_message(json_message(snapshot).encode()) == {'sequence': None, 'keyframe': True, 'bodies': expected}
+
+
+def test_binary_message_from_array_frame():
+    snapshot = mockup.simple_listener_mock.snapshots.get()[1]
+    records = np.zeros(len(snapshot.bodies), dtype=BODY_DTYPE)
+    for record, body in zip(records, snapshot.bodies):
+        record['id'] = body.body_id
+        record['pos'] = (body.position.x, body.position.y, body.position.z)
+        record['quat'] = (body.rotation.w, body.rotation.x, body.rotation.y, body.rotation.z)
+    assert encode_binary(snapshot._replace(body_records=records)) == encode_binary(snapshot)
+
+
+def moved(snapshot, body_id, dx):
+    bodies = [body if body.body_id != body_id else
+              RigidBody(body_id, Position(body.position.x + dx, body.position.y, body.position.z), body.rotation)
+              for body in snapshot.bodies]
+    return snapshot._replace(bodies=bodies)
+
+
+def received(message):
+    """
+    Returns a message of the server as decoded by the client (json messages are sent encoded as bytes)
+    """
+    return decode_message(message if isinstance(message, bytes) else message.encode())
+
+
+def test_delta_messages():
+    snapshot = mockup.simple_listener_mock.snapshots.get()[1]
+    expected = json.loads(json_message(snapshot))
+    robot_ids = [body['body_id'] for body in expected]
+    assert len(robot_ids) > 1
+
+    for binary in (False, True):
+        encoder = DeltaEncoder(binary=binary, keyframe_interval=4, position_threshold=0.01)
+        state = RobotsState()
+        messages = [received(encoder.encode(snapshot))]
+        # a robot that moved less than the threshold is not sent
+        snapshot2 = moved(moved(snapshot, robot_ids[0], 0.1), robot_ids[1], 0.001)
+        messages.append(received(encoder.encode(snapshot2)))
+        messages.append(received(encoder.encode(snapshot2)))
+        assert [(message['sequence'], message['keyframe']) for message in messages] == \
+            [(1, True), (2, False), (3, False)]
+        assert [[body['body_id'] for body in message['bodies']] for message in messages] == \
+            [robot_ids, [robot_ids[0]], []]
+        for message in messages:
+            assert state.apply(message)
+        assert_same_bodies(state.get_bodies(), json.loads(json_message(moved(snapshot, robot_ids[0], 0.1))))
+        assert not state.needs_keyframe
+
+        # a keyframe every 4 messages
+        messages = [received(encoder.encode(snapshot2)) for i in range(2)]
+        assert [(message['sequence'], message['keyframe'], len(message['bodies'])) for message in messages] == \
+            [(4, False, 0), (5, True, len(robot_ids))]
+        for message in messages:
+            state.apply(message)
+
+        # the client detects a lost message, and gets a keyframe on request
+        encoder.encode(snapshot)
+        message = received(encoder.encode(snapshot))
+        assert (message['sequence'], message['keyframe'], message['bodies']) == (7, False, [])
+        assert state.apply(message) and state.needs_keyframe and state.lost == 1
+        assert not state.apply(messages[-1])  # older than the last message
+        encoder.request_keyframe()
+        message = received(encoder.encode(snapshot))
+        assert (message['sequence'], message['keyframe']) == (8, True)
+        state.apply(message)
+        assert not state.needs_keyframe
+        assert_same_bodies(state.get_bodies(), expected)
+
+
+if __name__ == '__main__':
+    test_binary_message_matches_json()
+    test_binary_message_from_array_frame()
+    test_delta_messages()
+
+    snapshot = mockup.simple_listener_mock.snapshots.get()[1]
+    print('json: {} bytes, {:.1f} us'.format(len(json_message(snapshot)),
+                                            timeit.timeit(lambda: json_message(snapshot), number=1000) * 1000))
+    print('binary: {} bytes, {:.1f} us'.format(len(encode_binary(snapshot)),
+                                              timeit.timeit(lambda: encode_binary(snapshot), number=1000) * 1000))
+    encoder = DeltaEncoder(binary=True, keyframe_interval=1000)
+    encoder.encode(snapshot)
+    print('binary delta of still robots: {} bytes, {:.1f} us'.format(
+        len(encoder.encode(snapshot)), timeit.timeit(lambda: encoder.encode(snapshot), number=1000) * 1000))
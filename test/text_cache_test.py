@@ -0,0 +1,47 @@
+import os
+import timeit
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pygame
+
+from src.globals import BLACK, GRAY
+from src.text_cache import TextCache
+
+
+def test_text_is_rendered_once():
+    pygame.font.init()
+    cache = TextCache()
+    surface = cache.render('12', 'Comic Sans MS', 10, BLACK)
+
+    assert cache.render('12', 'Comic Sans MS', 10, list(BLACK)) is surface
+    assert cache.render('12', 'Comic Sans MS', 10, GRAY) is not surface
+    assert cache.render('12', 'Comic Sans MS', 10, BLACK, bold=True) is not surface
+    assert len(cache.surfaces) == 3
+    assert len(cache.fonts) == 2
+    assert pygame.image.tobytes(surface, 'RGBA') == pygame.image.tobytes(
+        pygame.font.SysFont('Comic Sans MS', 10).render('12', True, BLACK), 'RGBA')
+
+
+def test_least_recently_used_text_is_evicted():
+    pygame.font.init()
+    cache = TextCache(max_size=2)
+    first = cache.render('1', 'Arial', 12, BLACK)
+    cache.render('2', 'Arial', 12, BLACK)
+    assert cache.render('1', 'Arial', 12, BLACK) is first
+
+    cache.render('3', 'Arial', 12, BLACK)
+    assert [key[3] for key in cache.surfaces] == ['1', '3']
+    assert cache.render('1', 'Arial', 12, BLACK) is first
+
+
+if __name__ == '__main__':
+    test_text_is_rendered_once()
+    test_least_recently_used_text_is_evicted()
+
+    cache = TextCache()
+    seconds = timeit.timeit(lambda: pygame.font.SysFont('Comic Sans MS', 10).render('12', True, BLACK), number=1000)
+    print('SysFont and render: {:.1f} us'.format(seconds * 1000))
+    seconds = timeit.timeit(lambda: cache.render('12', 'Comic Sans MS', 10, BLACK), number=1000)
+    print('cached render: {:.1f} us'.format(seconds * 1000))
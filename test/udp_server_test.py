@@ -0,0 +1,117 @@
+import itertools
+import json
+import os
+import time
+from threading import Thread
+
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from close_loop_client.udp_client import receive_messages, decode_message, RobotsState
+from src import mockup
+from src.telemetry import DeltaEncoder
+from src.udp_server import UDPServer
+from net_helpers import wait_for, make_socket
+
+
+def test_server_pushes_to_all_subscribers():
+    server = UDPServer(local_ip='127.0.0.1', port=0, subscriber_timeout=0.5)
+    server.start()
+    try:
+        clients = [make_socket() for i in range(2)]
+        for client in clients:
+            client.sendto(b'Hello UDP Server', server.get_address())
+        assert wait_for(lambda: len(server.subscribers) == 2)
+
+        server.update_data('[1]')
+        server.send_data()
+        server.update_data(b'\x00\x01')
+        server.send_data()
+        for client in clients:
+            assert client.recv(1024) == b'[1]'
+            assert client.recv(1024) == b'\x00\x01'
+        assert [(stats.messages_sent, stats.bytes_sent) for stats in server.stats()] == [(2, 5), (2, 5)]
+
+        # the first client unsubscribes, the second one expires without heartbeats
+        clients[0].sendto(b'bye', server.get_address())
+        assert wait_for(lambda: clients[0].getsockname() not in server.subscribers)
+        assert clients[1].getsockname() in server.subscribers
+        assert wait_for(lambda: not server.subscribers)
+    finally:
+        server.stop()
+
+
+def test_client_stays_subscribed_with_heartbeats():
+    server = UDPServer(local_ip='127.0.0.1', port=0, subscriber_timeout=0.5)
+    server.start()
+    try:
+        received = []
+        messages = receive_messages(make_socket(), server.get_address(), heartbeat_interval=0.1)
+        Thread(target=lambda: received.extend(itertools.islice(messages, 8)), daemon=True).start()
+        for i in range(8):
+            # the client keeps its subscription much longer than the subscriber timeout
+            assert wait_for(lambda: len(received) == i and server.subscribers)
+            server.update_data(json.dumps([{'body_id': i}]))
+            server.send_data()
+            time.sleep(0.15)
+        assert wait_for(lambda: received == [[{'body_id': i}] for i in range(8)])
+        messages.close()
+        assert wait_for(lambda: not server.subscribers, timeout=0.3)  # unsubscribed before it would expire
+    finally:
+        server.stop()
+
+
+def test_send_latest_data_only():
+    server = UDPServer(local_ip='127.0.0.1', port=0, history_size=2, quiet=True)
+    server.start()
+    try:
+        assert not server.send_data()  # returns at once when there is nothing to send
+        client = make_socket()
+        client.sendto(b'Hello UDP Server', server.get_address())
+        assert wait_for(lambda: server.subscribers)
+        for i in range(3):
+            server.update_data(f'[{i}]')
+        assert server.send_data()
+        assert not server.send_data()  # the same data is not sent again
+        assert client.recv(1024) == b'[2]'
+        assert (server.sent_generation, server.messages_dropped) == (3, 2)
+
+        # a late joiner gets the latest messages at once
+        late_client = make_socket()
+        late_client.sendto(b'Hello UDP Server', server.get_address())
+        assert [late_client.recv(1024) for i in range(2)] == [b'[1]', b'[2]']
+    finally:
+        server.stop()
+
+
+def test_subscribers_get_keyframes():
+    encoder = DeltaEncoder()
+    server = UDPServer(local_ip='127.0.0.1', port=0, on_keyframe_request=encoder.request_keyframe)
+    server.start()
+    try:
+        snapshot = mockup.simple_listener_mock.snapshots.get()[1]
+        client = make_socket()
+        client.sendto(b'Hello UDP Server', server.get_address())
+        assert wait_for(lambda: server.subscribers)
+        for i in range(3):
+            server.update_data(encoder.encode(snapshot))
+            server.send_data()
+        state = RobotsState()
+        for i in range(3):
+            state.apply(decode_message(client.recv(32768)))
+        assert state.sequence == 3 and not state.needs_keyframe and len(state.get_bodies()) > 0
+        # the robots did not move, so the client gets empty deltas until it requests a keyframe
+        client.sendto(b'keyframe', server.get_address())
+        assert wait_for(lambda: encoder.keyframe_requested)
+        server.update_data(encoder.encode(snapshot))
+        server.send_data()
+        assert decode_message(client.recv(32768))['keyframe']
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    test_server_pushes_to_all_subscribers()
+    test_client_stays_subscribed_with_heartbeats()
+    test_send_latest_data_only()
+    test_subscribers_get_keyframes()